@@ -1,318 +1,144 @@
-import streamlit as st
-import sqlite3
-import pandas as pd
-import folium
-from folium.plugins import MarkerCluster
-import datetime
+import logging
 import os
-import html
-import sys
-from typing import Optional
-from passlib.hash import pbkdf2_sha256
+import streamlit as st
 import streamlit.components.v1 as components
-
-# --- CONFIG ---
-DB_NAME = "home_care_v21.db"
+from config import INTERVENTION_MAPPING, ALL_QUALIFICATIONS, CITY_COORDS
+import db
+from db import data_versions
+import hashing
+import resources
+from writer import writer
+from backend import (
+    conn_fetch_user_by_username, list_users, debug_show_hash, authenticate, register_user,
+    list_patient_history, list_open_jobs, list_my_jobs, submit_request, LIST_PAGE_SIZE,
+    accept_request, get_active_chats, get_chat_tail, get_chat_before, get_chat_since, send_chat_msg, get_ai_rec,
+    search_requests, search_messages,
+    update_full_profile, CHAT_PAGE_SIZE,
+)
+import maps
+import metrics
+import stats
+from rows import Rows
 
 # --- NOTE ---
 # Non cancelliamo più il DB automaticamente all'avvio per evitare perdita dati.
 # Usa il pulsante "RESET DB" nella sidebar se vuoi ripristinare il DB demo.
-
-# --- AI (opzionale) ---
-AI_AVAILABLE = False
-model = None
-try:
-    from sentence_transformers import SentenceTransformer, util
-    import torch
-    model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-    AI_AVAILABLE = True
-    print("AI caricata.")
-except Exception:
-    AI_AVAILABLE = False
-
-# --- COSTANTI E DATI ---
-INTERVENTION_MAPPING = {
-    "Assistenza Infermieristica": ["Infermiere"],
-    "Riabilitazione Motoria / Fisioterapia": ["Fisioterapista"],
-    "Igiene e Cura Personale": ["OSS", "Badante"],
-    "Supporto Notturno": ["OSS", "Badante"],
-    "Preparazione Pasti e Spesa": ["Badante", "OSA"],
-    "Visita Medica": ["Medico"],
-    "Supporto Psicologico": ["Psicologo"]
-}
-
-KNOWLEDGE_BASE = list(INTERVENTION_MAPPING.keys())
-ALL_QUALIFICATIONS = list(set([q for sublist in INTERVENTION_MAPPING.values() for q in sublist]))
-
-CITY_COORDS = {
-    "Milano": (45.4642, 9.1900), "Roma": (41.9028, 12.4964), "Napoli": (40.8518, 14.2681),
-    "Torino": (45.0703, 7.6869), "Firenze": (43.7696, 11.2558), "Bologna": (44.4949, 11.3426),
-    "Palermo": (38.1157, 13.3615), "Bari": (41.1171, 16.8719)
-}
-
-# --- DATABASE SETUP ---
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  username TEXT UNIQUE, password TEXT, role TEXT, city TEXT,
-                  lat REAL, lon REAL, bio TEXT, qualification TEXT,
-                  experience INTEGER, hourly_rate REAL,
-                  email TEXT, address TEXT, age INTEGER,
-                  clinical_history TEXT, detailed_experience TEXT)''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS requests
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  patient_id INTEGER,
-                  professional_id INTEGER,
-                  target_pro_id INTEGER,
-                  intervention_type TEXT,
-                  description TEXT,
-                  city TEXT,
-                  status TEXT,
-                  created_at TEXT,
-                  FOREIGN KEY(patient_id) REFERENCES users(id))''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS messages
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  request_id INTEGER,
-                  sender_id INTEGER,
-                  content TEXT,
-                  timestamp TEXT,
-                  FOREIGN KEY(request_id) REFERENCES requests(id))''')
-    conn.commit()
-    conn.close()
-
-def seed_data():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    count = c.execute("SELECT count(*) FROM users").fetchone()[0]
-    if count == 0:
-        # Demo users with hashed password "pass"
-        hashed_pass = pbkdf2_sha256.hash("pass")
-        users = [
-            ("mario_rossi", hashed_pass, "paziente", "Milano", 45.4642, 9.1900, "Paziente Demo", None, 0, 0, "mario@email.it", "Via Roma 1", 80, "Diabete", None),
-            ("luigi_verdi", hashed_pass, "professionista", "Milano", 45.4680, 9.2000, "Infermiere Pro", "Infermiere", 10, 25.0, "luigi@nurse.it", "Via Milano 20", 40, None, "Exp 10 anni")
-        ]
-        c.executemany("INSERT INTO users VALUES (NULL,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", users)
-        conn.commit()
-    conn.close()
-
-# Initialize DB and seed if needed
-init_db()
-seed_data()
-
-# --- DB UTILITIES ---
-def conn_fetch_user_by_username(username: str):
-    conn = sqlite3.connect(DB_NAME)
-    u = conn.execute("SELECT * FROM users WHERE LOWER(username)=?", (username.lower(),)).fetchone()
-    conn.close()
-    return u
-
-def list_users():
-    conn = sqlite3.connect(DB_NAME)
-    rows = conn.execute("SELECT id, username, role, city FROM users").fetchall()
-    conn.close()
-    return rows
-
-def debug_show_hash(username: str):
-    u = conn_fetch_user_by_username(username)
-    if not u:
-        return f"Utente '{username}' non trovato"
-    return f"id={u[0]}, username={u[1]}, stored_hash_present={bool(u[2])}\nhash={u[2]!s}"
-
-# --- BACKEND LOGIC ---
-def authenticate(usr, pwd):
-    if not usr or not pwd:
-        print("DEBUG: username o password vuoti", file=sys.stderr)
-        return None
-
-    uname = usr.strip()
-    p = pwd.strip()
-    conn = sqlite3.connect(DB_NAME)
-    try:
-        u = conn.execute("SELECT * FROM users WHERE LOWER(username)=?", (uname.lower(),)).fetchone()
-    finally:
-        conn.close()
-
-    if not u:
-        print(f"DEBUG: utente '{uname}' non trovato (case-insensitive search)", file=sys.stderr)
-        return None
-
-    stored_hash = u[2] if len(u) > 2 else None
-    print(f"DEBUG: trovato utente id={u[0]} username={u[1]} stored_hash_present={bool(stored_hash)}", file=sys.stderr)
-
-    if not stored_hash:
-        print("DEBUG: stored_hash è vuoto/None", file=sys.stderr)
-        return None
-
-    try:
-        verified = pbkdf2_sha256.verify(p, stored_hash)
-        print(f"DEBUG: pbkdf2_sha256.verify -> {verified}", file=sys.stderr)
-        if verified:
-            return u
-        else:
-            return None
-    except Exception as ex:
-        print(f"DEBUG: eccezione verify: {ex}", file=sys.stderr)
-        return None
-
-def register_user(u, p, r, c_city, b, q, e, rate):
-    if not u or not p:
-        return False, "Username e password richiesti."
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        coords = CITY_COORDS.get(c_city, (0,0))
-        if r == 'paziente':
-            q, e, rate = None, 0, 0
-        hashed = pbkdf2_sha256.hash(p)
-        sql = """INSERT INTO users
-                 (username, password, role, city, lat, lon, bio, qualification, experience, hourly_rate, email, address, age, clinical_history, detailed_experience)
-                 VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
-        conn.execute(sql, (u, hashed, r, c_city, coords[0], coords[1], b, q, e, rate, None, None, None, None, None))
-        conn.commit()
-        conn.close()
-        return True, "✅ Registrazione OK! Effettua il login."
-    except sqlite3.IntegrityError:
-        return False, "❌ Errore: Username già in uso."
-    except Exception as ex:
-        print("ERRORE REGISTRAZIONE:", ex, file=sys.stderr)
-        return False, f"❌ Errore tecnico: {ex}"
-
-# Core functions (requests, chats, etc.)
-def get_landing_pros():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.execute("SELECT username, city, bio, lat, lon, qualification, experience, hourly_rate FROM users WHERE role='professionista'")
-    pros = c.fetchall()
-    conn.close()
-    return pros
-
-def get_patient_history(uid):
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("SELECT id, intervention_type as 'Tipo', status, created_at FROM requests WHERE patient_id=? ORDER BY id DESC", conn, params=(uid,))
-    conn.close()
-    return df
-
-def get_pro_open_jobs(city, my_id):
-    conn = sqlite3.connect(DB_NAME)
-    query = """
-    SELECT r.id as ID, CASE WHEN r.target_pro_id = ? THEN '⭐ ESCLUSIVA' ELSE 'Pubblica' END as Tipo,
-           u.username as Paziente, r.intervention_type, r.description, r.city
-    FROM requests r JOIN users u ON r.patient_id = u.id
-    WHERE r.status='Aperta' AND ((r.city=? AND r.target_pro_id IS NULL) OR r.target_pro_id=?)
-    ORDER BY r.target_pro_id DESC, r.id DESC
-    """
-    df = pd.read_sql_query(query, conn, params=(my_id, city, my_id))
-    conn.close()
-    return df
-
-def get_pro_my_jobs(pro_id):
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("SELECT r.id, u.username as Paziente, r.intervention_type, r.status FROM requests r JOIN users u ON r.patient_id = u.id WHERE r.professional_id=?", conn, params=(pro_id,))
-    conn.close()
-    return df
-
-def submit_request(uid, cat, desc, city, target_id):
-    conn = sqlite3.connect(DB_NAME)
-    tgt = int(target_id) if (target_id and str(target_id).isdigit() and int(target_id) > 0) else None
-    conn.execute("INSERT INTO requests (patient_id, professional_id, target_pro_id, intervention_type, description, city, status, created_at) VALUES (?, NULL, ?, ?, ?, ?, 'Aperta', ?)",
-                 (uid, tgt, cat, desc, city, str(datetime.date.today())))
-    conn.commit()
-    conn.close()
-    return get_patient_history(uid)
-
-def accept_request(req_id, pro_id, city):
-    if not req_id:
-        return False, "⚠️ ID nullo", pd.DataFrame(), pd.DataFrame()
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    check = c.execute("SELECT id FROM requests WHERE id=? AND status='Aperta' AND ((city=? AND target_pro_id IS NULL) OR target_pro_id=?)", (req_id, city, pro_id)).fetchone()
-    if not check:
-        conn.close()
-        return False, "❌ Errore: richiesta non disponibile.", get_pro_open_jobs(city, pro_id), get_pro_my_jobs(pro_id)
-    c.execute("UPDATE requests SET status='In Carico', professional_id=? WHERE id=?", (pro_id, req_id))
-    conn.commit()
-    conn.close()
-    return True, f"✅ Presa in carico ID {req_id}", get_pro_open_jobs(city, pro_id), get_pro_my_jobs(pro_id)
-
-def get_active_chats(user_id, role):
-    conn = sqlite3.connect(DB_NAME)
-    if role == 'paziente':
-        q = "SELECT id, intervention_type || ' (ID: ' || id || ')' as label FROM requests WHERE patient_id=? AND status='In Carico'"
-        data = pd.read_sql_query(q, conn, params=(user_id,))
-    else:
-        q = "SELECT id, intervention_type || ' (ID: ' || id || ')' as label FROM requests WHERE professional_id=? AND status='In Carico'"
-        data = pd.read_sql_query(q, conn, params=(user_id,))
-    conn.close()
-    return list(zip(data['label'], data['id'])) if not data.empty else []
-
-def get_chat_history(req_id):
-    if not req_id:
-        return []
-    conn = sqlite3.connect(DB_NAME)
-    msgs = conn.execute("SELECT sender_id, content FROM messages WHERE request_id=? ORDER BY id ASC", (req_id,)).fetchall()
-    conn.close()
-    return msgs
-
-def send_chat_msg(req_id, user_id, msg):
-    if not req_id or not msg:
-        return get_chat_history(req_id)
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("INSERT INTO messages (request_id, sender_id, content, timestamp) VALUES (?, ?, ?, ?)", (req_id, user_id, msg, str(datetime.datetime.now())))
-    conn.commit()
-    conn.close()
-    return get_chat_history(req_id)
-
-def get_ai_rec(text, city):
-    if not AI_AVAILABLE:
-        return "AI non disponibile", "", pd.DataFrame(), None
-    emb = model.encode(text, convert_to_tensor=True)
-    kb = model.encode(KNOWLEDGE_BASE, convert_to_tensor=True)
-    best = KNOWLEDGE_BASE[torch.argmax(util.cos_sim(emb, kb)[0]).item()]
-    quals = INTERVENTION_MAPPING[best]
-    conn = sqlite3.connect(DB_NAME)
-    ph = ','.join('?'*len(quals))
-    df = pd.read_sql_query(f"SELECT id as ID, username, qualification, hourly_rate FROM users WHERE role='professionista' AND city=? AND qualification IN ({ph})", conn, params=[city]+quals)
-    conn.close()
-    return f"✅ Bisogno: {best}", "OK", df, best
-
-def create_map_html(pros):
-    m = folium.Map([42, 12.5], zoom_start=6)
-    mc = MarkerCluster().add_to(m)
-    for p in pros:
-        try:
-            folium.Marker([p[3], p[4]], popup=f"{html.escape(p[0])} ({html.escape(str(p[5]) if p[5] else '')})").add_to(mc)
-        except Exception:
-            pass
-    return m._repr_html_()
-
-def update_full_profile(uid, role, pwd, bio, email, address, age, clinical, det_exp, qual=None, num_exp=None, rate=None):
-    conn = sqlite3.connect(DB_NAME)
-    try:
-        pwd_hashed = pbkdf2_sha256.hash(pwd) if pwd else None
-        if role == 'paziente':
-            if pwd_hashed:
-                conn.execute("UPDATE users SET password=?, bio=?, email=?, address=?, age=?, clinical_history=? WHERE id=?", (pwd_hashed, bio, email, address, age, clinical, uid))
-            else:
-                conn.execute("UPDATE users SET bio=?, email=?, address=?, age=?, clinical_history=? WHERE id=?", (bio, email, address, age, clinical, uid))
-        else:
-            if pwd_hashed:
-                conn.execute("UPDATE users SET password=?, bio=?, email=?, address=?, age=?, detailed_experience=?, qualification=?, experience=?, hourly_rate=? WHERE id=?", (pwd_hashed, bio, email, address, age, det_exp, qual, num_exp, rate, uid))
-            else:
-                conn.execute("UPDATE users SET bio=?, email=?, address=?, age=?, detailed_experience=?, qualification=?, experience=?, hourly_rate=? WHERE id=?", (bio, email, address, age, det_exp, qual, num_exp, rate, uid))
-        conn.commit()
-        return True, "✅ Profilo salvato!"
-    except Exception as e:
-        print(f"ERRORE update_full_profile: {e}", file=sys.stderr)
-        return False, f"❌ Errore: {e}"
-    finally:
-        conn.close()
+# Modello AI e schema DB sono gestiti da resources.py: caricati una volta per processo
+# server e condivisi tra sessioni e rerun (il modello solo alla prima analisi AI).
+# La logica dati è in backend.py, le connessioni SQLite (pool + PRAGMA) in db.py.
+logging.basicConfig(level=os.environ.get("CARECONNECT_LOG_LEVEL", "WARNING"))
+resources.bootstrap_db()
 
 # --- STREAMLIT UI ---
 st.set_page_config(page_title="CareConnect - Streamlit", layout="wide")
 st.title("🏥 CareConnect (Streamlit)")
 
+# --- CHAT (cache per sessione) ---
+# In st.session_state['chat_cache'] teniamo, per ogni richiesta, la finestra di
+# messaggi già scaricata: ad ogni rerun si chiede al DB solo il delta (id > ultimo).
+def chat_window(req_id, version=None):
+    # version: contatore messages:<id>; se non è cambiato non serve nemmeno il delta
+    cache = st.session_state.setdefault('chat_cache', {})
+    entry = cache.get(req_id)
+    if entry is None:
+        msgs = get_chat_tail(req_id)
+        entry = {'msgs': msgs, 'has_more': len(msgs) == CHAT_PAGE_SIZE, 'version': version}
+        cache[req_id] = entry
+    elif version is None or entry['version'] != version:
+        last_id = entry['msgs'][-1][0] if entry['msgs'] else 0
+        entry['msgs'].extend(get_chat_since(req_id, last_id))
+        entry['version'] = version
+    return entry
+
+def load_older_messages(req_id):
+    entry = chat_window(req_id)
+    first_id = entry['msgs'][0][0] if entry['msgs'] else None
+    if first_id is None:
+        entry['has_more'] = False
+        return
+    older = get_chat_before(req_id, first_id)
+    entry['msgs'][:0] = older
+    entry['has_more'] = len(older) == CHAT_PAGE_SIZE
+
+def render_chat(req_id, uid, key):
+    entry = chat_window(req_id, watch_version(f"messages:{req_id}"))
+    if entry['has_more'] and st.button("Carica messaggi precedenti", key=f"{key}_older"):
+        load_older_messages(req_id)
+    for _, sender_id, content in entry['msgs']:
+        if sender_id == uid:
+            st.chat_message("user").write(content)
+        else:
+            st.chat_message("assistant").write(content)
+
+# --- AGGIORNAMENTO AUTOMATICO ---
+# I listing dichiarano i contatori data_versions da cui dipendono (watch_version);
+# un fragment interroga solo quei contatori ogni LIVE_REFRESH_S secondi e, se uno
+# è cambiato, rilancia lo script: si ricaricano solo i listing con versione nuova.
+LIVE_REFRESH_S = 5
+
+def watch_version(name):
+    v = data_versions([name])[name]
+    st.session_state.setdefault('live_seen', {})[name] = v
+    return v
+
+@st.fragment(run_every=LIVE_REFRESH_S)
+def live_watch():
+    seen = st.session_state.get('live_seen') or {}
+    current = data_versions(list(seen))
+    if st.session_state.pop('live_full_run', False):
+        # esecuzione dentro il run completo: la baseline include le azioni appena fatte
+        st.session_state['live_seen'] = current
+        return
+    if current != seen:
+        st.rerun(scope="app")
+
+# --- PAGINAZIONE ---
+# Per ogni tabella paginata teniamo in sessione lo stack dei cursori keyset e la pagina
+# corrente; un cambio di filtri (sig) riparte dalla prima pagina.
+def pager(key, sig, fetch, refresh=False, version=None):
+    # version: contatore dei dati sottostanti, la pagina si ricarica solo se è cambiato
+    state = st.session_state.get(f'pager_{key}')
+    if state is None or state['sig'] != sig:
+        state = {'sig': sig, 'stack': [None], 'page': None, 'version': None}
+        st.session_state[f'pager_{key}'] = state
+    if refresh or state['page'] is None or state['version'] != version:
+        state['page'] = fetch(state['stack'][-1])
+        state['version'] = version
+    return state
+
+def pager_nav(key, state):
+    _, next_cursor = state['page']
+    c1, c2 = st.columns(2)
+    if len(state['stack']) > 1 and c1.button("◀ Pagina precedente", key=f"{key}_prev"):
+        state['stack'].pop()
+        state['page'] = None
+        st.rerun()
+    if next_cursor is not None and c2.button("Pagina successiva ▶", key=f"{key}_next"):
+        state['stack'].append(next_cursor)
+        state['page'] = None
+        st.rerun()
+
+def metrics_rows(table, key_col, limit=None):
+    # serie di metrics.snapshot() ordinate per tempo totale
+    items = sorted(table.items(), key=lambda kv: kv[1]["total_ms"], reverse=True)[:limit]
+    cols = list(items[0][1]) if items else []
+    return Rows([key_col] + cols, [(k,) + tuple(v[c] for c in cols) for k, v in items])
+
+def render_search(uid, role, key):
+    # ricerca full-text nelle richieste e nelle chat del solo utente corrente
+    q = st.text_input("Cerca (es. diabete, insulina)", key=f"{key}_q")
+    where = st.radio("In", ("Richieste", "Chat"), horizontal=True, key=f"{key}_in")
+    if not q.strip():
+        return
+    fetch = search_requests if where == "Richieste" else search_messages
+    res = pager(key, (q, where), lambda cur: fetch(q, uid, role, cur))
+    rows = res['page'][0]
+    if rows.empty:
+        st.info("Nessun risultato.")
+        return
+    st.dataframe(rows.without("score").to_df())
+    pager_nav(key, res)
+
 # Session defaults
 if 'user' not in st.session_state:
     st.session_state['user'] = None
@@ -337,7 +163,7 @@ with st.sidebar:
                 st.session_state['page'] = "Dashboard"  # go to dashboard after login
                 st.success(f"Benvenuto {user[1]}!")
             else:
-                st.error("Credenziali non valide. Controlla la console (terminale) per log di debug.")
+                st.error("Credenziali non valide. Per i log di debug avvia con CARECONNECT_LOG_LEVEL=DEBUG.")
         st.markdown("---")
         st.subheader("Registrazione")
         reg_u = st.text_input("Nuovo username", key="reg_u")
@@ -365,41 +191,97 @@ with st.sidebar:
             st.session_state['page'] = "Home"
             st.success("Sei stato disconnesso.")
 
-    # Debug tools (developer only)
+    # Stato risorse (health/ready): la Home non attende il caricamento del modello
     st.markdown("---")
-    st.subheader("Debug & DB management (dev only)")
-    if st.button("Lista utenti (debug)"):
-        rows = list_users()
-        if rows:
-            st.table(pd.DataFrame(rows, columns=["id", "username", "role", "city"]))
+    res = resources.status()
+    st.caption(f"DB: {'pronto' if res['db_ready'] else 'non inizializzato'} — "
+               f"AI: {res['model_status'] if res['ai_installed'] else 'non installata'}")
+    hs = hashing.pool.stats()
+    st.caption(f"Hash: {hs['workers']} worker, coda {hs['pending']} (max {hs['max_pending']})"
+               + (f" — login p50 {hs['verify_p50_ms']} ms, p95 {hs['verify_p95_ms']} ms" if 'verify_p50_ms' in hs else ""))
+    ws = writer.stats()
+    if ws["batches"]:
+        st.caption(f"Scritture: {ws['writes']} in {ws['batches']} commit (media {ws['avg_batch']}/commit)"
+                   + (f" — p95 {ws['p95_ms']} ms" if 'p95_ms' in ws else ""))
+
+    # Pannello admin: metriche di funzioni e query (metrics.py) e strumenti DB
+    st.markdown("---")
+    st.subheader("🛠️ Admin & prestazioni")
+    # impostazioni di processo: applicate solo quando l'admin cambia il valore (on_change)
+    st.toggle("Raccogli metriche", value=metrics.enabled, key="adm_metrics",
+              on_change=lambda: metrics.configure(enable=st.session_state["adm_metrics"]))
+    st.number_input("Log query lente oltre (ms, 0 = spento)", min_value=0.0, value=float(metrics.slow_query_ms or 0),
+                    step=10.0, key="adm_slow", on_change=lambda: metrics.configure(slow_ms=st.session_state["adm_slow"]))
+    snap = metrics.snapshot()
+    with st.expander("Funzioni", expanded=False):
+        if snap["functions"]:
+            st.dataframe(metrics_rows(snap["functions"], "funzione").to_df())
         else:
-            st.write("Nessun utente.")
-    dbg_user = st.text_input("Mostra hash per username (debug)", key="dbg_user")
-    if st.button("Mostra hash", key="dbg_btn"):
-        st.text_area("Hash utente", value=debug_show_hash(dbg_user), height=140)
-
-    st.markdown("### RESET DB (usare con cautela)")
-    if st.button("RESET DB (elimina e ricrea DB con demo)"):
-        try:
-            if os.path.exists(DB_NAME):
-                os.remove(DB_NAME)
-            init_db()
-            seed_data()
-            st.session_state['user'] = None
-            st.session_state['page'] = "Home"
-            st.success("DB resettato e dati demo inseriti.")
-        except Exception as e:
-            st.error(f"Errore reset DB: {e}")
+            st.caption("Nessun dato (attiva la raccolta).")
+    with st.expander("Query SQL", expanded=False):
+        if snap["queries"]:
+            st.dataframe(metrics_rows(snap["queries"], "query", 30).to_df())
+        else:
+            st.caption("Nessun dato (attiva la raccolta).")
+    with st.expander(f"Query lente ({len(snap['slow_queries'])})", expanded=False):
+        for q in reversed(snap["slow_queries"][-20:]):
+            st.markdown(f"**{q['ms']} ms** — `{q['function'] or '-'}` — {q['at']}")
+            st.code(q["sql"] + ("\n-- " + "\n-- ".join(q["plan"]) if q["plan"] else ""), language="sql")
+    e1, e2, e3 = st.columns(3)
+    e1.download_button("JSON", metrics.to_json(), file_name="careconnect_metrics.json", mime="application/json")
+    e2.download_button("Prometheus", metrics.to_prometheus(), file_name="careconnect_metrics.prom", mime="text/plain")
+    if e3.button("Azzera"):
+        metrics.reset()
+        st.rerun()
+
+    with st.expander("Strumenti DB (dev only)"):
+        if st.button("Lista utenti (debug)"):
+            rows = list_users()
+            if rows:
+                st.table(Rows(["id", "username", "role", "city"], rows).to_df())
+            else:
+                st.write("Nessun utente.")
+        dbg_user = st.text_input("Mostra hash per username (debug)", key="dbg_user")
+        if st.button("Mostra hash", key="dbg_btn"):
+            st.text_area("Hash utente", value=debug_show_hash(dbg_user), height=140)
+
+        if st.button("Esegui dispatch automatico"):
+            import dispatch
+            rep = dispatch.run()
+            st.success(f"Assegnate {rep['applied']} richieste su {rep['requests']} aperte "
+                       f"(solve {rep.get('solve_s', 0) * 1000:.0f} ms).")
+        if st.button("Verifica statistiche"):
+            drift = stats.reconcile(fix=True)
+            if drift:
+                st.warning("Statistiche ricostruite: " + ", ".join(f"{t} ({len(r)} chiavi)" for t, r in drift.items()))
+            else:
+                st.success("Statistiche allineate.")
+
+        st.markdown("**RESET DB (usare con cautela)**")
+        if st.button("RESET DB (elimina e ricrea DB con demo)"):
+            try:
+                db.delete_db_files()
+                resources.bootstrap_db(force=True)
+                maps.invalidate()   # data_versions riparte da capo: la chiave della mappa non basta
+                st.session_state['user'] = None
+                st.session_state['page'] = "Home"
+                st.success("DB resettato e dati demo inseriti.")
+            except Exception as e:
+                st.error(f"Errore reset DB: {e}")
 
 # Main layout: show Landing only when page == "Home"
 if st.session_state['page'] == "Home":
     st.markdown("## 🏠 Home")
-    pros = get_landing_pros()
+    # mappa e lista professionisti dalla cache di processo (ricostruite solo se cambiano)
+    landing = maps.get_map()
+    pros = landing["pros"]
     col1, col2 = st.columns([2,1])
     with col1:
         st.markdown("### Mappa professionisti")
-        html_map = create_map_html(pros)
-        components.html(html_map, height=500)
+        components.html(landing["html"], height=500)
+        ms = landing["stats"]
+        st.caption(f"{ms['markers']} professionisti — mappa {ms['mode']} {ms['html_bytes'] / 1024:.0f} KB, "
+                   f"build {ms['build_s'] * 1000:.0f} ms{' (cache)' if ms['cached'] else ''}")
     with col2:
         st.markdown("### Professionisti (schede)")
         if pros:
@@ -408,6 +290,26 @@ if st.session_state['page'] == "Home":
         else:
             st.info("Nessun professionista presente.")
     st.markdown("---")
+    # expander "pigro": il corpo gira solo quando è aperto. Le tabelle di Streamlit
+    # importano pandas, che così non pesa sul primo render della Home.
+    stats_box = st.expander("📊 Statistiche operative", key="home_stats", on_change="rerun")
+    if stats_box.open:
+        with stats_box:
+            # tabelle pre-aggregate: costo costante, nessun GROUP BY su requests/messages
+            tot = stats.totals()
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Richieste aperte", tot["open"])
+            m2.metric("In carico", tot["in_progress"])
+            m3.metric("Totale richieste", tot["total"])
+            m4.metric("Messaggi", tot["messages"])
+            st.markdown("**Per città e tipo di intervento**")
+            st.dataframe(stats.request_counts().to_df())
+            st.markdown("**Carichi dei professionisti (in carico)**")
+            st.dataframe(stats.top_workload().to_df())
+            per_day = stats.messages_per_day()
+            if not per_day.empty:
+                st.markdown("**Messaggi al giorno (ultimi 30 giorni)**")
+                st.bar_chart(per_day.to_df().set_index("day"))
     st.info("Se vuoi accedere alla Dashboard effettua il login dalla sidebar.")
 
 # If page == Dashboard, show dashboard area (requires login)
@@ -415,11 +317,13 @@ if st.session_state['page'] == "Dashboard":
     if st.session_state['user'] is None:
         st.warning("Devi effettuare il login per accedere alla Dashboard. Usa la sidebar per farlo.")
     else:
+        st.session_state['live_seen'] = {}
         usr = st.session_state['user']
         uid = usr[0]
         uname = usr[1]
         role = usr[3]
         city = usr[4]
+        origin = (usr[5], usr[6]) if usr[5] is not None and usr[6] is not None else None
         st.success(f"Benvenuto {uname} — {role} — {city}")
 
         if role == 'paziente':
@@ -429,14 +333,16 @@ if st.session_state['page'] == "Dashboard":
             with tab1:
                 st.subheader("Analisi AI (opzionale)")
                 ai_text = st.text_input("Descrivi il bisogno per l'AI", key="ai_text")
+                ai_radius = st.number_input("Raggio di ricerca (km, 0 = solo la tua città)", min_value=0, value=0, step=5, key="ai_radius")
                 if st.button("Analizza con AI"):
-                    if not AI_AVAILABLE:
+                    if not resources.ai_installed():
                         st.error("AI non disponibile. Installa sentence-transformers per abilitare.")
                     else:
-                        ai_msg, _, ai_df, best = get_ai_rec(ai_text, city)
+                        with st.spinner("Analisi in corso (al primo utilizzo viene caricato il modello)..."):
+                            ai_msg, _, ai_df, best = get_ai_rec(ai_text, city, origin, ai_radius)
                         st.info(ai_msg)
                         if not ai_df.empty:
-                            st.dataframe(ai_df)
+                            st.dataframe(ai_df.to_df())
                 st.markdown("---")
                 st.subheader("Invia Richiesta")
                 with st.form("send_request"):
@@ -445,9 +351,9 @@ if st.session_state['page'] == "Dashboard":
                     req_target = st.text_input("ID Professionista target (opzionale)")
                     submitted = st.form_submit_button("Invia Richiesta")
                     if submitted:
-                        df = submit_request(uid, req_cat, req_desc, city, req_target)
+                        hist_rows = submit_request(uid, req_cat, req_desc, city, req_target)
                         st.success("Richiesta inviata.")
-                        st.dataframe(df)
+                        st.dataframe(hist_rows.to_df())
 
             with tab2:
                 st.subheader("Chat attive")
@@ -458,13 +364,7 @@ if st.session_state['page'] == "Dashboard":
                     mapping = {label: rid for label, rid in chats}
                     sel = st.selectbox("Seleziona chat", options=list(mapping.keys()))
                     sel_id = mapping.get(sel)
-                    msgs = get_chat_history(sel_id)
-                    for m in msgs:
-                        sender_id, content = m
-                        if sender_id == uid:
-                            st.chat_message("user").write(content)
-                        else:
-                            st.chat_message("assistant").write(content)
+                    render_chat(sel_id, uid, "pat")
                     new_msg = st.text_input("Messaggio", key="pat_msg")
                     if st.button("Invia messaggio", key="pat_send"):
                         send_chat_msg(sel_id, uid, new_msg)
@@ -472,8 +372,19 @@ if st.session_state['page'] == "Dashboard":
 
             with tab3:
                 st.subheader("Storico Richieste")
-                hist = get_patient_history(uid)
-                st.dataframe(hist)
+                h1, h2 = st.columns(2)
+                h_type = h1.selectbox("Tipo", options=["Tutti"] + list(INTERVENTION_MAPPING.keys()), key="hist_type")
+                h_status = h2.selectbox("Stato", options=["Tutti", "Aperta", "In Carico"], key="hist_status")
+                h_type = None if h_type == "Tutti" else h_type
+                h_status = None if h_status == "Tutti" else h_status
+                hist = pager('hist', (h_type, h_status),
+                             lambda cur: list_patient_history(uid, cur, status=h_status, intervention_type=h_type),
+                             version=watch_version(f"requests:patient:{uid}"))
+                st.dataframe(hist['page'][0].to_df())
+                pager_nav('hist', hist)
+                st.markdown("---")
+                st.subheader("🔎 Cerca")
+                render_search(uid, 'paziente', 'pat_search')
 
             with tab4:
                 st.subheader("Profilo")
@@ -498,24 +409,48 @@ if st.session_state['page'] == "Dashboard":
             tab1, tab2, tab3 = st.tabs(["Lavoro", "Chat", "Profilo"])
             with tab1:
                 st.subheader("Richieste disponibili")
-                if st.button("Aggiorna"):
-                    st.experimental_rerun()
-                open_jobs = get_pro_open_jobs(city, uid)
-                st.dataframe(open_jobs)
+                # Pagine in cache per sessione: ricaricate con "Aggiorna" o al cambio filtri,
+                # altrimenti una presa in carico aggiorna solo la riga interessata.
+                refresh = st.button("Aggiorna")
+                radius = st.number_input("Raggio di ricerca (km, 0 = solo la tua città)", min_value=0, value=0, step=5, key="pro_radius")
+                j_type = st.selectbox("Tipo intervento", options=["Tutti"] + list(INTERVENTION_MAPPING.keys()), key="pro_type")
+                j_type = None if j_type == "Tutti" else j_type
+                if radius and origin:
+                    # feed per distanza: pagine dei più vicini con cursore (km, id)
+                    from geo import open_requests_within
+                    fetch_open = lambda cur: open_requests_within(origin[0], origin[1], radius, uid, limit=LIST_PAGE_SIZE,
+                                                                  cursor=cur, intervention_type=j_type)
+                else:
+                    fetch_open = lambda cur: list_open_jobs(city, uid, cur, intervention_type=j_type)
+                open_ver = (watch_version("requests:all") if radius and origin else
+                            (watch_version(f"requests:city:{city}"), watch_version(f"requests:pro:{uid}")))
+                open_pg = pager('pro_open', (radius, j_type), fetch_open, refresh=refresh, version=open_ver)
+                my_pg = pager('pro_my', (), lambda cur: list_my_jobs(uid, cur), refresh=refresh,
+                              version=watch_version(f"requests:pro:{uid}"))
+                open_slot = st.empty()
                 st.markdown("Accetta richieste inserendo l'ID")
                 accept_id = st.number_input("ID richiesta da accettare", min_value=0, value=0)
                 if st.button("Accetta"):
-                    ok, msg, new_open, new_my = accept_request(accept_id, uid, city)
+                    ok, msg, claimed = accept_request(accept_id, uid, city, origin, radius)
+                    open_rows, open_next = open_pg['page']
+                    gone = claimed[0] if ok else accept_id
+                    open_pg['page'] = (open_rows.where('ID', lambda v: v != gone), open_next)
                     if ok:
                         st.success(msg)
+                        my_rows, my_next = my_pg['page']
+                        my_pg['page'] = (Rows(my_rows.columns, [tuple(claimed)]) + my_rows, my_next)
                     else:
                         st.error(msg)
-                    st.dataframe(new_open)
-                    st.dataframe(new_my)
+                with open_slot.container():
+                    st.dataframe(open_pg['page'][0].to_df())
+                    pager_nav('pro_open', open_pg)
                 st.markdown("---")
                 st.subheader("Miei Pazienti / Carichi")
-                my_jobs = get_pro_my_jobs(uid)
-                st.dataframe(my_jobs)
+                st.dataframe(my_pg['page'][0].to_df())
+                pager_nav('pro_my', my_pg)
+                st.markdown("---")
+                st.subheader("🔎 Cerca nei miei casi")
+                render_search(uid, 'professionista', 'pro_search')
 
             with tab2:
                 st.subheader("Chat attive")
@@ -526,13 +461,7 @@ if st.session_state['page'] == "Dashboard":
                     mapping = {label: rid for label, rid in chats}
                     sel = st.selectbox("Seleziona chat", options=list(mapping.keys()))
                     sel_id = mapping.get(sel)
-                    msgs = get_chat_history(sel_id)
-                    for m in msgs:
-                        sender_id, content = m
-                        if sender_id == uid:
-                            st.chat_message("user").write(content)
-                        else:
-                            st.chat_message("assistant").write(content)
+                    render_chat(sel_id, uid, "pro")
                     new_msg = st.text_input("Messaggio", key="pro_msg")
                     if st.button("Invia messaggio pro", key="pro_send"):
                         send_chat_msg(sel_id, uid, new_msg)
@@ -559,6 +488,10 @@ if st.session_state['page'] == "Dashboard":
                         else:
                             st.error(msg)
 
+        # polling leggero dei contatori osservati in questa pagina
+        st.session_state['live_full_run'] = True
+        live_watch()
+
 # Footer or note
 st.markdown("---")
 st.caption("Naviga tra Home e Dashboard dalla sidebar. La mappa è visibile solo nella Home (landing).")
@@ -0,0 +1,352 @@
+import sqlite3
+import datetime
+import logging
+import re
+from config import INTERVENTION_MAPPING, CITY_COORDS
+import db
+import hashing
+import queries
+import resources
+from metrics import timed
+from rows import Rows, fetch
+from writer import writer
+
+# Log di debug dell'autenticazione: spenti in produzione (livello WARNING), con
+# argomenti lazy non costano nulla. CARECONNECT_LOG_LEVEL=DEBUG per riattivarli.
+log = logging.getLogger("careconnect.auth")
+
+# --- DB UTILITIES ---
+@timed
+def conn_fetch_user_by_username(username: str):
+    with db.connection() as conn:
+        return conn.execute(queries.USER_BY_USERNAME, (username.lower(),)).fetchone()
+
+def list_users():
+    with db.connection() as conn:
+        return conn.execute("SELECT id, username, role, city FROM users").fetchall()
+
+def debug_show_hash(username: str):
+    u = conn_fetch_user_by_username(username)
+    if not u:
+        return f"Utente '{username}' non trovato"
+    return f"id={u[0]}, username={u[1]}, stored_hash_present={bool(u[2])}\nhash={u[2]!s}"
+
+# --- BACKEND LOGIC ---
+@timed
+def authenticate(usr, pwd):
+    if not usr or not pwd:
+        log.debug("username o password vuoti")
+        return None
+
+    uname = usr.strip()
+    p = pwd.strip()
+    u = conn_fetch_user_by_username(uname)
+
+    if not u:
+        log.debug("utente '%s' non trovato (case-insensitive search)", uname)
+        return None
+
+    stored_hash = u[2] if len(u) > 2 else None
+    log.debug("trovato utente id=%s username=%s stored_hash_present=%s", u[0], u[1], bool(stored_hash))
+
+    if not stored_hash:
+        log.debug("stored_hash è vuoto/None")
+        return None
+
+    try:
+        verified = hashing.verify_password(p, stored_hash)
+        log.debug("pbkdf2_sha256.verify -> %s", verified)
+        if not verified:
+            return None
+    except Exception as ex:
+        log.debug("eccezione verify: %s", ex)
+        return None
+
+    # hash con un costo inferiore alla policy corrente: aggiornato ora che abbiamo la password
+    if hashing.needs_rehash(stored_hash):
+        try:
+            new_hash = hashing.hash_password(p)
+            with db.transaction() as conn:
+                conn.execute("UPDATE users SET password=? WHERE id=? AND password=?", (new_hash, u[0], stored_hash))
+            log.info("hash aggiornato per utente id=%s", u[0])
+        except Exception as ex:
+            log.warning("rehash fallito per utente id=%s: %s", u[0], ex)
+    return u
+
+@timed
+def register_user(u, p, r, c_city, b, q, e, rate):
+    if not u or not p:
+        return False, "Username e password richiesti."
+    try:
+        coords = CITY_COORDS.get(c_city, (0,0))
+        if r == 'paziente':
+            q, e, rate = None, 0, 0
+        hashed = hashing.hash_password(p)
+        sql = """INSERT INTO users
+                 (username, password, role, city, lat, lon, bio, qualification, experience, hourly_rate, email, address, age, clinical_history, detailed_experience)
+                 VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+        with db.transaction() as conn:
+            conn.execute(sql, (u, hashed, r, c_city, coords[0], coords[1], b, q, e, rate, None, None, None, None, None))
+        if r == 'professionista':
+            _reindex_profiles()
+        return True, "✅ Registrazione OK! Effettua il login."
+    except sqlite3.IntegrityError:
+        return False, "❌ Errore: Username già in uso."
+    except Exception as ex:
+        log.exception("errore registrazione di %s", u)
+        return False, f"❌ Errore tecnico: {ex}"
+
+# Core functions (requests, chats, etc.)
+@timed
+def get_landing_pros():
+    with db.connection() as conn:
+        return conn.execute("SELECT username, city, bio, lat, lon, qualification, experience, hourly_rate FROM users WHERE role='professionista'").fetchall()
+
+@timed
+def get_patient_history(uid):
+    with db.connection() as conn:
+        return fetch(conn, *queries.patient_history(uid))
+
+@timed
+def get_pro_open_jobs(city, my_id):
+    # prima le esclusive, poi le pubbliche della città: due ricerche su indice (queries.open_jobs)
+    with db.connection() as conn:
+        return fetch(conn, *queries.open_jobs("x", my_id, city)) + fetch(conn, *queries.open_jobs("p", my_id, city))
+
+@timed
+def get_pro_my_jobs(pro_id):
+    with db.connection() as conn:
+        return fetch(conn, queries.PRO_MY_JOBS, (pro_id,))
+
+# --- LISTING PAGINATI ---
+# Paginazione keyset: il cursore è l'ultimo id della pagina (ordine id DESC), per le
+# richieste aperte la coppia (fase, id) con prima le esclusive poi le pubbliche.
+# Ritornano (Rows, cursore pagina successiva o None): il DataFrame lo costruisce la UI.
+LIST_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def _page_limit(limit):
+    return max(1, min(int(limit or LIST_PAGE_SIZE), MAX_PAGE_SIZE))
+
+def _next_cursor(rows, limit, id_col):
+    return rows.last(id_col) if len(rows) == limit else None
+
+@timed
+def list_open_jobs(city, my_id, cursor=None, limit=LIST_PAGE_SIZE, intervention_type=None, date_from=None, date_to=None):
+    limit = _page_limit(limit)
+    phase, last_id = cursor if cursor else ("x", None)
+    fsql, fparams = queries.filters("r.", intervention_type, None, date_from, date_to)
+    excl = None
+    with db.connection() as conn:
+        if phase == "x":
+            excl = fetch(conn, *queries.open_jobs("x", my_id, city, last_id, limit, fsql, fparams))
+            if len(excl) == limit:
+                return excl, ("x", excl.last("ID"))
+            phase, last_id = "p", None
+        remaining = limit - (len(excl) if excl else 0)
+        pub = fetch(conn, *queries.open_jobs("p", my_id, city, last_id, remaining, fsql, fparams))
+    return (excl + pub if excl else pub), (("p", pub.last("ID")) if len(pub) == remaining else None)
+
+@timed
+def list_my_jobs(pro_id, cursor=None, limit=LIST_PAGE_SIZE, status=None, intervention_type=None, date_from=None, date_to=None):
+    limit = _page_limit(limit)
+    fsql, fparams = queries.filters("r.", intervention_type, status, date_from, date_to)
+    with db.connection() as conn:
+        rows = fetch(conn, *queries.my_jobs(pro_id, cursor, limit, fsql, fparams))
+    return rows, _next_cursor(rows, limit, "id")
+
+@timed
+def list_patient_history(uid, cursor=None, limit=LIST_PAGE_SIZE, status=None, intervention_type=None, date_from=None, date_to=None):
+    limit = _page_limit(limit)
+    fsql, fparams = queries.filters("", intervention_type, status, date_from, date_to)
+    with db.connection() as conn:
+        rows = fetch(conn, *queries.patient_history(uid, cursor, limit, fsql, fparams))
+    return rows, _next_cursor(rows, limit, "id")
+
+@timed
+def submit_request(uid, cat, desc, city, target_id):
+    tgt = int(target_id) if (target_id and str(target_id).isdigit() and int(target_id) > 0) else None
+    writer.run(_insert_request, uid, tgt, cat, desc, city, str(datetime.date.today()))
+    return list_patient_history(uid)[0]
+
+# Le INSERT di richieste e messaggi passano dal writer con group commit (writer.py):
+# le funzioni _insert_* ricevono la connessione del lotto
+def _insert_request(conn, uid, tgt, cat, desc, city, created_at):
+    return conn.execute("INSERT INTO requests (patient_id, professional_id, target_pro_id, intervention_type, description, city, status, created_at) VALUES (?, NULL, ?, ?, ?, ?, 'Aperta', ?)",
+                        (uid, tgt, cat, desc, city, created_at)).lastrowid
+
+def _insert_message(conn, req_id, user_id, msg, ts):
+    return conn.execute("INSERT INTO messages (request_id, sender_id, content, timestamp) VALUES (?, ?, ?, ?)", (req_id, user_id, msg, ts)).lastrowid
+
+@timed
+def claim_request(req_id, pro_id, city, origin=None, radius_km=0):
+    # Presa in carico atomica: un solo UPDATE condizionato sotto BEGIN IMMEDIATE.
+    # Se due professionisti accettano la stessa richiesta, solo il primo UPDATE trova
+    # ancora status='Aperta'; l'altro non modifica righe (rowcount 0) e riceve None.
+    # Ritorna la riga presa in carico con le colonne di get_pro_my_jobs.
+    with db.transaction() as conn:
+        rows = conn.execute(*queries.claim(pro_id, req_id, city, origin, radius_km)).fetchall()
+    return rows[0] if rows else None
+
+@timed
+def accept_request(req_id, pro_id, city, origin=None, radius_km=0):
+    # origin=(lat, lon) del professionista: con radius_km > 0 sono accettabili anche
+    # le richieste pubbliche di altre città entro il raggio.
+    # Ritorna solo il delta (la riga presa in carico): la UI aggiorna le liste in cache.
+    if not req_id:
+        return False, "⚠️ ID nullo", None
+    claimed = claim_request(req_id, pro_id, city, origin, radius_km)
+    if claimed is None:
+        return False, "❌ Errore: richiesta non disponibile.", None
+    return True, f"✅ Presa in carico ID {req_id}", claimed
+
+@timed
+def get_active_chats(user_id, role):
+    q = queries.ACTIVE_CHATS_PATIENT if role == 'paziente' else queries.ACTIVE_CHATS_PRO
+    with db.connection() as conn:
+        return conn.execute(q, (user_id,)).fetchall()
+
+@timed
+def get_chat_history(req_id):
+    if not req_id:
+        return []
+    with db.connection() as conn:
+        return conn.execute(queries.CHAT_HISTORY, (req_id,)).fetchall()
+
+# Chat incrementale: ultimi N messaggi, pagine precedenti con cursore (id < ?)
+# e solo i nuovi dopo l'ultimo id noto. Righe: (id, sender_id, content).
+CHAT_PAGE_SIZE = 50
+
+@timed
+def get_chat_tail(req_id, limit=CHAT_PAGE_SIZE):
+    if not req_id:
+        return []
+    with db.connection() as conn:
+        rows = conn.execute(queries.CHAT_TAIL, (req_id, limit)).fetchall()
+    rows.reverse()
+    return rows
+
+@timed
+def get_chat_before(req_id, before_id, limit=CHAT_PAGE_SIZE):
+    if not req_id:
+        return []
+    with db.connection() as conn:
+        rows = conn.execute(queries.CHAT_BEFORE, (req_id, before_id, limit)).fetchall()
+    rows.reverse()
+    return rows
+
+@timed
+def get_chat_since(req_id, last_id):
+    if not req_id:
+        return []
+    with db.connection() as conn:
+        return conn.execute(queries.CHAT_SINCE, (req_id, last_id or 0)).fetchall()
+
+@timed
+def send_chat_msg(req_id, user_id, msg):
+    # Ritorna l'id del messaggio inserito (None se non inviato): il chiamante
+    # recupera il delta con get_chat_since invece di ricaricare tutta la chat.
+    if not req_id or not msg:
+        return None
+    return writer.run(_insert_message, req_id, user_id, msg, str(datetime.datetime.now()))
+
+# --- RICERCA FULL-TEXT ---
+# Indici FTS5 (migrazione 9) ordinati per bm25 e limitati alle richieste del chiamante:
+# il paziente cerca nelle proprie, il professionista in quelle assegnate o esclusive.
+# Cursore keyset (punteggio, id). Ritornano (Rows, cursore successivo o None).
+def fts_query(text):
+    # parole dell'utente -> termini quotati con prefisso, in AND ("diabete insulina" -> "diabete"* "insulina"*)
+    return " ".join(f'"{t}"*' for t in re.findall(r"\w+", str(text or "").lower()))
+
+def _search_scope(user_id, role):
+    if role == 'paziente':
+        return "r.patient_id=?", [user_id]
+    return "(r.professional_id=? OR r.target_pro_id=?)", [user_id, user_id]
+
+def _search(select, fts, query, user_id, role, cursor, limit, id_col):
+    limit = _page_limit(limit)
+    match = fts_query(query)
+    scope, params = _search_scope(user_id, role)
+    sql = select + f" WHERE {fts} MATCH ? AND " + scope
+    params = [match] + params
+    if cursor:
+        sql += f" AND (bm25({fts}) > ? OR (bm25({fts}) = ? AND {id_col} > ?))"
+        params += [cursor[0], cursor[0], cursor[1]]
+    if not match:
+        return Rows(()), None
+    with db.connection() as conn:
+        rows = fetch(conn, sql + f" ORDER BY score, {id_col} LIMIT ?", params + [limit])
+    return rows, ((rows.last("score"), rows.last("ID")) if len(rows) == limit else None)
+
+@timed
+def search_requests(query, user_id, role, cursor=None, limit=LIST_PAGE_SIZE):
+    select = """SELECT r.id as ID, r.intervention_type, r.status, r.created_at,
+                       snippet(requests_fts, 0, '**', '**', '…', 12) as Estratto, bm25(requests_fts) as score
+                FROM requests_fts JOIN requests r ON r.id = requests_fts.rowid"""
+    return _search(select, "requests_fts", query, user_id, role, cursor, limit, "r.id")
+
+@timed
+def search_messages(query, user_id, role, cursor=None, limit=LIST_PAGE_SIZE):
+    select = """SELECT m.id as ID, m.request_id as Richiesta, r.intervention_type, m.timestamp,
+                       snippet(messages_fts, 0, '**', '**', '…', 12) as Estratto, bm25(messages_fts) as score
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid JOIN requests r ON r.id = m.request_id"""
+    return _search(select, "messages_fts", query, user_id, role, cursor, limit, "m.id")
+
+AI_TOP_K = 20
+
+def _reindex_profiles():
+    # Aggiorna subito l'indice profili solo se il modello è già in memoria: altrimenti
+    # i profili restano in coda e vengono codificati alla prima ricerca AI
+    if not resources.model_loaded():
+        return
+    try:
+        resources.get_profile_index().update()
+    except Exception:
+        log.exception("errore aggiornamento indice profili")
+
+@timed
+def get_ai_rec(text, city, origin=None, radius_km=0, top_k=AI_TOP_K):
+    kb_cache = resources.get_kb_cache()
+    if kb_cache is None:
+        return "AI non disponibile", "", Rows(()), None
+    best, _ = kb_cache.best_match(text)
+    quals = INTERVENTION_MAPPING[best]
+    # professionisti ordinati per similarità tra descrizione del paziente e bio/CV
+    index = resources.get_profile_index()
+    index.update()
+    qvec = kb_cache.encode_query(text)
+    if origin and radius_km:
+        import geo
+        near = {r[0]: (r[0], r[1], r[2], r[3], r[5]) for r in geo.pros_within(origin[0], origin[1], radius_km, quals)}
+        hits = index.search(qvec, top_k, ids=near)
+        columns = ["ID", "username", "qualification", "hourly_rate", "km"]
+    else:
+        hits = index.search(qvec, top_k, city=city, qualifications=quals)
+        ids = [h[0] for h in hits]
+        with db.connection() as conn:
+            near = {r[0]: r for r in conn.execute(*queries.pros_by_id(ids))} if ids else {}
+        columns = ["ID", "username", "qualification", "hourly_rate"]
+    out = Rows(columns + ["affinità"], [near[i] + (round(score, 3),) for i, score in hits if i in near])
+    return f"✅ Bisogno: {best}", "OK", out, best
+
+@timed
+def update_full_profile(uid, role, pwd, bio, email, address, age, clinical, det_exp, qual=None, num_exp=None, rate=None):
+    try:
+        pwd_hashed = hashing.hash_password(pwd) if pwd else None
+        with db.transaction() as conn:
+            if role == 'paziente':
+                if pwd_hashed:
+                    conn.execute("UPDATE users SET password=?, bio=?, email=?, address=?, age=?, clinical_history=? WHERE id=?", (pwd_hashed, bio, email, address, age, clinical, uid))
+                else:
+                    conn.execute("UPDATE users SET bio=?, email=?, address=?, age=?, clinical_history=? WHERE id=?", (bio, email, address, age, clinical, uid))
+            else:
+                if pwd_hashed:
+                    conn.execute("UPDATE users SET password=?, bio=?, email=?, address=?, age=?, detailed_experience=?, qualification=?, experience=?, hourly_rate=? WHERE id=?", (pwd_hashed, bio, email, address, age, det_exp, qual, num_exp, rate, uid))
+                else:
+                    conn.execute("UPDATE users SET bio=?, email=?, address=?, age=?, detailed_experience=?, qualification=?, experience=?, hourly_rate=? WHERE id=?", (bio, email, address, age, det_exp, qual, num_exp, rate, uid))
+        if role != 'paziente':
+            _reindex_profiles()
+        return True, "✅ Profilo salvato!"
+    except Exception as e:
+        log.exception("errore update_full_profile per l'utente %s", uid)
+        return False, f"❌ Errore: {e}"
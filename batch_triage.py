@@ -0,0 +1,111 @@
+# --- TRIAGE AI BATCH ---
+# Riclassifica le richieste salvate (requests.description) contro la knowledge base:
+# legge a blocchi per id crescente, codifica ogni blocco con una sola chiamata
+# model.encode(batch_size=...), confronta con la matrice KB in cache e scrive categoria
+# suggerita + confidenza in request_triage con executemany, nella stessa transazione
+# del checkpoint. Se interrotto riparte dall'ultimo blocco completato.
+#
+# Uso: python batch_triage.py [--db home_care_v21.db] [--chunk 2000] [--batch-size 64]
+#                             [--restart] [--encoder hashing] [--report]
+import argparse
+import datetime
+import sys
+import time
+
+import numpy as np
+
+from config import DB_NAME, MODEL_NAME, CACHE_DIR, KNOWLEDGE_BASE
+import db
+import resources
+from embeddings import EmbeddingCache, HashingEncoder
+
+
+def job_name(kb_cache) -> str:
+    # un cambio di modello o di mapping produce un job nuovo (si riparte da zero)
+    return f"triage:{kb_cache.model_name}:{kb_cache.kb_key[:16]}"
+
+
+def get_checkpoint(job):
+    with db.connection() as conn:
+        row = conn.execute("SELECT last_id, rows_done FROM batch_checkpoints WHERE job=?", (job,)).fetchone()
+    return row if row else (0, 0)
+
+
+def classify(kb_cache, texts, batch_size):
+    vecs = kb_cache.encode_texts(texts, batch_size)
+    scores = vecs @ kb_cache.kb_matrix().T
+    best = scores.argmax(axis=1)
+    return best, scores[np.arange(len(best)), best]
+
+
+def run(kb_cache, chunk=2000, batch_size=64, restart=False, log=print):
+    job = job_name(kb_cache)
+    if restart:
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM batch_checkpoints WHERE job=?", (job,))
+    last_id, done = get_checkpoint(job)
+    kb_cache.kb_matrix()
+    started = time.perf_counter()
+    processed = 0
+    with db.connection() as conn:
+        while True:
+            rows = conn.execute("SELECT id, description FROM requests WHERE id>? ORDER BY id LIMIT ?", (last_id, chunk)).fetchall()
+            if not rows:
+                break
+            best, conf = classify(kb_cache, [r[1] or "" for r in rows], batch_size)
+            now = str(datetime.datetime.now())
+            payload = [(r[0], KNOWLEDGE_BASE[b], float(c), kb_cache.model_name, kb_cache.kb_key, now) for r, b, c in zip(rows, best, conf)]
+            last_id = rows[-1][0]
+            done += len(rows)
+            processed += len(rows)
+            with db.transaction():
+                conn.executemany("INSERT OR REPLACE INTO request_triage (request_id, suggested_type, confidence, model, kb_hash, classified_at) VALUES (?,?,?,?,?,?)", payload)
+                conn.execute("INSERT OR REPLACE INTO batch_checkpoints (job, last_id, rows_done, updated_at) VALUES (?,?,?,?)", (job, last_id, done, now))
+            elapsed = time.perf_counter() - started
+            log(f"  fino a id {last_id}: {processed} righe, {processed / elapsed:.0f} righe/s")
+    elapsed = time.perf_counter() - started
+    return {"job": job, "rows": processed, "total_rows_done": done, "elapsed_s": round(elapsed, 3),
+            "rows_per_s": round(processed / elapsed, 1) if elapsed > 0 else None}
+
+
+def mismatch_report(kb_hash, min_confidence=0.0):
+    # richieste in cui la categoria scelta dal paziente differisce da quella suggerita
+    with db.connection() as conn:
+        return conn.execute("""SELECT r.intervention_type, t.suggested_type, count(*), avg(t.confidence)
+                               FROM request_triage t JOIN requests r ON r.id = t.request_id
+                               WHERE t.kb_hash=? AND t.confidence>=? AND r.intervention_type IS NOT t.suggested_type
+                               GROUP BY 1, 2 ORDER BY 3 DESC""", (kb_hash, min_confidence)).fetchall()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Triage AI batch delle richieste salvate")
+    ap.add_argument("--db", default=DB_NAME)
+    ap.add_argument("--chunk", type=int, default=2000, help="righe lette e scritte per transazione")
+    ap.add_argument("--batch-size", type=int, default=64, help="batch_size passato a model.encode")
+    ap.add_argument("--restart", action="store_true", help="ignora il checkpoint e riparte da capo")
+    ap.add_argument("--encoder", choices=("model", "hashing"), default="model",
+                    help="'hashing' usa l'encoder deterministico offline (test/benchmark)")
+    ap.add_argument("--report", action="store_true", help="stampa le categorie discordanti")
+    args = ap.parse_args(argv)
+
+    db.configure(args.db)
+    resources.bootstrap_db()
+    if args.encoder == "hashing":
+        kb_cache = EmbeddingCache(HashingEncoder(), "hashing-256", KNOWLEDGE_BASE)
+    else:
+        model = resources.get_model()
+        if model is None:
+            print(f"AI non disponibile: {resources.status()['model_error']}", file=sys.stderr)
+            return 1
+        kb_cache = EmbeddingCache(model, MODEL_NAME, KNOWLEDGE_BASE, cache_dir=CACHE_DIR)
+
+    res = run(kb_cache, args.chunk, args.batch_size, args.restart)
+    print(f"job {res['job']}: {res['rows']} righe in {res['elapsed_s']}s ({res['rows_per_s']} righe/s), totale {res['total_rows_done']}")
+    if args.report:
+        for chosen, suggested, n, conf in mismatch_report(kb_cache.kb_key):
+            print(f"{n:7d}  {chosen!s:40} -> {suggested:40} (conf. media {conf:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# --- STRESS TEST PRESA IN CARICO ---
+# N thread (professionisti) provano ad accettare le stesse richieste aperte in ordine
+# casuale: ogni richiesta deve avere esattamente un vincitore.
+# Uso: python -m bench.claim_stress [--requests 2000] [--threads 16]
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import resources
+from backend import claim_request
+
+
+def run(n_requests=2000, n_threads=16, seed=42):
+    tmp = tempfile.mkdtemp(prefix="cc_claims_")
+    db.configure(os.path.join(tmp, "claims.db"))
+    resources.bootstrap_db(force=True)
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO users (username, password, role, city, lat, lon, qualification) VALUES (?, 'x', 'professionista', 'Milano', 45.46, 9.19, 'Infermiere')",
+                         [(f"stress_pro_{i}",) for i in range(n_threads)])
+        pro_ids = [r[0] for r in conn.execute("SELECT id FROM users WHERE username LIKE 'stress_pro_%' ORDER BY id")]
+        conn.executemany("INSERT INTO requests (patient_id, intervention_type, description, city, status, created_at) VALUES (1, 'Assistenza Infermieristica', 'stress', 'Milano', 'Aperta', '2024-01-01')",
+                         [() for _ in range(n_requests)])
+        req_ids = [r[0] for r in conn.execute("SELECT id FROM requests WHERE description='stress'")]
+
+    wins = {pid: [] for pid in pro_ids}
+    errors = []
+    attempts = []
+    start = threading.Barrier(n_threads)
+
+    def worker(pid, order):
+        start.wait()
+        n = 0
+        for rid in order:
+            try:
+                if claim_request(rid, pid, "Milano") is not None:
+                    wins[pid].append(rid)
+            except sqlite3.OperationalError as ex:
+                errors.append(str(ex))
+            n += 1
+        attempts.append(n)
+
+    rnd = random.Random(seed)
+    threads = []
+    for pid in pro_ids:
+        order = req_ids[:]
+        rnd.shuffle(order)
+        threads.append(threading.Thread(target=worker, args=(pid, order)))
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    claimed = [rid for lst in wins.values() for rid in lst]
+    with db.connection() as conn:
+        still_open = conn.execute("SELECT count(*) FROM requests WHERE status='Aperta'").fetchone()[0]
+        owners = dict(conn.execute("SELECT id, professional_id FROM requests WHERE description='stress'").fetchall())
+    consistent = all(owners[rid] == pid for pid, lst in wins.items() for rid in lst)
+    return {
+        "requests": n_requests,
+        "threads": n_threads,
+        "claims": len(claimed),
+        "duplicate_winners": len(claimed) - len(set(claimed)),
+        "still_open": still_open,
+        "owner_consistent": consistent,
+        "lock_errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "claims_per_s": round(len(claimed) / elapsed, 1),
+        "attempts_per_s": round(sum(attempts) / elapsed, 1),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=16)
+    args = ap.parse_args()
+    res = run(args.requests, args.threads)
+    for k, v in res.items():
+        print(f"{k}: {v}")
+    ok = res["claims"] == res["requests"] and res["duplicate_winners"] == 0 and res["still_open"] == 0 and res["owner_consistent"]
+    print("OK: un solo vincitore per richiesta" if ok else "KO: prese in carico incoerenti")
+    sys.exit(0 if ok else 1)
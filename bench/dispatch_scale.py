@@ -0,0 +1,82 @@
+# --- BENCHMARK DISPATCH ---
+# Genera richieste aperte e professionisti casuali attorno alle città note e misura
+# costruzione della matrice dei costi, solve e applicazione delle assegnazioni.
+# Una quota di richieste è di pazienti di un comune vicino (altra città, entro pochi km
+# da un professionista compatibile): la presa in carico passa dal ramo a raggio.
+# Uso: python -m bench.dispatch_scale [--requests 5000] [--pros 2000] [--cross-city 50]
+#                                     [--solver greedy] [--dry-run]
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from config import CITY_COORDS, INTERVENTION_MAPPING, ALL_QUALIFICATIONS
+import db
+import dispatch
+import resources
+
+
+def populate(n_requests, n_pros, seed=7, exclusive_share=0.05, n_cross_city=50):
+    rnd = random.Random(seed)
+    cities = list(CITY_COORDS)
+
+    def jitter(city):
+        lat, lon = CITY_COORDS[city]
+        return lat + rnd.uniform(-0.2, 0.2), lon + rnd.uniform(-0.2, 0.2)
+
+    pros, patients = [], []
+    for i in range(n_pros):
+        c = rnd.choice(cities)
+        pros.append((f"disp_pro_{i}", "x", "professionista", c, *jitter(c), rnd.choice(ALL_QUALIFICATIONS), rnd.randint(0, 30), rnd.uniform(10, 60)))
+    for i in range(n_requests):
+        c = rnd.choice(cities)
+        patients.append((f"disp_pat_{i}", "x", "paziente", c, *jitter(c), None, 0, 0))
+    # pazienti dell'hinterland: città diversa da quella del professionista, ma a pochi km
+    cross = []
+    for i in range(min(n_cross_city, n_pros)):
+        _, _, _, c, lat, lon, qual, _, _ = pros[rnd.randrange(n_pros)]
+        patients.append((f"disp_hint_{i}", "x", "paziente", f"Hinterland {c}",
+                         lat + rnd.uniform(-0.05, 0.05), lon + rnd.uniform(-0.05, 0.05), None, 0, 0))
+        cross.append(rnd.choice([t for t, allowed in INTERVENTION_MAPPING.items() if qual in allowed]))
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO users (username, password, role, city, lat, lon, qualification, experience, hourly_rate) VALUES (?,?,?,?,?,?,?,?,?)", pros + patients)
+        pro_ids = [r[0] for r in conn.execute("SELECT id FROM users WHERE username LIKE 'disp_pro_%'")]
+        pat = conn.execute("SELECT id, city FROM users WHERE username LIKE 'disp_pat_%'").fetchall()
+        hint = conn.execute("SELECT id, city FROM users WHERE username LIKE 'disp_hint_%' ORDER BY id").fetchall()
+        types = list(INTERVENTION_MAPPING)
+        conn.executemany("INSERT INTO requests (patient_id, target_pro_id, intervention_type, description, city, status, created_at) VALUES (?,?,?,'dispatch',?,'Aperta','2024-01-01')",
+                         [(pid, rnd.choice(pro_ids) if rnd.random() < exclusive_share else None, rnd.choice(types), city) for pid, city in pat]
+                         + [(pid, None, t, city) for (pid, city), t in zip(hint, cross)])
+
+
+def run(n_requests=5000, n_pros=2000, solver="greedy", dry_run=False, n_cross_city=50):
+    tmp = tempfile.mkdtemp(prefix="cc_dispatch_")
+    db.configure(os.path.join(tmp, "dispatch.db"))
+    resources.bootstrap_db(force=True)
+    populate(n_requests, n_pros, n_cross_city=n_cross_city)
+    return dispatch.run(solver, dry_run)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--pros", type=int, default=2000)
+    ap.add_argument("--cross-city", type=int, default=50, help="richieste di un comune vicino al professionista")
+    ap.add_argument("--solver", choices=sorted(dispatch.SOLVERS), default="greedy")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    res = run(args.requests, args.pros, args.solver, args.dry_run, args.cross_city)
+    for k, v in res.items():
+        print(f"{k}: {v}")
+    with db.connection() as conn:
+        dup = conn.execute("SELECT count(*) FROM requests WHERE status='In Carico' AND professional_id IS NULL").fetchone()[0]
+        bad_excl = conn.execute("SELECT count(*) FROM requests WHERE target_pro_id IS NOT NULL AND professional_id IS NOT NULL AND professional_id != target_pro_id").fetchone()[0]
+        cross = conn.execute("""SELECT count(*) FROM requests r JOIN users p ON p.id = r.professional_id
+                                WHERE r.status='In Carico' AND r.target_pro_id IS NULL AND r.city != p.city""").fetchone()[0]
+    print(f"cross_city_applied: {cross}")
+    ok = (dup == 0 and bad_excl == 0 and res.get("failed", 0) == 0
+          and (args.dry_run or (res["applied"] + res["skipped_claimed"] == res["assigned"] and (cross or not args.cross_city))))
+    print("OK" if ok else f"KO: {dup} senza professionista, {bad_excl} esclusive violate, {res.get('failed', 0)} prese in carico fallite, "
+                          f"{cross} assegnazioni tra città")
+    sys.exit(0 if ok else 1)
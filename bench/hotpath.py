@@ -0,0 +1,128 @@
+# --- BENCHMARK HOT PATH ---
+# Tempo di import a freddo dei moduli usati da Home e login e primo render reale di
+# app.py (AppTest: Home, poi login), ciascuno in un processo nuovo e con l'elenco delle
+# dipendenze pesanti caricate; costo per chiamata delle letture piccole: tempo e
+# memoria allocata (tracemalloc) su un DB sintetico.
+# Uso: python -m bench.hotpath [--imports 5] [--renders 3] [--calls 200]
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HEAVY = ("pandas", "numpy", "folium", "torch", "sentence_transformers")
+IMPORT_PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import backend, maps
+dt = time.perf_counter() - t0
+print(repr((dt, [m for m in {heavy!r} if m in sys.modules])))
+"""
+
+# Home a freddo e login in un processo nuovo; cwd = cartella con il DB già creato
+RENDER_PROBE = """
+import sys, time
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+heavy = lambda: [m for m in {heavy!r} if m in sys.modules]
+at = AppTest.from_file({app!r}, default_timeout=120)
+t0 = time.perf_counter()
+at.run()
+home = (time.perf_counter() - t0, heavy(), len(at.exception))
+at.sidebar.text_input(key="login_user").input("mario_rossi")
+at.sidebar.text_input(key="login_pass").input("pass")
+t0 = time.perf_counter()
+[b for b in at.sidebar.button if b.label == "Login"][0].click().run()
+login = (time.perf_counter() - t0, heavy(), len(at.exception))
+print(repr((home, login)))
+"""
+
+
+def _root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(repeats=5):
+    root = _root()
+    samples, loaded = [], []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(heavy=HEAVY)], cwd=root,
+                             capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+        dt, loaded = eval(out)
+        samples.append(dt * 1000)
+    samples.sort()
+    return {"p50_ms": round(samples[len(samples) // 2], 1), "min_ms": round(samples[0], 1), "heavy_loaded": loaded}
+
+
+def render_time(repeats=3):
+    root = _root()
+    probe = RENDER_PROBE.format(root=root, app=os.path.join(root, "app.py"), heavy=HEAVY)
+    cwd = tempfile.mkdtemp(prefix="cc_render_")
+    runs = []
+    for i in range(repeats + 1):
+        out = subprocess.run([sys.executable, "-c", probe], cwd=cwd, capture_output=True, text=True,
+                             check=True).stdout.strip().splitlines()[-1]
+        if i:                                         # il primo processo crea DB e dati demo
+            runs.append(eval(out))
+    res = {}
+    for j, name in enumerate(("home", "login")):
+        samples = sorted(r[j][0] * 1000 for r in runs)
+        res[name] = {"p50_ms": round(samples[len(samples) // 2], 1), "min_ms": round(samples[0], 1),
+                     "heavy_loaded": runs[-1][j][1], "exceptions": runs[-1][j][2]}
+    return res
+
+
+def per_call(n_calls=200, seed=42):
+    import db
+    import resources
+    from bench import synthetic
+    import backend
+
+    db.configure(os.path.join(tempfile.mkdtemp(prefix="cc_hot_"), "hot.db"))
+    resources.bootstrap_db(force=True)
+    synthetic.generate(2000, 20000, 20000, seed)
+    rnd = random.Random(seed)
+    with db.connection() as conn:
+        pats = [r[0] for r in conn.execute("SELECT id FROM users WHERE role='paziente'")]
+        pros = conn.execute("SELECT id, city FROM users WHERE role='professionista'").fetchall()
+    cases = {
+        "get_patient_history": (backend.get_patient_history, lambda: (rnd.choice(pats),)),
+        "get_pro_my_jobs": (backend.get_pro_my_jobs, lambda: (rnd.choice(pros)[0],)),
+        "get_active_chats": (backend.get_active_chats, lambda: (rnd.choice(pros)[0], "professionista")),
+        "list_patient_history": (backend.list_patient_history, lambda: (rnd.choice(pats),)),
+        "list_my_jobs": (backend.list_my_jobs, lambda: (rnd.choice(pros)[0],)),
+        "list_open_jobs": (backend.list_open_jobs, lambda: tuple(reversed(rnd.choice(pros)))),
+    }
+    out = {}
+    for name, (fn, args) in cases.items():
+        fn(*args())                                   # warm-up (statement cache, import pigri)
+        arg_list = [args() for _ in range(n_calls)]
+        t0 = time.perf_counter()
+        for a in arg_list:
+            fn(*a)
+        elapsed = time.perf_counter() - t0
+        peaks = []
+        tracemalloc.start()
+        for a in arg_list[:50]:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(*a)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        out[name] = {"us_per_call": round(elapsed / n_calls * 1e6, 1), "peak_kb": round(sum(peaks) / len(peaks) / 1024, 1)}
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--imports", type=int, default=5, help="processi per la misura dell'import")
+    ap.add_argument("--renders", type=int, default=3, help="processi per la misura del render")
+    ap.add_argument("--calls", type=int, default=200)
+    args = ap.parse_args()
+    res = {"import_backend_maps": import_time(args.imports), "render": render_time(args.renders),
+           "per_call": per_call(args.calls)}
+    print(json.dumps(res, indent=2))
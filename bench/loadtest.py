@@ -0,0 +1,327 @@
+# --- LOAD TEST SESSIONI CONCORRENTI ---
+# Esegue il vero app.py con AppTest di Streamlit (headless, nello stesso processo come
+# il server: stesse cache di modulo, stesso pool SQLite, stesso GIL). N sessioni in
+# parallelo ripetono percorsi scriptati su un DB sintetico temporaneo:
+#   paziente:        apertura Home, login, invio richiesta, messaggio in chat
+#   professionista:  apertura Home, login, "Aggiorna", presa in carico di una richiesta
+# Ogni passo è un rerun completo dello script: si misurano latenza end-to-end per
+# passo, eccezioni (separando gli errori di lock SQLite) e throughput.
+# Prima del carico una fase "cold_start" riparte da installazione nuova: DB vuoto e
+# pool hash spento, così migrazioni, seed demo e primo hash girano dentro AppTest
+# con le N sessioni che aprono la Home insieme.
+# Uso: python -m bench.loadtest [--sessions 8] [--journeys 5] [--pro-share 0.5]
+#                               [--users 1000 --requests 5000 --messages 20000] [--out risultati.json]
+#                               [--allow-untested-streamlit]
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import hashing
+import maps
+import resources
+from bench import synthetic
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+RUN_TIMEOUT_S = 120
+LOCK_MARKERS = ("database is locked", "database table is locked", "SQLITE_BUSY")
+# _share_runtime sostituisce attributi interni di Streamlit: versioni (major, minor) verificate
+STREAMLIT_TESTED = ((1, 65), (1, 65))
+DEMO_USERS = {"paziente": "mario_rossi", "professionista": "luigi_verdi"}
+
+
+class JourneyError(Exception):
+    pass
+
+
+def _pct(vals, q):
+    return round(vals[min(len(vals) - 1, int(len(vals) * q))], 1) if vals else None
+
+
+def _summary(ms):
+    ms = sorted(ms)
+    return {"n": len(ms), "p50_ms": _pct(ms, 0.50), "p95_ms": _pct(ms, 0.95), "p99_ms": _pct(ms, 0.99),
+            "max_ms": round(ms[-1], 1) if ms else None}
+
+
+def _by_label(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise JourneyError(f"widget '{label}' non trovato")
+
+
+def _check_streamlit(allow_untested=False):
+    import streamlit
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    missing = [f"{obj.__name__}.{name}" for obj, name in
+               ((Runtime, "_instance"), (app_test, "ScriptCache"), (local_script_runner, "ScriptCache"))
+               if not hasattr(obj, name)]
+    if missing:
+        raise RuntimeError(f"streamlit {streamlit.__version__}: mancano {', '.join(missing)}, il load test va aggiornato")
+    version = tuple(int(x) for x in streamlit.__version__.split(".")[:2])
+    lo, hi = STREAMLIT_TESTED
+    if not lo <= version <= hi and not allow_untested:
+        raise RuntimeError(f"streamlit {streamlit.__version__} non verificato con il load test "
+                           f"(testato {lo[0]}.{lo[1]}-{hi[0]}.{hi[1]}): usare --allow-untested-streamlit")
+
+
+def _share_runtime(allow_untested=False):
+    # AppTest è pensato per un test alla volta:
+    # - imposta e poi azzera Runtime._instance (singleton di processo) a ogni run e
+    #   patcha config.get_option per global.appTest: con più sessioni in parallelo la run
+    #   che termina toglierebbe entrambi a quelle ancora in corso;
+    # - crea una ScriptCache per run, ricompilando app.py a ogni rerun (il server la
+    #   condivide tra le sessioni; in 3.11 ast.parse concorrente può anche fallire).
+    # Qui l'opzione resta attiva per tutto il processo, la cache del bytecode è unica e
+    # le sessioni ripiegano sull'ultimo runtime fittizio visto.
+    _check_streamlit(allow_untested)
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    config.set_option("global.appTest", True)
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+        elif not last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return cls._instance or last[0]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last))
+
+
+class Session:
+    # una sessione browser: un AppTest con il proprio session_state
+    def __init__(self, stats):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP, default_timeout=RUN_TIMEOUT_S)
+        self.stats = stats
+
+    def step(self, name, action=None):
+        t0 = time.perf_counter()
+        if action is None:
+            self.at.run()
+        else:
+            action.run()
+        self.stats.record(name, (time.perf_counter() - t0) * 1000, self.at)
+
+    def login(self, username):
+        # utenti sintetici e demo hanno la stessa password
+        self.at.sidebar.text_input(key="login_user").input(username)
+        self.at.sidebar.text_input(key="login_pass").input(synthetic.PASSWORD)
+        self.step("login", _by_label(self.at.sidebar.button, "Login").click())
+        if self.at.session_state["user"] is None:
+            raise JourneyError(f"login fallito per {username}")
+
+
+def patient_journey(sess, username, rnd):
+    sess.step("home")
+    sess.login(username)
+    at = sess.at
+    _by_label(at.text_area, "Dettagli").input(f"load test {rnd.random():.6f}")
+    sess.step("submit_request", _by_label(at.button, "Invia Richiesta").click())
+    if any(s.label == "Seleziona chat" for s in at.selectbox):
+        at.text_input(key="pat_msg").input(f"messaggio {rnd.randint(0, 10 ** 6)}")
+        sess.step("send_chat", at.button(key="pat_send").click())
+
+
+def pro_journey(sess, username, rnd):
+    sess.step("home")
+    sess.login(username)
+    at = sess.at
+    sess.step("refresh", _by_label(at.button, "Aggiorna").click())
+    open_rows = at.dataframe[0].value if len(at.dataframe) else None
+    if open_rows is None or open_rows.empty:
+        return
+    req_id = int(rnd.choice(list(open_rows["ID"][:10])))
+    _by_label(at.number_input, "ID richiesta da accettare").set_value(req_id)
+    sess.step("accept", _by_label(at.button, "Accetta").click())
+    if any("non disponibile" in e.value for e in at.error):
+        sess.stats.count("claim_conflicts")
+
+
+JOURNEYS = {"paziente": patient_journey, "professionista": pro_journey}
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = {}
+        self.counters = {"journeys": 0, "failed_journeys": 0, "lock_errors": 0, "exceptions": 0, "claim_conflicts": 0}
+        self.errors = []
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def record(self, name, ms, at):
+        locks = others = 0
+        for ex in at.exception:
+            text = ex.message + " " + "".join(ex.stack_trace or ())
+            if any(m in text for m in LOCK_MARKERS):
+                locks += 1
+            else:
+                others += 1
+            self._error(f"{name}: {ex.message}")
+        locks += sum(1 for e in at.error if any(m in e.value for m in LOCK_MARKERS))
+        with self._lock:
+            self.steps.setdefault(name, []).append(ms)
+            self.counters["lock_errors"] += locks
+            self.counters["exceptions"] += others
+
+    def _error(self, msg):
+        with self._lock:
+            if len(self.errors) < 20:
+                self.errors.append(msg)
+
+
+def _concurrently(roles, body):
+    # una thread per sessione, partenza insieme; body(i, role) esegue i percorsi
+    start = threading.Barrier(len(roles))
+
+    def worker(i, role):
+        start.wait()
+        body(i, role)
+
+    threads = [threading.Thread(target=worker, args=(i, role), name=f"load-{i}") for i, role in enumerate(roles)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def _journey(stats, role, username, rnd):
+    try:
+        JOURNEYS[role](Session(stats), username, rnd)
+        stats.count("journeys")
+    except Exception as ex:
+        # il percorso si interrompe (widget mancante, run fallita): la sessione ne apre un altro
+        stats.count("failed_journeys")
+        stats._error(f"{role}: {type(ex).__name__}: {ex}")
+
+
+def cold_start(roles, seed):
+    # installazione nuova: nessun file DB, pool hash mai avviato, risorse da ricreare.
+    # Il primo rerun di ogni sessione fa bootstrap (migrazioni + seed con hash nel pool)
+    # e costruisce la mappa; poi login con gli utenti demo.
+    db.configure(os.path.join(tempfile.mkdtemp(prefix="cc_cold_"), "cold.db"))
+    hashing.pool.shutdown()
+    resources._state.update(db_ready=False, profile_index=None)
+    maps.invalidate()
+    stats = Stats()
+
+    def body(i, role):
+        _journey(stats, role, DEMO_USERS[role], random.Random(seed * 1000 + i))
+
+    elapsed = _concurrently(roles, body)
+    with db.connection() as conn:
+        users = conn.execute("SELECT count(*) FROM users").fetchone()[0]
+    return {"elapsed_s": round(elapsed, 3), "demo_users": users, **stats.counters,
+            "steps": {name: _summary(ms) for name, ms in sorted(stats.steps.items())}, "errors": stats.errors}
+
+
+def _seed(n_users, n_requests, n_messages, seed):
+    db.configure(os.path.join(tempfile.mkdtemp(prefix="cc_load_"), "load.db"))
+    resources.bootstrap_db(force=True)
+    gen = synthetic.generate(n_users, n_requests, n_messages, seed)
+    with db.connection() as conn:
+        # pazienti con una chat attiva, professionisti con richieste pubbliche aperte in città
+        pats = [r[0] for r in conn.execute("""SELECT DISTINCT u.username FROM users u JOIN requests r ON r.patient_id = u.id
+                                              WHERE u.username LIKE 'syn_pat_%' AND r.status='In Carico' ORDER BY u.id""")]
+        pros = [r[0] for r in conn.execute("""SELECT u.username FROM users u WHERE u.username LIKE 'syn_pro_%'
+                                              AND EXISTS (SELECT 1 FROM requests r WHERE r.city=u.city AND r.status='Aperta'
+                                                          AND r.target_pro_id IS NULL) ORDER BY u.id""")]
+    return gen, pats, pros
+
+
+def run(n_sessions=8, n_journeys=5, pro_share=0.5, n_users=1000, n_requests=5000, n_messages=20000, seed=42,
+        allow_untested=False):
+    n_pro = round(n_sessions * pro_share)
+    roles = ["professionista"] * n_pro + ["paziente"] * (n_sessions - n_pro)
+    _share_runtime(allow_untested)
+    # prima la partenza a freddo: il seed sintetico qui sotto avvierebbe già il pool hash
+    cold = cold_start(roles, seed)
+
+    gen, pats, pros = _seed(n_users, n_requests, n_messages, seed)
+    stats = Stats()
+
+    def body(i, role):
+        rnd = random.Random(seed * 1000 + i)
+        users = pros if role == "professionista" else pats
+        for _ in range(n_journeys):
+            _journey(stats, role, rnd.choice(users), rnd)
+
+    # warm-up: mappa della Home e statement cache del nuovo DB prima delle misure
+    Session(Stats()).step("warmup")
+    elapsed = _concurrently(roles, body)
+
+    all_ms = [ms for v in stats.steps.values() for ms in v]
+    return {
+        "meta": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count(),
+                 "sessions": n_sessions, "pro_sessions": n_pro, "journeys_per_session": n_journeys, "seed": seed,
+                 "created": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "dataset": gen,
+        "elapsed_s": round(elapsed, 3),
+        "reruns_per_s": round(len(all_ms) / elapsed, 2),
+        "journeys_per_s": round(stats.counters["journeys"] / elapsed, 2),
+        **stats.counters,
+        "reruns": _summary(all_ms),
+        "steps": {name: _summary(ms) for name, ms in sorted(stats.steps.items())},
+        "errors": stats.errors,
+        "cold_start": cold,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load test di app.py con sessioni Streamlit concorrenti")
+    ap.add_argument("--sessions", type=int, default=8, help="sessioni simultanee")
+    ap.add_argument("--journeys", type=int, default=5, help="percorsi per sessione")
+    ap.add_argument("--pro-share", type=float, default=0.5, help="quota di sessioni professionista")
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--messages", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="scrive i risultati JSON su file (default: stdout)")
+    ap.add_argument("--allow-untested-streamlit", action="store_true",
+                    help="esegue anche con versioni di Streamlit non verificate")
+    args = ap.parse_args(argv)
+    try:
+        res = run(args.sessions, args.journeys, args.pro_share, args.users, args.requests, args.messages, args.seed,
+                  args.allow_untested_streamlit)
+    finally:
+        hashing.pool.shutdown()
+    text = json.dumps(res, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    cold = res["cold_start"]
+    print(f"partenza a freddo: {cold['journeys']} percorsi ok, {cold['failed_journeys']} falliti, "
+          f"{cold['exceptions']} eccezioni in {cold['elapsed_s']} s", file=sys.stderr)
+    print(f"{args.sessions} sessioni: {res['reruns_per_s']} rerun/s, "
+          f"p95 {res['reruns']['p95_ms']} ms, errori di lock {res['lock_errors']}", file=sys.stderr)
+    failed = [r for r in (res, cold) if r["lock_errors"] or r["exceptions"] or r["failed_journeys"]]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
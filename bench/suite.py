@@ -0,0 +1,153 @@
+# --- SUITE BENCHMARK DATA LAYER ---
+# Per ogni dimensione di dataset genera un DB sintetico (bench/synthetic.py) in una
+# cartella temporanea e misura le funzioni del backend usate da app.py. Output JSON;
+# con --baseline confronta le mediane con un file salvato e fallisce se una funzione
+# rallenta oltre la tolleranza.
+# Uso: python -m bench.suite [--sizes small,medium] [--out risultati.json]
+#                            [--baseline bench/baseline.json] [--save-baseline]
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db
+import hashing
+import resources
+from bench import synthetic
+
+SIZES = {
+    "small": (1000, 5000, 20000),
+    "medium": (10000, 50000, 200000),
+    "large": (50000, 250000, 1000000),
+}
+REPEATS = 30
+SLOW_REPEATS = 5            # autenticazione (pbkdf2) e mappa
+TOLERANCE = 0.25            # +25% sulla mediana
+ABS_FLOOR_MS = 0.5          # sotto questa differenza non si segnala (rumore)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _timeit(fn, args_list):
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    n = len(samples)
+    return {"n": n, "p50_ms": round(samples[n // 2], 3), "p95_ms": round(samples[min(n - 1, int(n * 0.95))], 3),
+            "mean_ms": round(sum(samples) / n, 3)}
+
+
+def run_size(name, seed=42, repeats=REPEATS):
+    from backend import (authenticate, get_pro_open_jobs, get_pro_my_jobs, get_patient_history,
+                         get_chat_history, send_chat_msg, accept_request, get_landing_pros)
+    from maps import create_map_html
+
+    n_users, n_requests, n_messages = SIZES[name]
+    tmp = tempfile.mkdtemp(prefix=f"cc_bench_{name}_")
+    db.configure(os.path.join(tmp, "bench.db"))
+    resources.bootstrap_db(force=True)
+    gen = synthetic.generate(n_users, n_requests, n_messages, seed)
+
+    rnd = random.Random(seed)
+    with db.connection() as conn:
+        pros = conn.execute("SELECT id, username, city FROM users WHERE username LIKE 'syn_pro_%' ORDER BY id").fetchall()
+        pats = conn.execute("SELECT id, username FROM users WHERE username LIKE 'syn_pat_%' ORDER BY id").fetchall()
+        chats = [r[0] for r in conn.execute("SELECT id FROM requests WHERE status='In Carico' ORDER BY id")]
+        busy = [r[0] for r in conn.execute("SELECT professional_id FROM requests WHERE status='In Carico' GROUP BY 1 ORDER BY count(*) DESC LIMIT 50")]
+        # richieste pubbliche aperte con un professionista della stessa città
+        open_public = conn.execute("""SELECT r.id, r.city FROM requests r
+                                      WHERE r.status='Aperta' AND r.target_pro_id IS NULL ORDER BY r.id""").fetchall()
+    pro_by_city = {}
+    for pid, _, city in pros:
+        pro_by_city.setdefault(city, pid)
+    claims = [(rid, pro_by_city[city], city) for rid, city in rnd.sample(open_public, min(repeats, len(open_public))) if city in pro_by_city]
+
+    sample = lambda rows, k=repeats: [rnd.choice(rows) for _ in range(k)]
+    results = {}
+    results["authenticate"] = _timeit(authenticate, [(u[1], synthetic.PASSWORD) for u in sample(pats, SLOW_REPEATS)])
+    results["get_pro_open_jobs"] = _timeit(get_pro_open_jobs, [(p[2], p[0]) for p in sample(pros)])
+    results["get_pro_my_jobs"] = _timeit(get_pro_my_jobs, [(pid,) for pid in sample(busy)])
+    results["get_patient_history"] = _timeit(get_patient_history, [(p[0],) for p in sample(pats)])
+    results["get_chat_history"] = _timeit(get_chat_history, [(rid,) for rid in sample(chats)])
+    results["send_chat_msg"] = _timeit(send_chat_msg, [(rid, 1, "benchmark") for rid in sample(chats)])
+    results["accept_request"] = _timeit(accept_request, claims)
+    landing = get_landing_pros()
+    results["create_map_html"] = _timeit(create_map_html, [(landing,)] * SLOW_REPEATS)
+    return {"dataset": gen, "functions": results}
+
+
+def run(sizes=("small",), seed=42):
+    out = {"meta": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                    "machine": platform.machine(), "cpus": os.cpu_count(), "seed": seed,
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S")},
+           "sizes": {}}
+    for name in sizes:
+        out["sizes"][name] = run_size(name, seed)
+    return out
+
+
+def compare(current, baseline, tolerance=TOLERANCE, floor_ms=ABS_FLOOR_MS):
+    # [(dimensione, funzione, baseline p50, attuale p50)] per le sole regressioni
+    regressions = []
+    for size, res in current["sizes"].items():
+        base = baseline.get("sizes", {}).get(size)
+        if not base:
+            continue
+        for fn, stats in res["functions"].items():
+            ref = base["functions"].get(fn)
+            if not ref:
+                continue
+            if stats["p50_ms"] > ref["p50_ms"] * (1 + tolerance) and stats["p50_ms"] - ref["p50_ms"] > floor_ms:
+                regressions.append((size, fn, ref["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark delle funzioni del data layer")
+    ap.add_argument("--sizes", default="small", help=f"elenco separato da virgole tra {', '.join(SIZES)}")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="scrive i risultati JSON su file (default: stdout)")
+    ap.add_argument("--baseline", help="confronta con un file di baseline")
+    ap.add_argument("--save-baseline", action="store_true", help=f"salva i risultati come baseline ({DEFAULT_BASELINE})")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = ap.parse_args(argv)
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        ap.error(f"dimensioni sconosciute: {', '.join(unknown)}")
+    try:
+        res = run(sizes, args.seed)
+    finally:
+        hashing.pool.shutdown()
+
+    text = json.dumps(res, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.baseline or DEFAULT_BASELINE, "w") as f:
+            f.write(text + "\n")
+        print(f"baseline salvata in {args.baseline or DEFAULT_BASELINE}", file=sys.stderr)
+        return 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(res, json.load(f), args.tolerance)
+        for size, fn, ref, cur in regressions:
+            print(f"REGRESSIONE {size}/{fn}: p50 {ref} ms -> {cur} ms", file=sys.stderr)
+        if regressions:
+            return 1
+        print("nessuna regressione rispetto alla baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# --- DATI SINTETICI ---
+# Generatore deterministico (stesso seed -> stesso DB) di utenti distribuiti sulle
+# città di CITY_COORDS, richieste con un mix realistico di stati ed esclusive, e
+# messaggi sulle richieste in carico. Inserimenti con executemany a blocchi; tutti
+# gli utenti hanno la stessa password, hashata una sola volta.
+# Uso: python -m bench.synthetic --db /tmp/synt.db [--users 10000] [--requests 50000] [--messages 200000]
+import argparse
+import datetime
+import random
+import sys
+import time
+
+from config import CITY_COORDS, INTERVENTION_MAPPING
+import db
+import hashing
+import resources
+
+PASSWORD = "pass"
+PRO_SHARE = 0.3
+STATUS_MIX = (("Aperta", 0.45), ("In Carico", 0.55))
+EXCLUSIVE_SHARE = 0.08
+BASE_DATE = datetime.datetime(2024, 1, 1)
+CHUNK = 20000
+
+# città pesate grossomodo per popolazione: le prime della lista ricevono più utenti
+_CITY_WEIGHTS = [1.0 / (1 + i * 0.3) for i in range(len(CITY_COORDS))]
+
+_WORDS = ("dolore", "schiena", "anca", "ginocchio", "diabete", "insulina", "pressione", "medicazione",
+          "ferita", "febbre", "tosse", "notte", "spesa", "pasti", "igiene", "bagno", "deambulazione",
+          "ansia", "terapia", "controllo", "prelievo", "catetere", "fisioterapia", "esercizi", "caduta")
+
+
+def _text(rnd, n):
+    return " ".join(rnd.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), CHUNK):
+        yield rows[i:i + CHUNK]
+
+
+def generate(n_users=1000, n_requests=5000, n_messages=20000, seed=42, log=None):
+    # popola il DB corrente (db.configure) e ritorna un riepilogo con i tempi
+    rnd = random.Random(seed)
+    t0 = time.perf_counter()
+    cities = list(CITY_COORDS)
+    types = list(INTERVENTION_MAPPING)
+    pwd = hashing.hash_password(PASSWORD)
+
+    users = []
+    for i in range(n_users):
+        city = rnd.choices(cities, _CITY_WEIGHTS)[0]
+        lat, lon = CITY_COORDS[city]
+        lat, lon = lat + rnd.gauss(0, 0.05), lon + rnd.gauss(0, 0.05)
+        if rnd.random() < PRO_SHARE:
+            qual = rnd.choice(INTERVENTION_MAPPING[rnd.choice(types)])
+            users.append((f"syn_pro_{i}", pwd, "professionista", city, lat, lon, _text(rnd, 8), qual,
+                          rnd.randint(0, 30), round(rnd.uniform(10, 45), 2), _text(rnd, 20)))
+        else:
+            users.append((f"syn_pat_{i}", pwd, "paziente", city, lat, lon, _text(rnd, 6), None, 0, 0, None))
+    with db.transaction() as conn:
+        for part in _chunks(users):
+            conn.executemany("""INSERT INTO users (username, password, role, city, lat, lon, bio, qualification,
+                                                   experience, hourly_rate, detailed_experience)
+                                VALUES (?,?,?,?,?,?,?,?,?,?,?)""", part)
+        rows = conn.execute("SELECT id, role, city, qualification FROM users WHERE username LIKE 'syn_%' ORDER BY id").fetchall()
+    patients = [r for r in rows if r[1] == "paziente"]
+    pros = [r for r in rows if r[1] == "professionista"]
+    pros_by_city = {}
+    for r in pros:
+        pros_by_city.setdefault(r[2], []).append(r[0])
+    t_users = time.perf_counter()
+
+    requests = []
+    statuses, weights = zip(*STATUS_MIX)
+    for i in range(n_requests):
+        pid, _, city, _ = rnd.choice(patients)
+        status = rnd.choices(statuses, weights)[0]
+        local = pros_by_city.get(city) or [r[0] for r in pros]
+        target = rnd.choice(local) if local and rnd.random() < EXCLUSIVE_SHARE else None
+        professional = (target or rnd.choice(local)) if status == "In Carico" and local else None
+        if status == "In Carico" and professional is None:
+            status = "Aperta"
+        created = (BASE_DATE + datetime.timedelta(minutes=i * 7)).date()
+        requests.append((pid, professional, target, rnd.choice(types), _text(rnd, 12), city, status, str(created)))
+    with db.transaction() as conn:
+        for part in _chunks(requests):
+            conn.executemany("""INSERT INTO requests (patient_id, professional_id, target_pro_id, intervention_type,
+                                                      description, city, status, created_at)
+                                VALUES (?,?,?,?,?,?,?,?)""", part)
+        active = conn.execute("SELECT id, patient_id, professional_id FROM requests WHERE status='In Carico' ORDER BY id").fetchall()
+    t_requests = time.perf_counter()
+
+    messages = []
+    if active:
+        # conversazioni di lunghezza variabile: poche chat molto lunghe, molte brevi
+        for i in range(n_messages):
+            rid, pat, pro = active[min(len(active) - 1, int(rnd.paretovariate(1.2)) - 1) if rnd.random() < 0.3 else rnd.randrange(len(active))]
+            ts = BASE_DATE + datetime.timedelta(seconds=i * 37)
+            messages.append((rid, pat if i % 2 else pro, _text(rnd, rnd.randint(3, 15)), str(ts)))
+    with db.transaction() as conn:
+        for part in _chunks(messages):
+            conn.executemany("INSERT INTO messages (request_id, sender_id, content, timestamp) VALUES (?,?,?,?)", part)
+    t_messages = time.perf_counter()
+    # niente ANALYZE/PRAGMA optimize: come db.migrate, i benchmark misurano i piani
+    # senza sqlite_stat1 che la produzione usa
+
+    out = {"seed": seed, "users": len(users), "professionals": len(pros), "requests": len(requests),
+           "in_progress": len(active), "messages": len(messages),
+           "users_s": round(t_users - t0, 3), "requests_s": round(t_requests - t_users, 3),
+           "messages_s": round(t_messages - t_requests, 3), "total_s": round(t_messages - t0, 3)}
+    if log:
+        log(out)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera un DB sintetico deterministico")
+    ap.add_argument("--db", required=True)
+    ap.add_argument("--users", type=int, default=10000)
+    ap.add_argument("--requests", type=int, default=50000)
+    ap.add_argument("--messages", type=int, default=200000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+    db.configure(args.db)
+    resources.bootstrap_db()
+    try:
+        print(generate(args.users, args.requests, args.messages, args.seed))
+    finally:
+        hashing.pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
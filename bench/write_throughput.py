@@ -0,0 +1,92 @@
+# --- BENCHMARK SCRITTURE CHAT ---
+# N thread (sessioni) inviano M messaggi ciascuno: confronta il commit per singola
+# chiamata con il writer a group commit (writer.py). Riporta messaggi/s, latenza
+# per messaggio, errori di lock e dimensione media dei lotti.
+# Uso: python -m bench.write_throughput [--threads 16] [--messages 200] [--delay-ms 3]
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import resources
+from backend import _insert_message
+from writer import GroupCommitWriter
+
+
+def _direct(req_id, uid, msg):
+    with db.transaction() as conn:
+        return _insert_message(conn, req_id, uid, msg, str(datetime.datetime.now()))
+
+
+def _pct(vals, q):
+    vals = sorted(vals)
+    return round(vals[min(len(vals) - 1, int(len(vals) * q))] * 1000, 2) if vals else None
+
+
+def run_mode(mode, req_id, n_threads, n_messages, delay_ms):
+    w = GroupCommitWriter(max_delay_ms=delay_ms, enabled=True) if mode == "group" else None
+    send = (lambda *a: w.run(_insert_message, *a, str(datetime.datetime.now()))) if w else _direct
+    lat, errors = [], []
+    start = threading.Barrier(n_threads)
+
+    def worker(uid):
+        start.wait()
+        mine = []
+        for i in range(n_messages):
+            t0 = time.perf_counter()
+            try:
+                send(req_id, uid, f"{mode} {uid} {i}")
+            except sqlite3.OperationalError as ex:
+                errors.append(str(ex))
+            mine.append(time.perf_counter() - t0)
+        lat.extend(mine)
+
+    threads = [threading.Thread(target=worker, args=(uid,)) for uid in range(1, n_threads + 1)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    out = {"mode": mode, "messages": len(lat) - len(errors), "lock_errors": len(errors), "elapsed_s": round(elapsed, 3),
+           "msgs_per_s": round((len(lat) - len(errors)) / elapsed, 1), "p50_ms": _pct(lat, 0.5), "p95_ms": _pct(lat, 0.95)}
+    if w:
+        ws = w.stats()
+        w.shutdown()
+        out.update(commits=ws["batches"], avg_batch=ws["avg_batch"])
+    else:
+        out.update(commits=len(lat) - len(errors), avg_batch=1)
+    return out
+
+
+def run(n_threads=16, n_messages=200, delay_ms=3.0):
+    tmp = tempfile.mkdtemp(prefix="cc_writes_")
+    db.configure(os.path.join(tmp, "writes.db"))
+    resources.bootstrap_db(force=True)
+    with db.transaction() as conn:
+        req_id = conn.execute("INSERT INTO requests (patient_id, intervention_type, description, city, status, created_at) VALUES (1, 'Assistenza Infermieristica', 'bench', 'Milano', 'In Carico', '2024-01-01')").lastrowid
+    results = [run_mode(m, req_id, n_threads, n_messages, delay_ms) for m in ("direct", "group")]
+    with db.connection() as conn:
+        stored = conn.execute("SELECT count(*) FROM messages WHERE request_id=?", (req_id,)).fetchone()[0]
+    return results, stored
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--messages", type=int, default=200, help="messaggi per thread")
+    ap.add_argument("--delay-ms", type=float, default=3.0, help="attesa massima per completare un lotto")
+    args = ap.parse_args()
+    results, stored = run(args.threads, args.messages, args.delay_ms)
+    for r in results:
+        print("  ".join(f"{k}={v}" for k, v in r.items()))
+    expected = sum(r["messages"] for r in results)
+    print(f"messaggi salvati: {stored} (attesi {expected})")
+    speedup = results[1]["msgs_per_s"] / results[0]["msgs_per_s"] if results[0]["msgs_per_s"] else float("nan")
+    print(f"group commit: {speedup:.1f}x messaggi/s rispetto al commit per chiamata")
+    sys.exit(0 if stored == expected else 1)
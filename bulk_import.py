@@ -0,0 +1,184 @@
+# --- IMPORT MASSIVO UTENTI ---
+# Importa professionisti e pazienti da CSV o Parquet leggendo il file a blocchi:
+# ogni blocco viene validato, le password sono hashate in parallelo sul pool di
+# thread (hashing.pool.map_hash) e le righe inserite con executemany in un'unica
+# transazione. Gli username già presenti (nel DB o ripetuti nel file) vengono
+# segnalati senza interrompere l'import. Il server non va avvisato: i trigger su users
+# incrementano data_versions('pros') (la mappa della Home si ricostruisce al rerun
+# successivo) e mettono i professionisti in pro_embedding_queue (indice profili).
+#
+# Uso: python bulk_import.py roster.csv [--db home_care_v21.db] [--chunk 5000] [--default-role professionista]
+import argparse
+import csv
+import os
+import sys
+import time
+
+from config import DB_NAME, CITY_COORDS, ALL_QUALIFICATIONS
+import db
+import hashing
+import resources
+
+ROLES = ("paziente", "professionista")
+COLUMNS = ("username", "password", "role", "city", "lat", "lon", "bio", "qualification", "experience",
+           "hourly_rate", "email", "address", "age", "clinical_history", "detailed_experience")
+INSERT_SQL = f"INSERT OR IGNORE INTO users ({', '.join(COLUMNS)}) VALUES ({','.join('?' * len(COLUMNS))})"
+
+
+def _blank(v):
+    return v is None or (isinstance(v, str) and not v.strip()) or v != v   # v != v: NaN da Parquet
+
+
+def _num(v, cast, field):
+    if _blank(v):
+        return None
+    try:
+        return cast(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} non numerico: {v!r}")
+
+
+def validate_row(raw, default_role=None):
+    # Ritorna la tupla per INSERT (password in chiaro, hashata dopo) o solleva ValueError
+    row = {k: (raw.get(k) if not _blank(raw.get(k)) else None) for k in COLUMNS}
+    username = str(row["username"]).strip() if row["username"] else None
+    if not username:
+        raise ValueError("username mancante")
+    if not row["password"]:
+        raise ValueError("password mancante")
+    role = (row["role"] or default_role or "").strip().lower()
+    if role not in ROLES:
+        raise ValueError(f"ruolo non valido: {row['role']!r}")
+    city = str(row["city"]).strip() if row["city"] else None
+    lat, lon = _num(row["lat"], float, "lat"), _num(row["lon"], float, "lon")
+    if lat is None or lon is None:
+        if city not in CITY_COORDS:
+            raise ValueError(f"città sconosciuta senza lat/lon: {city!r}")
+        lat, lon = CITY_COORDS[city]
+    elif not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"coordinate fuori intervallo: {lat}, {lon}")
+    if role == "professionista":
+        qual = row["qualification"]
+        if qual not in ALL_QUALIFICATIONS:
+            raise ValueError(f"qualifica non valida: {qual!r}")
+        experience = _num(row["experience"], int, "experience") or 0
+        rate = _num(row["hourly_rate"], float, "hourly_rate") or 0
+    else:
+        qual, experience, rate = None, 0, 0
+    return (username, str(row["password"]), role, city, lat, lon, row["bio"], qual, experience, rate,
+            row["email"], row["address"], _num(row["age"], int, "age"), row["clinical_history"], row["detailed_experience"])
+
+
+def read_chunks(path, chunk):
+    # dict per riga, a blocchi di `chunk`; Parquet richiede pyarrow (opzionale)
+    if path.lower().endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("per importare file Parquet installa pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk):
+            yield batch.to_pylist()
+        return
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        buf = []
+        for rec in csv.DictReader(f):
+            buf.append(rec)
+            if len(buf) >= chunk:
+                yield buf
+                buf = []
+        if buf:
+            yield buf
+
+
+def import_rows(chunks, default_role=None, log=print):
+    report = {"read": 0, "inserted": 0, "duplicates": [], "invalid": [], "professionals": 0}
+    seen = set()
+    started = time.perf_counter()
+    line = 1
+    with db.connection() as conn:
+        for rows in chunks:
+            valid = []
+            for raw in rows:
+                line += 1
+                report["read"] += 1
+                try:
+                    rec = validate_row(raw, default_role)
+                except ValueError as ex:
+                    report["invalid"].append((line, raw.get("username"), str(ex)))
+                    continue
+                key = rec[0].lower()
+                if key in seen:
+                    report["duplicates"].append((line, rec[0], "ripetuto nel file"))
+                    continue
+                seen.add(key)
+                valid.append((line, rec))
+            if valid:
+                names = [rec[0].lower() for _, rec in valid]
+                existing = {r[0] for r in conn.execute(
+                    f"SELECT lower(username) FROM users WHERE lower(username) IN ({','.join('?' * len(names))})", names)}
+                fresh = []
+                for ln, rec in valid:
+                    if rec[0].lower() in existing:
+                        report["duplicates"].append((ln, rec[0], "già presente"))
+                    else:
+                        fresh.append(rec)
+                hashed = hashing.pool.map_hash([rec[1] for rec in fresh])
+                payload = [rec[:1] + (h,) + rec[2:] for rec, h in zip(fresh, hashed)]
+                with db.transaction():
+                    # rowcount conta solo le righe di users (non quelle scritte dai trigger);
+                    # le righe ignorate sono username inseriti nel frattempo da un'altra sessione
+                    inserted = conn.executemany(INSERT_SQL, payload).rowcount
+                report["inserted"] += inserted
+                if inserted < len(payload):
+                    report["duplicates"].append((None, None, f"{len(payload) - inserted} username registrati durante l'import"))
+                report["professionals"] += sum(1 for rec in fresh if rec[2] == "professionista")
+            elapsed = time.perf_counter() - started
+            log(f"  {report['read']} righe lette, {report['inserted']} inserite ({report['read'] / elapsed:.0f} righe/s)")
+    report["elapsed_s"] = round(time.perf_counter() - started, 3)
+    report["rows_per_s"] = round(report["read"] / report["elapsed_s"], 1) if report["elapsed_s"] else None
+    return report
+
+
+def refresh_derived(report):
+    # solo se l'import gira nel processo del server con il modello già caricato: codifica
+    # subito la coda dei profili invece di attendere la prossima ricerca AI. Da riga di
+    # comando non c'è nulla da fare (cache di mappa e indice vivono nel server).
+    if not report["professionals"]:
+        return
+    if resources.model_loaded():
+        resources.get_profile_index().update()
+
+
+def import_file(path, chunk=5000, default_role=None, log=print):
+    report = import_rows(read_chunks(path, chunk), default_role, log)
+    refresh_derived(report)
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Import massivo di utenti da CSV/Parquet")
+    ap.add_argument("path")
+    ap.add_argument("--db", default=DB_NAME)
+    ap.add_argument("--chunk", type=int, default=5000, help="righe per blocco/transazione")
+    ap.add_argument("--default-role", choices=ROLES, help="ruolo per le righe senza colonna role")
+    args = ap.parse_args(argv)
+    if not os.path.exists(args.path):
+        print(f"File non trovato: {args.path}", file=sys.stderr)
+        return 1
+    db.configure(args.db)
+    resources.bootstrap_db()
+    try:
+        rep = import_file(args.path, args.chunk, args.default_role)
+    finally:
+        hashing.pool.shutdown()
+    print(f"Lette {rep['read']}, inserite {rep['inserted']}, duplicate {len(rep['duplicates'])}, "
+          f"non valide {len(rep['invalid'])} in {rep['elapsed_s']}s ({rep['rows_per_s']} righe/s)")
+    for ln, user, why in rep["duplicates"][:50]:
+        print(f"  riga {ln}: duplicato '{user}' ({why})" if ln else f"  {why}")
+    for ln, user, why in rep["invalid"][:50]:
+        print(f"  riga {ln}: '{user}' non valida: {why}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
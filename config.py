@@ -0,0 +1,26 @@
+import os
+
+# --- CONFIG ---
+DB_NAME = "home_care_v21.db"
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+CACHE_DIR = os.environ.get("CARECONNECT_CACHE_DIR", ".cache")
+
+# --- COSTANTI E DATI ---
+INTERVENTION_MAPPING = {
+    "Assistenza Infermieristica": ["Infermiere"],
+    "Riabilitazione Motoria / Fisioterapia": ["Fisioterapista"],
+    "Igiene e Cura Personale": ["OSS", "Badante"],
+    "Supporto Notturno": ["OSS", "Badante"],
+    "Preparazione Pasti e Spesa": ["Badante", "OSA"],
+    "Visita Medica": ["Medico"],
+    "Supporto Psicologico": ["Psicologo"]
+}
+
+KNOWLEDGE_BASE = list(INTERVENTION_MAPPING.keys())
+ALL_QUALIFICATIONS = list(set([q for sublist in INTERVENTION_MAPPING.values() for q in sublist]))
+
+CITY_COORDS = {
+    "Milano": (45.4642, 9.1900), "Roma": (41.9028, 12.4964), "Napoli": (40.8518, 14.2681),
+    "Torino": (45.0703, 7.6869), "Firenze": (43.7696, 11.2558), "Bologna": (44.4949, 11.3426),
+    "Palermo": (38.1157, 13.3615), "Bari": (41.1171, 16.8719)
+}
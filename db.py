@@ -0,0 +1,612 @@
+import math
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from hashing import hash_password
+from config import DB_NAME
+import metrics
+import queries
+
+# --- CONNESSIONI ---
+# Pool di connessioni riutilizzabili condiviso dai thread di script di Streamlit.
+# Ogni connessione viene configurata una sola volta con i PRAGMA di produzione
+# (WAL, synchronous=NORMAL, busy_timeout, cache e mmap) e ha una statement cache.
+# Un thread che ha già una connessione in uso la riceve di nuovo per le chiamate
+# annidate (es. accept_request -> get_pro_open_jobs), senza aprirne altre.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-20000",      # ~20 MB di page cache per connessione
+    "PRAGMA mmap_size=268435456",    # 256 MB
+    "PRAGMA temp_store=MEMORY",
+)
+POOL_SIZE = int(os.environ.get("CARECONNECT_DB_POOL", "16"))
+STATEMENT_CACHE = 256
+
+
+def _sql_haversine_km(lat1, lon1, lat2, lon2):
+    # funzione SQL haversine_km(...) registrata su ogni connessione (vedi geo.py)
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _TimedCursor(sqlite3.Cursor):
+    # tempi di execute e righe lette per SQL normalizzato (metrics.py), usato solo a metriche attive
+    _sql = None
+
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        super().execute(sql, params)
+        self._sql = sql
+        metrics.observe_sql(self.connection, sql, params, (time.perf_counter() - t0) * 1000)
+        return self
+
+    def executemany(self, sql, seq):
+        t0 = time.perf_counter()
+        super().executemany(sql, seq)
+        metrics.observe_sql(self.connection, sql, None, (time.perf_counter() - t0) * 1000, max(self.rowcount, 0))
+        return self
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._sql is not None:
+            metrics.add_rows(self._sql, len(rows))
+        return rows
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        if self._sql is not None:
+            metrics.add_rows(self._sql, len(rows))
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if self._sql is not None and row is not None:
+            metrics.add_rows(self._sql, 1)
+        return row
+
+
+class _PooledConnection(sqlite3.Connection):
+    generation = 0
+
+    # Con le metriche spente si usano i cursori nativi; accese, il cursore strumentato
+    # (Connection.execute in C non passa da cursor(), quindi va ridefinito anche lui)
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = _TimedCursor if metrics.enabled else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        if not metrics.enabled:
+            return super().execute(sql, params)
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        if not metrics.enabled:
+            return super().executemany(sql, seq)
+        return self.cursor().executemany(sql, seq)
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE,
+                               factory=_PooledConnection)
+        for p in PRAGMAS:
+            conn.execute(p)
+        conn.create_function("haversine_km", 4, _sql_haversine_km, deterministic=True)
+        conn.generation = self._generation
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _acquire(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if conn.generation == self._generation:
+                return conn
+            conn.close()
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if conn.generation != self._generation:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self, immediate: bool = True):
+        with self.connection() as conn:
+            if conn.in_transaction:
+                # transazione già aperta dal chiamante: ci uniamo a quella
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def in_transaction(self) -> bool:
+        held = getattr(self._local, "conn", None)
+        return held is not None and held.in_transaction
+
+    def close_all(self):
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = ConnectionPool(DB_NAME)
+
+
+def configure(path: str):
+    # Punta il pool su un altro file (DB temporanei, benchmark, tool da riga di comando)
+    global _pool
+    _pool.close_all()
+    _pool = ConnectionPool(path)
+
+
+def db_path() -> str:
+    return _pool.path
+
+
+def connection():
+    return _pool.connection()
+
+
+def transaction(immediate: bool = True):
+    return _pool.transaction(immediate)
+
+
+def in_transaction() -> bool:
+    # True se il thread corrente ha già una transazione aperta sul pool
+    return _pool.in_transaction()
+
+
+def close_all():
+    _pool.close_all()
+
+
+def delete_db_files():
+    close_all()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(_pool.path + suffix):
+            os.remove(_pool.path + suffix)
+
+
+# ricostruzione completa delle tabelle stats_* (backfill della migrazione 10 e stats.reconcile)
+STATS_REBUILD = [
+    "DELETE FROM stats_requests",
+    '''INSERT INTO stats_requests SELECT coalesce(city, ''), coalesce(intervention_type, ''), coalesce(status, ''), count(*)
+       FROM requests GROUP BY 1, 2, 3''',
+    "DELETE FROM stats_workload",
+    '''INSERT INTO stats_workload SELECT professional_id, coalesce(status, ''), count(*)
+       FROM requests WHERE professional_id IS NOT NULL GROUP BY 1, 2''',
+    "DELETE FROM stats_messages_daily",
+    '''INSERT INTO stats_messages_daily SELECT coalesce(substr(timestamp, 1, 10), ''), count(*)
+       FROM messages GROUP BY 1''',
+]
+
+
+# --- DATABASE SETUP / MIGRAZIONI ---
+# Lo schema è versionato con PRAGMA user_version: ogni migrazione porta il DB alla
+# versione indicata ed è applicata una sola volta, anche sui file home_care_v21.db
+# esistenti (che partono da user_version=0 con le tabelle già presenti).
+MIGRATIONS = [
+    (1, "schema base", [
+        '''CREATE TABLE IF NOT EXISTS users
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE, password TEXT, role TEXT, city TEXT,
+            lat REAL, lon REAL, bio TEXT, qualification TEXT,
+            experience INTEGER, hourly_rate REAL,
+            email TEXT, address TEXT, age INTEGER,
+            clinical_history TEXT, detailed_experience TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS requests
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            professional_id INTEGER,
+            target_pro_id INTEGER,
+            intervention_type TEXT,
+            description TEXT,
+            city TEXT,
+            status TEXT,
+            created_at TEXT,
+            FOREIGN KEY(patient_id) REFERENCES users(id))''',
+        '''CREATE TABLE IF NOT EXISTS messages
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_id INTEGER,
+            sender_id INTEGER,
+            content TEXT,
+            timestamp TEXT,
+            FOREIGN KEY(request_id) REFERENCES requests(id))''',
+    ]),
+    (2, "indici query calde", [
+        "CREATE INDEX IF NOT EXISTS idx_users_lower_username ON users(lower(username))",
+        "CREATE INDEX IF NOT EXISTS idx_users_role_city_qual ON users(role, city, qualification)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_status_city_target ON requests(status, city, target_pro_id)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_target_status ON requests(target_pro_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_patient ON requests(patient_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_professional_status ON requests(professional_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_request ON messages(request_id, id)",
+    ]),
+    (3, "contatori di versione (professionisti)", [
+        "CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+        "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('pros', 0)",
+        '''CREATE TRIGGER IF NOT EXISTS trg_pros_insert AFTER INSERT ON users
+           WHEN NEW.role='professionista'
+           BEGIN UPDATE data_versions SET version=version+1 WHERE name='pros'; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_pros_update AFTER UPDATE ON users
+           WHEN (NEW.role='professionista' OR OLD.role='professionista')
+            AND (NEW.role IS NOT OLD.role OR NEW.username IS NOT OLD.username OR NEW.city IS NOT OLD.city
+                 OR NEW.lat IS NOT OLD.lat OR NEW.lon IS NOT OLD.lon OR NEW.qualification IS NOT OLD.qualification
+                 OR NEW.hourly_rate IS NOT OLD.hourly_rate)
+           BEGIN UPDATE data_versions SET version=version+1 WHERE name='pros'; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_pros_delete AFTER DELETE ON users
+           WHEN OLD.role='professionista'
+           BEGIN UPDATE data_versions SET version=version+1 WHERE name='pros'; END''',
+    ]),
+    (4, "indici spaziali R*Tree (professionisti, richieste aperte)", [
+        # professionisti con coordinate; le richieste aperte prendono la posizione del paziente
+        "CREATE VIRTUAL TABLE IF NOT EXISTS pros_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS open_requests_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+        '''CREATE TRIGGER IF NOT EXISTS trg_pros_rtree_insert AFTER INSERT ON users
+           WHEN NEW.role='professionista' AND NEW.lat IS NOT NULL AND NEW.lon IS NOT NULL
+           BEGIN INSERT OR REPLACE INTO pros_rtree VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_pros_rtree_update AFTER UPDATE OF role, lat, lon ON users
+           BEGIN
+               DELETE FROM pros_rtree WHERE id=OLD.id;
+               INSERT INTO pros_rtree SELECT NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon
+                   WHERE NEW.role='professionista' AND NEW.lat IS NOT NULL AND NEW.lon IS NOT NULL;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_pros_rtree_delete AFTER DELETE ON users
+           BEGIN DELETE FROM pros_rtree WHERE id=OLD.id; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_open_rtree_insert AFTER INSERT ON requests
+           WHEN NEW.status='Aperta'
+           BEGIN
+               INSERT OR REPLACE INTO open_requests_rtree SELECT NEW.id, u.lat, u.lat, u.lon, u.lon
+                   FROM users u WHERE u.id=NEW.patient_id AND u.lat IS NOT NULL AND u.lon IS NOT NULL;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_open_rtree_status AFTER UPDATE OF status ON requests
+           WHEN NEW.status IS NOT OLD.status
+           BEGIN
+               DELETE FROM open_requests_rtree WHERE id=OLD.id;
+               INSERT INTO open_requests_rtree SELECT NEW.id, u.lat, u.lat, u.lon, u.lon
+                   FROM users u WHERE NEW.status='Aperta' AND u.id=NEW.patient_id AND u.lat IS NOT NULL AND u.lon IS NOT NULL;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_open_rtree_delete AFTER DELETE ON requests
+           BEGIN DELETE FROM open_requests_rtree WHERE id=OLD.id; END''',
+        '''INSERT OR REPLACE INTO pros_rtree SELECT id, lat, lat, lon, lon FROM users
+           WHERE role='professionista' AND lat IS NOT NULL AND lon IS NOT NULL''',
+        '''INSERT OR REPLACE INTO open_requests_rtree SELECT r.id, u.lat, u.lat, u.lon, u.lon
+           FROM requests r JOIN users u ON u.id=r.patient_id
+           WHERE r.status='Aperta' AND u.lat IS NOT NULL AND u.lon IS NOT NULL''',
+    ]),
+    (5, "indice paginazione carichi professionista", [
+        "CREATE INDEX IF NOT EXISTS idx_requests_professional ON requests(professional_id, id)",
+    ]),
+    (6, "contatori di versione (richieste, chat)", [
+        # requests:all | requests:city:<città> | requests:patient:<id> | requests:pro:<id> (assegnate o esclusive)
+        # messages:<request_id>. Le dashboard li interrogano a intervalli e ricaricano
+        # solo i listing la cui versione è cambiata.
+        '''CREATE TRIGGER IF NOT EXISTS trg_versions_requests_insert AFTER INSERT ON requests
+           BEGIN
+               INSERT INTO data_versions (name, version)
+                   SELECT n, 1 FROM (SELECT 'requests:all' AS n
+                                     UNION SELECT 'requests:city:' || NEW.city
+                                     UNION SELECT 'requests:patient:' || NEW.patient_id
+                                     UNION SELECT 'requests:pro:' || NEW.target_pro_id
+                                     UNION SELECT 'requests:pro:' || NEW.professional_id)
+                   WHERE n IS NOT NULL
+                   ON CONFLICT(name) DO UPDATE SET version=version+1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_versions_requests_update AFTER UPDATE ON requests
+           BEGIN
+               INSERT INTO data_versions (name, version)
+                   SELECT n, 1 FROM (SELECT 'requests:all' AS n
+                                     UNION SELECT 'requests:city:' || NEW.city
+                                     UNION SELECT 'requests:city:' || OLD.city
+                                     UNION SELECT 'requests:patient:' || NEW.patient_id
+                                     UNION SELECT 'requests:patient:' || OLD.patient_id
+                                     UNION SELECT 'requests:pro:' || NEW.target_pro_id
+                                     UNION SELECT 'requests:pro:' || OLD.target_pro_id
+                                     UNION SELECT 'requests:pro:' || NEW.professional_id
+                                     UNION SELECT 'requests:pro:' || OLD.professional_id)
+                   WHERE n IS NOT NULL
+                   ON CONFLICT(name) DO UPDATE SET version=version+1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_versions_requests_delete AFTER DELETE ON requests
+           BEGIN
+               INSERT INTO data_versions (name, version)
+                   SELECT n, 1 FROM (SELECT 'requests:all' AS n
+                                     UNION SELECT 'requests:city:' || OLD.city
+                                     UNION SELECT 'requests:patient:' || OLD.patient_id
+                                     UNION SELECT 'requests:pro:' || OLD.target_pro_id
+                                     UNION SELECT 'requests:pro:' || OLD.professional_id)
+                   WHERE n IS NOT NULL
+                   ON CONFLICT(name) DO UPDATE SET version=version+1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_versions_messages_insert AFTER INSERT ON messages
+           BEGIN
+               INSERT INTO data_versions (name, version) VALUES ('messages:' || NEW.request_id, 1)
+                   ON CONFLICT(name) DO UPDATE SET version=version+1;
+           END''',
+    ]),
+    (7, "embedding profili professionisti", [
+        # vec: float32 little-endian; vec NULL = profilo rimosso dall'indice (tombstone).
+        # seq cresce ad ogni scrittura: l'indice in memoria carica solo le righe nuove.
+        '''CREATE TABLE IF NOT EXISTS pro_embeddings
+           (user_id INTEGER PRIMARY KEY, model TEXT NOT NULL, dim INTEGER, vec BLOB, seq INTEGER NOT NULL)''',
+        "CREATE INDEX IF NOT EXISTS idx_pro_embeddings_seq ON pro_embeddings(seq)",
+        # profili da (ri)codificare: riempita dai trigger, svuotata da vector_index.sync()
+        "CREATE TABLE IF NOT EXISTS pro_embedding_queue (user_id INTEGER PRIMARY KEY)",
+        "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('pro_embeddings', 0)",
+        '''CREATE TRIGGER IF NOT EXISTS trg_pro_embedding_insert AFTER INSERT ON users
+           WHEN NEW.role='professionista'
+           BEGIN INSERT OR IGNORE INTO pro_embedding_queue VALUES (NEW.id); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_pro_embedding_update AFTER UPDATE ON users
+           WHEN (NEW.role='professionista' OR OLD.role='professionista')
+            AND (NEW.role IS NOT OLD.role OR NEW.bio IS NOT OLD.bio OR NEW.detailed_experience IS NOT OLD.detailed_experience
+                 OR NEW.qualification IS NOT OLD.qualification OR NEW.city IS NOT OLD.city)
+           BEGIN INSERT OR IGNORE INTO pro_embedding_queue VALUES (NEW.id); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_pro_embedding_delete AFTER DELETE ON users
+           WHEN OLD.role='professionista'
+           BEGIN INSERT OR IGNORE INTO pro_embedding_queue VALUES (OLD.id); END''',
+        "INSERT OR IGNORE INTO pro_embedding_queue SELECT id FROM users WHERE role='professionista'",
+    ]),
+    (8, "triage AI batch delle richieste", [
+        # categoria suggerita dal modello per ogni richiesta (non sovrascrive intervention_type)
+        '''CREATE TABLE IF NOT EXISTS request_triage
+           (request_id INTEGER PRIMARY KEY, suggested_type TEXT, confidence REAL,
+            model TEXT, kb_hash TEXT, classified_at TEXT)''',
+        # punto di ripresa dei job batch (ultimo id elaborato)
+        '''CREATE TABLE IF NOT EXISTS batch_checkpoints
+           (job TEXT PRIMARY KEY, last_id INTEGER NOT NULL, rows_done INTEGER NOT NULL DEFAULT 0, updated_at TEXT)''',
+    ]),
+    (9, "ricerca full-text (FTS5) su richieste e chat", [
+        # tabelle external-content: l'indice non duplica il testo, che resta in requests/messages.
+        # unicode61 con remove_diacritics 2: "caffè" = "caffe", apostrofi separano ("dell'anca" -> dell, anca);
+        # indici di prefisso per le ricerche "diabet*" (FTS5 non ha uno stemmer italiano)
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5
+            (description, intervention_type, content='requests', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5
+            (content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_requests_fts_insert AFTER INSERT ON requests
+           BEGIN INSERT INTO requests_fts (rowid, description, intervention_type) VALUES (NEW.id, NEW.description, NEW.intervention_type); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_requests_fts_delete AFTER DELETE ON requests
+           BEGIN INSERT INTO requests_fts (requests_fts, rowid, description, intervention_type) VALUES ('delete', OLD.id, OLD.description, OLD.intervention_type); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_requests_fts_update AFTER UPDATE OF description, intervention_type ON requests
+           BEGIN
+               INSERT INTO requests_fts (requests_fts, rowid, description, intervention_type) VALUES ('delete', OLD.id, OLD.description, OLD.intervention_type);
+               INSERT INTO requests_fts (rowid, description, intervention_type) VALUES (NEW.id, NEW.description, NEW.intervention_type);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+           BEGIN INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+           BEGIN INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF content ON messages
+           BEGIN
+               INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+               INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+           END''',
+        # backfill dei DB esistenti
+        "INSERT INTO requests_fts (requests_fts) VALUES ('rebuild')",
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ]),
+    (10, "statistiche operative pre-aggregate", [
+        # contatori mantenuti dai trigger (NULL salvato come ''): letture per chiave
+        # primaria, indipendenti dalla dimensione di requests/messages. stats.py li
+        # ricostruisce e verifica le derive (STATS_REBUILD).
+        '''CREATE TABLE IF NOT EXISTS stats_requests
+           (city TEXT NOT NULL, intervention_type TEXT NOT NULL, status TEXT NOT NULL, n INTEGER NOT NULL,
+            PRIMARY KEY (city, intervention_type, status)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS stats_workload
+           (professional_id INTEGER NOT NULL, status TEXT NOT NULL, n INTEGER NOT NULL,
+            PRIMARY KEY (professional_id, status)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS stats_messages_daily
+           (day TEXT PRIMARY KEY, n INTEGER NOT NULL) WITHOUT ROWID''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_requests_insert AFTER INSERT ON requests
+           BEGIN
+               INSERT INTO stats_requests VALUES (coalesce(NEW.city, ''), coalesce(NEW.intervention_type, ''), coalesce(NEW.status, ''), 1)
+                   ON CONFLICT DO UPDATE SET n=n+1;
+               INSERT INTO stats_workload SELECT NEW.professional_id, coalesce(NEW.status, ''), 1 WHERE NEW.professional_id IS NOT NULL
+                   ON CONFLICT DO UPDATE SET n=n+1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_requests_update AFTER UPDATE OF city, intervention_type, status, professional_id ON requests
+           WHEN NEW.city IS NOT OLD.city OR NEW.intervention_type IS NOT OLD.intervention_type
+             OR NEW.status IS NOT OLD.status OR NEW.professional_id IS NOT OLD.professional_id
+           BEGIN
+               UPDATE stats_requests SET n=n-1
+                   WHERE city=coalesce(OLD.city, '') AND intervention_type=coalesce(OLD.intervention_type, '') AND status=coalesce(OLD.status, '');
+               INSERT INTO stats_requests VALUES (coalesce(NEW.city, ''), coalesce(NEW.intervention_type, ''), coalesce(NEW.status, ''), 1)
+                   ON CONFLICT DO UPDATE SET n=n+1;
+               UPDATE stats_workload SET n=n-1 WHERE professional_id=OLD.professional_id AND status=coalesce(OLD.status, '');
+               INSERT INTO stats_workload SELECT NEW.professional_id, coalesce(NEW.status, ''), 1 WHERE NEW.professional_id IS NOT NULL
+                   ON CONFLICT DO UPDATE SET n=n+1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_requests_delete AFTER DELETE ON requests
+           BEGIN
+               UPDATE stats_requests SET n=n-1
+                   WHERE city=coalesce(OLD.city, '') AND intervention_type=coalesce(OLD.intervention_type, '') AND status=coalesce(OLD.status, '');
+               UPDATE stats_workload SET n=n-1 WHERE professional_id=OLD.professional_id AND status=coalesce(OLD.status, '');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_messages_insert AFTER INSERT ON messages
+           BEGIN
+               INSERT INTO stats_messages_daily VALUES (coalesce(substr(NEW.timestamp, 1, 10), ''), 1)
+                   ON CONFLICT DO UPDATE SET n=n+1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_messages_delete AFTER DELETE ON messages
+           BEGIN UPDATE stats_messages_daily SET n=n-1 WHERE day=coalesce(substr(OLD.timestamp, 1, 10), ''); END''',
+    ] + STATS_REBUILD),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    applied = []
+    with connection() as conn:
+        for version, name, steps in MIGRATIONS:
+            if schema_version(conn) >= version:
+                continue
+            with transaction() as c:
+                # ricontrollo sotto lock di scrittura: un altro processo può averla già applicata
+                if schema_version(c) >= version:
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(c)
+                    else:
+                        c.execute(step)
+                c.execute(f"PRAGMA user_version={int(version)}")
+            applied.append((version, name))
+    # niente ANALYZE/PRAGMA optimize qui: le statistiche di un DB appena creato o
+    # ancora piccolo (poche righe) portano il planner a scegliere SCAN e restano in
+    # sqlite_stat1 anche quando le tabelle crescono. Senza statistiche le query
+    # calde usano gli indici (vedi check_query_plans).
+    return applied
+
+
+def init_db():
+    return migrate()
+
+
+def data_version(name: str) -> int:
+    with connection() as conn:
+        row = conn.execute("SELECT version FROM data_versions WHERE name=?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def data_versions(names) -> dict:
+    # Lettura in blocco dei contatori (una sola query su chiave primaria); 0 se mai scritti
+    names = list(names)
+    if not names:
+        return {}
+    with connection() as conn:
+        rows = conn.execute(f"SELECT name, version FROM data_versions WHERE name IN ({','.join('?' * len(names))})", names).fetchall()
+    found = dict(rows)
+    return {n: found.get(n, 0) for n in names}
+
+
+# --- QUERY PLAN ---
+# Query calde che devono sempre usare un indice (mai SCAN sulla tabella). La SQL è
+# quella di queries.py eseguita da backend.py, con parametri d'esempio; le liste
+# paginate sono provate con cursore e filtro come nelle pagine successive.
+HOT_QUERIES = {
+    "authenticate": (queries.USER_BY_USERNAME, ("x",)),
+    "get_pro_open_jobs (esclusive)": queries.open_jobs("x", 1, "Milano"),
+    "get_pro_open_jobs (pubbliche)": queries.open_jobs("p", 1, "Milano"),
+    "get_pro_my_jobs": (queries.PRO_MY_JOBS, (1,)),
+    "get_patient_history": queries.patient_history(1),
+    "list_my_jobs": queries.my_jobs(1, 1000, 50, *queries.filters("r.", status="In Carico")),
+    "list_open_jobs (esclusive)": queries.open_jobs("x", 1, "Milano", 1000, 50, *queries.filters("r.", "Visita Medica")),
+    "list_open_jobs (pubbliche)": queries.open_jobs("p", 1, "Milano", 1000, 50, *queries.filters("r.", "Visita Medica")),
+    "list_patient_history": queries.patient_history(1, 1000, 50, *queries.filters("", status="Aperta")),
+    "claim_request": queries.claim(1, 1, "Milano"),
+    "claim_request (raggio)": queries.claim(1, 1, "Milano", (45.46, 9.19), 20),
+    "get_active_chats (paziente)": (queries.ACTIVE_CHATS_PATIENT, (1,)),
+    "get_active_chats (professionista)": (queries.ACTIVE_CHATS_PRO, (1,)),
+    "get_chat_history": (queries.CHAT_HISTORY, (1,)),
+    "get_chat_tail": (queries.CHAT_TAIL, (1, 50)),
+    "get_chat_before": (queries.CHAT_BEFORE, (1, 1000, 50)),
+    "get_chat_since": (queries.CHAT_SINCE, (1, 0)),
+    "get_ai_rec": queries.pros_by_id([1, 2, 3]),
+}
+
+
+def explain_query_plan(sql, params=()):
+    with connection() as conn:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def check_query_plans(hot_queries=None):
+    # {nome: (ok, piano)}; ok è False se qualche passo fa una SCAN senza indice o
+    # ordina in un B-tree temporaneo (l'indice non restringe abbastanza la ricerca:
+    # es. solo status=? con tutte le righe aperte da ordinare)
+    out = {}
+    for name, (sql, params) in (hot_queries or HOT_QUERIES).items():
+        plan = explain_query_plan(sql, params)
+        full_scan = any(step.startswith("SCAN") and "INDEX" not in step for step in plan)
+        temp_sort = any(step.startswith("USE TEMP B-TREE") for step in plan)
+        out[name] = (not (full_scan or temp_sort), plan)
+    return out
+
+
+def seed_data():
+    # l'hash si calcola prima di aprire la transazione: BEGIN IMMEDIATE tiene il lock
+    # di scrittura e non va trattenuto durante pbkdf2
+    with connection() as c:
+        if c.execute("SELECT count(*) FROM users").fetchone()[0]:
+            return
+    hashed_pass = hash_password("pass")
+    with transaction() as c:
+        count = c.execute("SELECT count(*) FROM users").fetchone()[0]
+        if count == 0:
+            # Demo users with hashed password "pass"
+            users = [
+                ("mario_rossi", hashed_pass, "paziente", "Milano", 45.4642, 9.1900, "Paziente Demo", None, 0, 0, "mario@email.it", "Via Roma 1", 80, "Diabete", None),
+                ("luigi_verdi", hashed_pass, "professionista", "Milano", 45.4680, 9.2000, "Infermiere Pro", "Infermiere", 10, 25.0, "luigi@nurse.it", "Via Milano 20", 40, None, "Exp 10 anni")
+            ]
+            c.executemany("INSERT INTO users VALUES (NULL,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", users)
+
+
+if __name__ == "__main__":
+    # python db.py [percorso_db]: applica le migrazioni e verifica i piani delle query calde
+    if len(sys.argv) > 1:
+        configure(sys.argv[1])
+    for version, name in migrate():
+        print(f"migrazione {version} applicata: {name}")
+    print(f"schema alla versione {SCHEMA_VERSION}")
+    failed = False
+    for name, (ok, plan) in check_query_plans().items():
+        print(f"{'OK ' if ok else 'KO '} {name}: {' | '.join(plan)}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
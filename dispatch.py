@@ -0,0 +1,227 @@
+# --- DISPATCH AUTOMATICO ---
+# Assegna in blocco le richieste aperte ai professionisti idonei. Si costruisce una
+# matrice dei costi richieste x professionisti con NumPy:
+#   - idoneità: qualifica compatibile (INTERVENTION_MAPPING), distanza <= MAX_KM,
+#     capacità residua (MAX_LOAD meno i carichi in corso, da stats_workload);
+#   - costo: distanza, tariffa oraria e carico attuale, normalizzati e pesati;
+#   - le richieste esclusive (target_pro_id) sono idonee solo per il professionista scelto
+#     e vengono assegnate per prime.
+# Il solver greedy ordina le coppie idonee per costo e rispetta la capacità; con scipy
+# installato è disponibile anche l'assegnamento ottimo (Hungarian, linear_sum_assignment).
+# Le assegnazioni passano da backend.claim_request in un'unica transazione: una
+# richiesta presa nel frattempo da un professionista viene semplicemente saltata, e
+# ogni presa in carico gira in un SAVEPOINT, così un errore annulla solo quella.
+#
+# Uso: python dispatch.py [--db home_care_v21.db] [--dry-run] [--solver greedy|hungarian] [--every 60]
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from config import DB_NAME, INTERVENTION_MAPPING, CITY_COORDS
+import db
+import geo
+
+MAX_KM = 30.0
+MAX_LOAD = 5                 # richieste 'In Carico' per professionista oltre le quali non si assegna
+WEIGHTS = {"km": 1.0, "rate": 0.5, "load": 0.5}
+EXCLUSIVE_BONUS = 1e3        # le esclusive passano davanti a tutte le altre nel greedy
+
+log = logging.getLogger(__name__)
+
+
+def load_problem():
+    with db.connection() as conn:
+        reqs = conn.execute("""SELECT r.id, r.intervention_type, r.target_pro_id, r.city, u.lat, u.lon
+                               FROM requests r LEFT JOIN users u ON u.id = r.patient_id
+                               WHERE r.status='Aperta' ORDER BY r.id""").fetchall()
+        pros = conn.execute("""SELECT u.id, u.qualification, u.city, u.lat, u.lon, coalesce(u.hourly_rate, 0),
+                                      coalesce(w.n, 0)
+                               FROM users u LEFT JOIN stats_workload w ON w.professional_id = u.id AND w.status='In Carico'
+                               WHERE u.role='professionista' AND u.lat IS NOT NULL AND u.lon IS NOT NULL
+                               ORDER BY u.id""").fetchall()
+    return reqs, pros
+
+
+def _coords(rows, lat_col, lon_col, city_col):
+    # coordinate del paziente, altrimenti il centro della città (NaN se sconosciuta)
+    out = np.full((len(rows), 2), np.nan)
+    for i, r in enumerate(rows):
+        if r[lat_col] is not None and r[lon_col] is not None:
+            out[i] = (r[lat_col], r[lon_col])
+        elif r[city_col] in CITY_COORDS:
+            out[i] = CITY_COORDS[r[city_col]]
+    return out
+
+
+def build_costs(reqs, pros, max_km=MAX_KM, max_load=MAX_LOAD, weights=WEIGHTS):
+    # -> (costi R x P con inf dove non idoneo, distanze, capacità residua per professionista)
+    quals = sorted({p[1] for p in pros if p[1]})
+    types = sorted(INTERVENTION_MAPPING)
+    q_index = {q: j for j, q in enumerate(quals)}
+    t_index = {t: i for i, t in enumerate(types)}
+    compat = np.zeros((len(types) + 1, len(quals) + 1), dtype=bool)   # ultima riga/colonna: tipo/qualifica sconosciuti
+    for t, allowed in INTERVENTION_MAPPING.items():
+        for q in allowed:
+            if q in q_index:
+                compat[t_index[t], q_index[q]] = True
+    r_type = np.array([t_index.get(r[1], len(types)) for r in reqs], dtype=np.intp)
+    p_qual = np.array([q_index.get(p[1], len(quals)) for p in pros], dtype=np.intp)
+    eligible = compat[r_type[:, None], p_qual[None, :]]
+
+    rc = _coords(reqs, 4, 5, 3)
+    pc = np.array([(p[3], p[4]) for p in pros], dtype=np.float64).reshape(-1, 2)
+    km = geo.haversine_km(rc[:, :1], rc[:, 1:], pc[None, :, 0], pc[None, :, 1])
+    eligible &= km <= max_km                       # NaN (posizione sconosciuta) -> non idoneo
+
+    # esclusive: solo il professionista scelto, a qualsiasi distanza e qualifica
+    p_pos = {p[0]: j for j, p in enumerate(pros)}
+    exclusive = np.array([r[2] is not None for r in reqs], dtype=bool)
+    eligible[exclusive] = False
+    for i in np.flatnonzero(exclusive):
+        j = p_pos.get(reqs[i][2])
+        if j is not None:
+            eligible[i, j] = True
+
+    rate = np.array([p[5] for p in pros], dtype=np.float64)
+    load = np.array([p[6] for p in pros], dtype=np.float64)
+    capacity = np.maximum(max_load - load, 0).astype(np.int64)
+    rate_n = rate / rate.max() if len(rate) and rate.max() > 0 else np.zeros_like(rate)
+    cost = (weights["km"] * np.nan_to_num(km, nan=max_km) / max_km
+            + weights["rate"] * rate_n[None, :]
+            + weights["load"] * (load / max_load)[None, :])
+    cost[exclusive] -= EXCLUSIVE_BONUS
+    cost[~eligible] = np.inf
+    return cost, km, capacity
+
+
+def solve_greedy(cost, capacity):
+    # coppie idonee in ordine di costo; ogni richiesta al più una volta, ogni professionista fino a capacità
+    cap = capacity.copy()
+    rows, cols = np.nonzero(np.isfinite(cost))
+    order = np.argsort(cost[rows, cols], kind="stable")
+    taken = np.zeros(cost.shape[0], dtype=bool)
+    out = []
+    for k in order:
+        i, j = rows[k], cols[k]
+        if taken[i] or cap[j] <= 0:
+            continue
+        taken[i] = True
+        cap[j] -= 1
+        out.append((int(i), int(j)))
+    return out
+
+
+def solve_hungarian(cost, capacity):
+    # assegnamento ottimo: ogni professionista replicato per la sua capacità residua
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        raise RuntimeError("il solver hungarian richiede scipy")
+    active = np.flatnonzero(np.isfinite(cost).any(axis=1))
+    slots = np.repeat(np.arange(cost.shape[1]), np.minimum(capacity, len(active)))
+    if not len(active) or not len(slots):
+        return []
+    sub = cost[np.ix_(active, slots)]
+    big = np.nanmax(np.where(np.isfinite(sub), np.abs(sub), 0)) * 10 + 1e6
+    ri, ci = linear_sum_assignment(np.where(np.isfinite(sub), sub, big))
+    return [(int(active[a]), int(slots[b])) for a, b in zip(ri, ci) if np.isfinite(sub[a, b])]
+
+
+SOLVERS = {"greedy": solve_greedy, "hungarian": solve_hungarian}
+
+
+def apply(assignments, reqs, pros, km):
+    # stessa semantica di "Accetta": UPDATE condizionato su status='Aperta', tutto in una transazione
+    from backend import claim_request
+    applied, skipped, failed = [], 0, 0
+    with db.transaction() as conn:
+        for i, j in assignments:
+            r, p = reqs[i], pros[j]
+            radius = float(km[i, j]) + 0.1 if np.isfinite(km[i, j]) else 0
+            conn.execute("SAVEPOINT claim")
+            try:
+                claimed = claim_request(r[0], p[0], p[2], origin=(p[3], p[4]), radius_km=radius)
+                conn.execute("RELEASE claim")
+            except sqlite3.Error as ex:
+                conn.execute("ROLLBACK TO claim")
+                conn.execute("RELEASE claim")
+                log.error("presa in carico fallita: richiesta %s -> professionista %s: %s", r[0], p[0], ex)
+                failed += 1
+                continue
+            if claimed is None:
+                skipped += 1
+            else:
+                applied.append((i, j))
+    return applied, skipped, failed
+
+
+def run(solver="greedy", dry_run=False, max_km=MAX_KM, max_load=MAX_LOAD):
+    t0 = time.perf_counter()
+    reqs, pros = load_problem()
+    t_load = time.perf_counter()
+    report = {"requests": len(reqs), "professionals": len(pros), "solver": solver}
+    if not reqs or not pros:
+        return dict(report, assigned=0, applied=0)
+    cost, km, capacity = build_costs(reqs, pros, max_km, max_load)
+    t_build = time.perf_counter()
+    assignments = SOLVERS[solver](cost, capacity)
+    t_solve = time.perf_counter()
+    applied, skipped, failed = ([], 0, 0) if dry_run else apply(assignments, reqs, pros, km)
+    t_apply = time.perf_counter()
+
+    feasible = np.isfinite(cost).any(axis=1)
+    exclusive = np.array([r[2] is not None for r in reqs], dtype=bool)
+    ai = np.array([a[0] for a in assignments], dtype=np.intp)
+    aj = np.array([a[1] for a in assignments], dtype=np.intp)
+    # distanze delle sole pubbliche: le esclusive possono essere a qualsiasi distanza
+    pub = ~exclusive[ai] if len(ai) else np.zeros(0, dtype=bool)
+    dist = km[ai[pub], aj[pub]] if len(ai) else np.empty(0)
+    # rimpianto: costo pagato meno il miglior costo possibile per quella richiesta
+    regret = cost[ai, aj] - cost[ai].min(axis=1) if len(ai) else np.empty(0)
+    per_pro = np.bincount(aj, minlength=len(pros)) if len(aj) else np.zeros(len(pros), dtype=np.int64)
+    report.update({
+        "feasible": int(feasible.sum()),
+        "assigned": len(assignments),
+        "applied": len(applied),
+        "skipped_claimed": skipped,
+        "failed": failed,
+        "exclusive_assigned": int(exclusive[ai].sum()) if len(ai) else 0,
+        "exclusive_total": int(exclusive.sum()),
+        "coverage": round(len(assignments) / max(1, int(feasible.sum())), 3),
+        "km_mean": round(float(np.nanmean(dist)), 2) if len(dist) else None,
+        "km_p95": round(float(np.nanpercentile(dist, 95)), 2) if len(dist) else None,
+        "regret_mean": round(float(regret.mean()), 4) if len(regret) else None,
+        "max_per_pro": int(per_pro.max()) if len(per_pro) else 0,
+        "load_s": round(t_load - t0, 4),
+        "build_s": round(t_build - t_load, 4),
+        "solve_s": round(t_solve - t_build, 4),
+        "apply_s": round(t_apply - t_solve, 4),
+    })
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Assegnazione automatica delle richieste aperte")
+    ap.add_argument("--db", default=DB_NAME)
+    ap.add_argument("--solver", choices=sorted(SOLVERS), default="greedy")
+    ap.add_argument("--dry-run", action="store_true", help="calcola e riporta senza assegnare")
+    ap.add_argument("--max-km", type=float, default=MAX_KM)
+    ap.add_argument("--max-load", type=int, default=MAX_LOAD)
+    ap.add_argument("--every", type=float, default=0, help="ripete ogni N secondi (0 = una volta)")
+    args = ap.parse_args(argv)
+    db.configure(args.db)
+    db.migrate()
+    while True:
+        rep = run(args.solver, args.dry_run, args.max_km, args.max_load)
+        print("  ".join(f"{k}={v}" for k, v in rep.items()), flush=True)
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# --- EMBEDDING CACHE ---
+# La knowledge base viene codificata una sola volta in una matrice contigua
+# (normalizzata, così il coseno diventa un prodotto scalare) e salvata su disco
+# come .npy con chiave modello + hash della KB: un riavvio a caldo non ricodifica nulla.
+# Le query dei pazienti passano da una cache LRU limitata. Il modello è sensibile alle
+# maiuscole: si normalizzano solo gli spazi (query_text), e lo stesso testo è chiave
+# della cache e input di model.encode, sia qui sia nel triage batch (encode_texts).
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def query_text(text) -> str:
+    return " ".join(str(text or "").split())
+
+
+def normalize_text(text) -> str:
+    return query_text(text).lower()
+
+
+def kb_hash(model_name: str, texts) -> str:
+    h = hashlib.sha256(model_name.encode("utf-8"))
+    for t in texts:
+        h.update(b"\x00")
+        h.update(t.encode("utf-8"))
+    return h.hexdigest()
+
+
+def l2_normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(mat / norms, dtype=np.float32)
+
+
+class HashingEncoder:
+    # Encoder deterministico senza modello (hashing di parole e trigrammi): stessa
+    # interfaccia di SentenceTransformer.encode, per test e benchmark offline.
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _vec(self, text):
+        v = np.zeros(self.dim, dtype=np.float32)
+        words = normalize_text(text).split()
+        grams = words + [w[i:i + 3] for w in words for i in range(max(1, len(w) - 2))]
+        for g in grams:
+            h = int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        return v
+
+    def encode(self, texts, convert_to_numpy=True, batch_size=32, **kwargs):
+        if isinstance(texts, str):
+            return self._vec(texts)
+        return np.stack([self._vec(t) for t in texts]) if len(texts) else np.zeros((0, self.dim), dtype=np.float32)
+
+
+class EmbeddingCache:
+    def __init__(self, model, model_name: str, kb_texts, cache_dir: Optional[str] = None, max_queries: int = 256):
+        self.model = model
+        self.model_name = model_name
+        self.kb_texts = list(kb_texts)
+        self.cache_dir = cache_dir
+        self.max_queries = max_queries
+        self.kb_key = kb_hash(model_name, self.kb_texts)
+        self._kb = None
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- KB ---
+    def _kb_path(self):
+        if not self.cache_dir:
+            return None
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", self.model_name)
+        return os.path.join(self.cache_dir, f"kb_{safe_model}_{self.kb_key[:16]}.npy")
+
+    def _load_kb(self):
+        path = self._kb_path()
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            mat = np.load(path)
+        except Exception as ex:
+            log.warning("cache KB illeggibile (%s): %s", path, ex)
+            return None
+        if mat.ndim != 2 or mat.shape[0] != len(self.kb_texts):
+            return None
+        return np.ascontiguousarray(mat, dtype=np.float32)
+
+    def _save_kb(self, mat):
+        path = self._kb_path()
+        if not path:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, mat)
+            os.replace(tmp, path)
+        except Exception as ex:
+            log.warning("impossibile salvare cache KB (%s): %s", path, ex)
+
+    def kb_matrix(self) -> np.ndarray:
+        if self._kb is None:
+            with self._lock:
+                if self._kb is None:
+                    mat = self._load_kb()
+                    if mat is None:
+                        mat = l2_normalize(self.model.encode(self.kb_texts, convert_to_numpy=True))
+                        self._save_kb(mat)
+                    self._kb = mat
+        return self._kb
+
+    # --- QUERY ---
+    def encode_texts(self, texts, batch_size=32) -> np.ndarray:
+        # codifica in blocco con la stessa normalizzazione di encode_query
+        return l2_normalize(self.model.encode([query_text(t) for t in texts], batch_size=batch_size, convert_to_numpy=True))
+
+    def encode_query(self, text) -> np.ndarray:
+        key = query_text(text)
+        with self._lock:
+            vec = self._queries.get(key)
+            if vec is not None:
+                self._queries.move_to_end(key)
+                self.hits += 1
+                return vec
+            self.misses += 1
+        vec = l2_normalize(self.model.encode(key, convert_to_numpy=True))
+        with self._lock:
+            self._queries[key] = vec
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+        return vec
+
+    def scores(self, text) -> np.ndarray:
+        return self.kb_matrix() @ self.encode_query(text)
+
+    def best_match(self, text):
+        s = self.scores(text)
+        i = int(np.argmax(s))
+        return self.kb_texts[i], float(s[i])
+
+    def clear_queries(self):
+        with self._lock:
+            self._queries.clear()
+            self.hits = self.misses = 0
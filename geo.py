@@ -0,0 +1,130 @@
+# --- RICERCA PER DISTANZA ---
+# I candidati arrivano dagli indici R*Tree (pros_rtree, open_requests_rtree, vedi
+# migrazione 4) con un bounding box attorno al punto; la distanza esatta (haversine)
+# viene poi calcolata in blocco con NumPy, filtrata sul raggio e ordinata.
+import math
+
+import numpy as np
+
+import db
+from rows import Rows
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+
+
+def haversine_km(lat, lon, lats, lons) -> np.ndarray:
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bbox(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def _within(rows, lat, lon, radius_km, limit, lat_col, lon_col):
+    # rows: tuple con lat/lon alle posizioni lat_col/lon_col -> (indici ordinati, distanze)
+    if not rows:
+        return [], np.empty(0)
+    lats = np.fromiter((r[lat_col] for r in rows), dtype=np.float64, count=len(rows))
+    lons = np.fromiter((r[lon_col] for r in rows), dtype=np.float64, count=len(rows))
+    dist = haversine_km(lat, lon, lats, lons)
+    idx = np.flatnonzero(dist <= radius_km)
+    idx = idx[np.argsort(dist[idx], kind="stable")]
+    if limit:
+        idx = idx[:limit]
+    return idx, dist
+
+
+def pros_within(lat, lon, radius_km, qualifications=None, limit=None):
+    # Professionisti entro radius_km dal punto, ordinati per distanza
+    min_lat, max_lat, min_lon, max_lon = bbox(lat, lon, radius_km)
+    sql = """SELECT u.id, u.username, u.qualification, u.hourly_rate, u.city, u.lat, u.lon
+             FROM pros_rtree g JOIN users u ON u.id = g.id
+             WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?"""
+    params = [min_lat, max_lat, min_lon, max_lon]
+    if qualifications:
+        sql += f" AND u.qualification IN ({','.join('?' * len(qualifications))})"
+        params += list(qualifications)
+    with db.connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    idx, dist = _within(rows, lat, lon, radius_km, limit, 5, 6)
+    return Rows(
+        ["ID", "username", "qualification", "hourly_rate", "city", "km"],
+        [(rows[i][0], rows[i][1], rows[i][2], rows[i][3], rows[i][4], round(float(dist[i]), 1)) for i in idx],
+    )
+
+
+OPEN_COLUMNS = ["ID", "Tipo", "Paziente", "intervention_type", "description", "city", "km"]
+
+
+def open_requests_within(lat, lon, radius_km, pro_id=None, limit=None, cursor=None, intervention_type=None):
+    # Richieste aperte pubbliche entro radius_km, più le esclusive per pro_id (a qualsiasi distanza).
+    # Come backend.list_open_jobs: prima le esclusive (id DESC, cursore ("x", id)), poi le
+    # pubbliche per distanza con cursore keyset ("p", km, id) sulla distanza esatta.
+    # Ritorna (Rows, cursore pagina successiva o None); limit=None restituisce tutto.
+    phase, *last = cursor if cursor else ("x",)
+    type_sql, type_params = (" AND r.intervention_type=?", [intervention_type]) if intervention_type else ("", [])
+    excl = []
+    with db.connection() as conn:
+        if phase == "x":
+            sql = """SELECT r.id, u.username, r.intervention_type, r.description, r.city, u.lat, u.lon
+                     FROM requests r JOIN users u ON r.patient_id = u.id
+                     WHERE r.status='Aperta' AND r.target_pro_id = ?""" + type_sql
+            params = [pro_id] + type_params
+            if last:
+                sql += " AND r.id<?"
+                params.append(last[0])
+            if limit:
+                sql += " ORDER BY r.id DESC LIMIT ?"
+                params.append(limit)
+            else:
+                sql += " ORDER BY r.id DESC"
+            rows = conn.execute(sql, params).fetchall()
+            if rows:
+                # una sola chiamata vettoriale; coordinate mancanti -> NaN -> km None
+                coords = np.array([(r[5], r[6]) for r in rows], dtype=np.float64)
+                dist = np.round(haversine_km(lat, lon, coords[:, 0], coords[:, 1]), 1)
+                excl = [(r[0], '⭐ ESCLUSIVA', r[1], r[2], r[3], r[4], None if np.isnan(d) else float(d))
+                        for r, d in zip(rows, dist)]
+            if limit and len(excl) == limit:
+                return Rows(OPEN_COLUMNS, excl), ("x", excl[-1][0])
+            last = []
+        min_lat, max_lat, min_lon, max_lon = bbox(lat, lon, radius_km)
+        public = conn.execute("""
+            SELECT r.id, u.username, r.intervention_type, r.description, r.city, g.min_lat, g.min_lon
+            FROM open_requests_rtree g JOIN requests r ON r.id = g.id JOIN users u ON r.patient_id = u.id
+            WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?
+              AND r.status='Aperta' AND r.target_pro_id IS NULL""" + type_sql,
+            [min_lat, max_lat, min_lon, max_lon] + type_params).fetchall()
+    remaining = limit - len(excl) if limit else None
+    out = list(excl)
+    next_cursor = None
+    if public:
+        ids = np.fromiter((r[0] for r in public), dtype=np.int64, count=len(public))
+        dist = haversine_km(lat, lon, [r[5] for r in public], [r[6] for r in public])
+        keep = dist <= radius_km
+        if last:
+            keep &= (dist > last[0]) | ((dist == last[0]) & (ids > last[1]))
+        idx = np.flatnonzero(keep)
+        idx = idx[np.lexsort((ids[idx], dist[idx]))]
+        if remaining is not None:
+            idx = idx[:remaining]
+            if len(idx) == remaining:
+                next_cursor = ("p", float(dist[idx[-1]]), int(ids[idx[-1]]))
+        out.extend((public[i][0], 'Pubblica', public[i][1], public[i][2], public[i][3], public[i][4], round(float(dist[i]), 1)) for i in idx)
+    return Rows(OPEN_COLUMNS, out), next_cursor
+
+
+def request_distance_km(req_id, lat, lon):
+    # Distanza dal punto di una richiesta ancora aperta (None se non indicizzata)
+    with db.connection() as conn:
+        row = conn.execute("SELECT min_lat, min_lon FROM open_requests_rtree WHERE id=?", (req_id,)).fetchone()
+    if row is None:
+        return None
+    return float(haversine_km(lat, lon, [row[0]], [row[1]])[0])
@@ -0,0 +1,136 @@
+# --- HASH PASSWORD ---
+# pbkdf2 è CPU-bound: hash e verifica girano in un pool di thread limitato
+# (backpressure oltre HASH_MAX_PENDING richieste in coda). Il backend di passlib è
+# hashlib (pbkdf2_hmac di OpenSSL), che rilascia il GIL durante il calcolo: i rerun
+# delle altre sessioni non restano bloccati e non servono processi. Niente processi
+# "spawn" quindi: sotto Streamlit __main__ è app.py e ogni worker lo rieseguirebbe.
+# Il costo (rounds) è configurabile: al login un hash con costo inferiore viene
+# aggiornato in modo trasparente. CARECONNECT_HASH_WORKERS=0 esegue tutto nel thread corrente.
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+
+from passlib.hash import pbkdf2_sha256
+
+log = logging.getLogger("careconnect.auth")
+
+PBKDF2_ROUNDS = int(os.environ.get("CARECONNECT_PBKDF2_ROUNDS", "29000"))
+HASH_WORKERS = int(os.environ.get("CARECONNECT_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.environ.get("CARECONNECT_HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+policy = pbkdf2_sha256.using(default_rounds=PBKDF2_ROUNDS, min_desired_rounds=PBKDF2_ROUNDS)
+
+
+# funzioni eseguite nei thread del pool
+def _hash(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+
+def _verify(password, stored_hash):
+    try:
+        return pbkdf2_sha256.verify(password, stored_hash)
+    except (ValueError, TypeError):
+        return False
+
+
+class HashPool:
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.pending = 0
+        self.max_seen_pending = 0
+        self.latencies = {"verify": deque(maxlen=1000), "hash": deque(maxlen=1000)}
+        self.inline = workers <= 0
+
+    def _get_executor(self):
+        if self._executor is None and not self.inline:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="careconnect-hash")
+        return self._executor
+
+    def _submit(self, fn, *args):
+        # un executor chiuso o rotto viene sostituito invece di far fallire tutte le
+        # chiamate successive fino al riavvio del server
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args)
+        except (BrokenExecutor, RuntimeError) as ex:
+            log.warning("pool hash non utilizzabile (%s), lo ricreo", ex)
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            return self._get_executor().submit(fn, *args)
+
+    def _run(self, kind, fn, *args):
+        t0 = time.perf_counter()
+        executor = self._get_executor()
+        if executor is None:
+            result = fn(*args)
+        else:
+            self._slots.acquire()
+            with self._lock:
+                self.pending += 1
+                self.max_seen_pending = max(self.max_seen_pending, self.pending)
+            try:
+                result = self._submit(fn, *args).result()
+            finally:
+                with self._lock:
+                    self.pending -= 1
+                self._slots.release()
+        self.latencies[kind].append(time.perf_counter() - t0)
+        return result
+
+    def hash(self, password, rounds=None):
+        return self._run("hash", _hash, password, rounds or PBKDF2_ROUNDS)
+
+    def verify(self, password, stored_hash):
+        return self._run("verify", _verify, password, stored_hash)
+
+    def map_hash(self, passwords, rounds=None, chunksize=16):
+        # hash in parallelo su tutti i worker (import massivi)
+        executor = self._get_executor()
+        rounds = rounds or PBKDF2_ROUNDS
+        if executor is None:
+            return [_hash(p, rounds) for p in passwords]
+        return list(executor.map(_hash, passwords, [rounds] * len(passwords), chunksize=chunksize))
+
+    def stats(self):
+        out = {"workers": 0 if self.inline else self.workers, "pending": self.pending,
+               "max_pending": self.max_seen_pending, "rounds": PBKDF2_ROUNDS}
+        for kind, lat in self.latencies.items():
+            vals = sorted(lat)
+            if vals:
+                out[f"{kind}_p50_ms"] = round(vals[len(vals) // 2] * 1000, 1)
+                out[f"{kind}_p95_ms"] = round(vals[min(len(vals) - 1, int(len(vals) * 0.95))] * 1000, 1)
+                out[f"{kind}_count"] = len(vals)
+        return out
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+pool = HashPool()
+
+
+def hash_password(password):
+    return pool.hash(password)
+
+
+def verify_password(password, stored_hash):
+    return pool.verify(password, stored_hash)
+
+
+def needs_rehash(stored_hash):
+    try:
+        return policy.needs_update(stored_hash)
+    except (ValueError, TypeError):
+        return False
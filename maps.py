@@ -0,0 +1,86 @@
+# --- MAPPA PROFESSIONISTI ---
+# La mappa della Home viene costruita una volta e tenuta in cache per processo,
+# con chiave la versione dell'insieme dei professionisti (data_versions 'pros',
+# aggiornata dai trigger su users): si ricostruisce solo quando un professionista
+# si registra o cambia posizione/dati mostrati.
+# Con molti professionisti si passa alla modalità compatta: un unico payload
+# FastMarkerCluster invece di un oggetto Marker per ciascuno.
+# folium viene importato alla prima costruzione della mappa, non all'import del modulo.
+import html
+import threading
+import time
+
+import db
+from backend import get_landing_pros
+
+COMPACT_THRESHOLD = 500
+
+# popup già escapato lato server, il callback JS si limita a montarlo
+_FAST_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+}
+"""
+
+_lock = threading.Lock()
+_cache = {}   # mode -> {"version", "html", "pros", "stats"}
+
+
+def _popup(p):
+    return f"{html.escape(p[0])} ({html.escape(str(p[5]) if p[5] else '')})"
+
+
+def create_map_html(pros, mode="markers"):
+    import folium
+    from folium.plugins import FastMarkerCluster, MarkerCluster
+
+    m = folium.Map([42, 12.5], zoom_start=6)
+    if mode == "compact":
+        data = [[p[3], p[4], _popup(p)] for p in pros if p[3] is not None and p[4] is not None]
+        FastMarkerCluster(data, callback=_FAST_CALLBACK).add_to(m)
+    else:
+        mc = MarkerCluster().add_to(m)
+        for p in pros:
+            try:
+                folium.Marker([p[3], p[4]], popup=_popup(p)).add_to(mc)
+            except Exception:
+                pass
+    return m._repr_html_()
+
+
+def get_map(mode="auto"):
+    # Ritorna {"html", "pros", "stats"}; stats riporta dimensione HTML e tempo di build
+    version = db.data_version("pros")
+    entry = _cache.get(mode)
+    if entry is not None and entry["version"] == version:
+        entry["stats"]["cached"] = True
+        return entry
+    with _lock:
+        entry = _cache.get(mode)
+        if entry is not None and entry["version"] == version:
+            return entry
+        t0 = time.perf_counter()
+        pros = get_landing_pros()
+        real_mode = mode if mode != "auto" else ("compact" if len(pros) > COMPACT_THRESHOLD else "markers")
+        map_html = create_map_html(pros, real_mode)
+        entry = {
+            "version": version,
+            "html": map_html,
+            "pros": pros,
+            "stats": {
+                "mode": real_mode,
+                "markers": len(pros),
+                "html_bytes": len(map_html.encode("utf-8")),
+                "build_s": time.perf_counter() - t0,
+                "cached": False,
+            },
+        }
+        _cache[mode] = entry
+    return entry
+
+
+def invalidate():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,237 @@
+# --- METRICHE ---
+# Contatori e istogrammi di latenza per le funzioni del backend (decoratore timed) e
+# per le query SQL eseguite dal pool (cursore strumentato in db.py), con SQL
+# normalizzato: letterali e liste IN (...) diventano ?, così query uguali con
+# parametri diversi finiscono nella stessa serie. Istogrammi a bucket fissi (memoria
+# costante, p50/p95/p99 stimati sul bucket), esportabili in JSON o testo Prometheus.
+# Disattivate, il costo è un controllo di flag per chiamata.
+#
+# CARECONNECT_METRICS=1           attiva la raccolta all'avvio (modificabile dal pannello admin)
+# CARECONNECT_SLOW_QUERY_MS=50    registra le query più lente della soglia con EXPLAIN QUERY PLAN
+# CARECONNECT_METRICS_FILE=path   scrive periodicamente l'export Prometheus (textfile collector)
+import functools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("careconnect.metrics")
+
+BUCKETS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOW_LOG_SIZE = 100
+EXPORT_INTERVAL_S = 15
+
+enabled = os.environ.get("CARECONNECT_METRICS", "0") == "1"
+slow_query_ms = float(os.environ.get("CARECONNECT_SLOW_QUERY_MS", "0")) or None
+
+_lock = threading.Lock()
+_local = threading.local()
+_functions = {}
+_queries = {}
+_normalized = {}
+slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+
+
+class Histogram:
+    __slots__ = ("counts", "calls", "total_ms", "max_ms", "rows")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def observe(self, ms, rows=0):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.calls += 1
+        self.total_ms += ms
+        self.rows += rows
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        # limite superiore del bucket che contiene il quantile (il massimo osservato per l'ultimo)
+        if not self.calls:
+            return None
+        target = q * self.calls
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return round(min(BUCKETS_MS[i], self.max_ms) if i < len(BUCKETS_MS) else self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def summary(self):
+        return {"calls": self.calls, "rows": self.rows, "total_ms": round(self.total_ms, 3),
+                "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else None,
+                "p50_ms": self.percentile(0.50), "p95_ms": self.percentile(0.95), "p99_ms": self.percentile(0.99),
+                "max_ms": round(self.max_ms, 3)}
+
+
+def _hist(table, key):
+    h = table.get(key)
+    if h is None:
+        with _lock:
+            h = table.setdefault(key, Histogram())
+    return h
+
+
+# --- FUNZIONI ---
+def _rows(result):
+    # righe restituite: Rows/DataFrame/liste, o il primo elemento delle pagine (righe, cursore)
+    if isinstance(result, tuple) and result and hasattr(result[0], "columns"):
+        result = result[0]
+    if hasattr(result, "columns") or isinstance(result, list):
+        return len(result)
+    return 0
+
+
+def timed(fn):
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return fn(*args, **kwargs)
+        outer = getattr(_local, "function", None)
+        _local.function = name
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            _local.function = outer
+        _hist(_functions, name).observe((time.perf_counter() - t0) * 1000, _rows(result))
+        return result
+    return wrapper
+
+
+# --- SQL ---
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize_sql(sql):
+    norm = _normalized.get(sql)
+    if norm is None:
+        norm = " ".join(sql.split())
+        norm = _RE_STRING.sub("?", norm)
+        norm = _RE_NUMBER.sub("?", norm)
+        norm = _RE_IN_LIST.sub("(?, ...)", norm)
+        if len(_normalized) < 10000:
+            _normalized[sql] = norm
+    return norm
+
+
+def observe_sql(conn, sql, params, ms, rows=0):
+    _hist(_queries, normalize_sql(sql)).observe(ms, rows)
+    if slow_query_ms is not None and ms >= slow_query_ms:
+        _log_slow(conn, sql, params, ms)
+
+
+def add_rows(sql, rows):
+    # righe lette dopo execute (fetchall/fetchmany/fetchone del cursore strumentato)
+    h = _queries.get(_normalized.get(sql))
+    if h is not None:
+        h.rows += rows
+
+
+def _log_slow(conn, sql, params, ms):
+    plan = []
+    stmt = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    if stmt in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+        try:
+            # Connection.execute della classe base: non rientra nella strumentazione
+            plan = [r[3] for r in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()]
+        except sqlite3.Error as ex:
+            plan = [f"piano non disponibile: {ex}"]
+    entry = {"at": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(ms, 3), "sql": normalize_sql(sql),
+             "function": getattr(_local, "function", None), "plan": plan}
+    slow_queries.append(entry)
+    log.warning("query lenta %.1f ms in %s: %s | %s", ms, entry["function"], entry["sql"], " / ".join(plan))
+
+
+# --- CONTROLLO / EXPORT ---
+def configure(enable=None, slow_ms=...):
+    global enabled, slow_query_ms
+    if enable is not None:
+        enabled = bool(enable)
+    if slow_ms is not ...:
+        slow_query_ms = float(slow_ms) if slow_ms else None
+
+
+def reset():
+    with _lock:
+        _functions.clear()
+        _queries.clear()
+        slow_queries.clear()
+
+
+def snapshot():
+    with _lock:
+        functions = {k: h.summary() for k, h in _functions.items()}
+        queries = {k: h.summary() for k, h in _queries.items()}
+    return {"enabled": enabled, "slow_query_ms": slow_query_ms, "functions": functions, "queries": queries,
+            "slow_queries": list(slow_queries)}
+
+
+def to_json():
+    return json.dumps(snapshot(), indent=2, ensure_ascii=False)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", " ")
+
+
+def _prom_histogram(lines, metric, label, table):
+    lines.append(f"# TYPE {metric}_duration_seconds histogram")
+    rows = []
+    for key, h in table:
+        lbl = f'{label}="{_label(key)}"'
+        cumulative = 0
+        for bound, c in zip(BUCKETS_MS, h.counts):
+            cumulative += c
+            lines.append(f'{metric}_duration_seconds_bucket{{{lbl},le="{bound / 1000:g}"}} {cumulative}')
+        lines.append(f'{metric}_duration_seconds_bucket{{{lbl},le="+Inf"}} {h.calls}')
+        lines.append(f"{metric}_duration_seconds_sum{{{lbl}}} {h.total_ms / 1000:.6f}")
+        lines.append(f"{metric}_duration_seconds_count{{{lbl}}} {h.calls}")
+        rows.append(f"{metric}_rows_total{{{lbl}}} {h.rows}")
+    lines.append(f"# TYPE {metric}_rows_total counter")
+    lines.extend(rows)
+
+
+def to_prometheus():
+    with _lock:
+        functions = list(_functions.items())
+        queries = list(_queries.items())
+    lines = []
+    _prom_histogram(lines, "careconnect_function", "function", functions)
+    _prom_histogram(lines, "careconnect_sql", "statement", queries)
+    lines.append("# TYPE careconnect_slow_queries gauge")
+    lines.append(f"careconnect_slow_queries {len(slow_queries)}")
+    return "\n".join(lines) + "\n"
+
+
+def _export_loop(path):
+    while True:
+        time.sleep(EXPORT_INTERVAL_S)
+        try:
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(to_prometheus())
+            os.replace(tmp, path)
+        except OSError as ex:
+            log.warning("export metriche su %s fallito: %s", path, ex)
+
+
+if os.environ.get("CARECONNECT_METRICS_FILE"):
+    threading.Thread(target=_export_loop, args=(os.environ["CARECONNECT_METRICS_FILE"],),
+                     name="careconnect-metrics-export", daemon=True).start()
@@ -0,0 +1,92 @@
+# --- SQL DELLE QUERY CALDE ---
+# Unica definizione delle query del percorso caldo: backend.py le esegue e
+# db.check_query_plans ne verifica il piano (EXPLAIN QUERY PLAN) sulle stesse stringhe.
+# Le query composte (cursore keyset, filtri, LIMIT) sono funzioni che ritornano
+# (sql, params), così il check prova la stessa SQL che gira in produzione.
+
+USER_BY_USERNAME = "SELECT * FROM users WHERE LOWER(username)=?"
+
+PATIENT_HISTORY = "SELECT id, intervention_type as 'Tipo', status, created_at FROM requests WHERE patient_id=?"
+
+PRO_MY_JOBS = "SELECT r.id, u.username as Paziente, r.intervention_type, r.status FROM requests r JOIN users u ON r.patient_id = u.id WHERE r.professional_id=?"
+
+ACTIVE_CHATS_PATIENT = "SELECT intervention_type || ' (ID: ' || id || ')' as label, id FROM requests WHERE patient_id=? AND status='In Carico'"
+ACTIVE_CHATS_PRO = "SELECT intervention_type || ' (ID: ' || id || ')' as label, id FROM requests WHERE professional_id=? AND status='In Carico'"
+
+CHAT_HISTORY = "SELECT sender_id, content FROM messages WHERE request_id=? ORDER BY id ASC"
+CHAT_TAIL = "SELECT id, sender_id, content FROM messages WHERE request_id=? ORDER BY id DESC LIMIT ?"
+CHAT_BEFORE = "SELECT id, sender_id, content FROM messages WHERE request_id=? AND id<? ORDER BY id DESC LIMIT ?"
+CHAT_SINCE = "SELECT id, sender_id, content FROM messages WHERE request_id=? AND id>? ORDER BY id ASC"
+
+# Richieste aperte visibili a un professionista, in due fasi: "x" le esclusive
+# (target_pro_id=?, indice target_status) e "p" le pubbliche della città (indice
+# status_city_target). Un'unica WHERE con OR userebbe solo il prefisso status=?
+# e leggerebbe tutte le richieste aperte di tutte le città.
+OPEN_JOBS_SELECT = """SELECT r.id as ID, CASE WHEN r.target_pro_id = ? THEN '⭐ ESCLUSIVA' ELSE 'Pubblica' END as Tipo,
+                             u.username as Paziente, r.intervention_type, r.description, r.city
+                      FROM requests r JOIN users u ON r.patient_id = u.id
+                      WHERE r.status='Aperta' AND """
+
+
+def filters(alias, intervention_type=None, status=None, date_from=None, date_to=None):
+    sql, params = "", []
+    if intervention_type:
+        sql += f" AND {alias}intervention_type=?"
+        params.append(intervention_type)
+    if status:
+        sql += f" AND {alias}status=?"
+        params.append(status)
+    if date_from:
+        sql += f" AND {alias}created_at>=?"
+        params.append(str(date_from))
+    if date_to:
+        sql += f" AND {alias}created_at<=?"
+        params.append(str(date_to))
+    return sql, params
+
+
+def _page(sql, params, id_col, last_id, limit, fsql, fparams):
+    # cursore keyset (id < ultimo id visto), filtri, ordine id DESC e LIMIT opzionale
+    params = list(params)
+    if last_id:
+        sql += f" AND {id_col}<?"
+        params.append(last_id)
+    sql += fsql + f" ORDER BY {id_col} DESC"
+    params += fparams
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def open_jobs(phase, my_id, city, last_id=None, limit=None, fsql="", fparams=()):
+    if phase == "x":
+        return _page(OPEN_JOBS_SELECT + "r.target_pro_id=?", (my_id, my_id), "r.id", last_id, limit, fsql, fparams)
+    return _page(OPEN_JOBS_SELECT + "r.city=? AND r.target_pro_id IS NULL", (my_id, city), "r.id", last_id, limit, fsql, fparams)
+
+
+def my_jobs(pro_id, last_id=None, limit=None, fsql="", fparams=()):
+    return _page(PRO_MY_JOBS, (pro_id,), "r.id", last_id, limit, fsql, fparams)
+
+
+def patient_history(uid, last_id=None, limit=None, fsql="", fparams=()):
+    return _page(PATIENT_HISTORY, (uid,), "id", last_id, limit, fsql, fparams)
+
+
+def pros_by_id(ids):
+    return f"SELECT id, username, qualification, hourly_rate FROM users WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+
+
+def claim(pro_id, req_id, city, origin=None, radius_km=0):
+    # UPDATE condizionato della presa in carico (vedi backend.claim_request).
+    # La distanza usa le coordinate del paziente in users (le stesse dell'R*Tree): la
+    # UPDATE fa scattare trg_open_rtree_status, che riscrive open_requests_rtree, e
+    # leggere quella tabella nella stessa istruzione dà "database table is locked".
+    geo_clause, geo_params = "", ()
+    if origin and radius_km:
+        geo_clause = " OR (target_pro_id IS NULL AND EXISTS (SELECT 1 FROM users p WHERE p.id=requests.patient_id AND haversine_km(?, ?, p.lat, p.lon) <= ?))"
+        geo_params = (origin[0], origin[1], radius_km)
+    sql = ("UPDATE requests SET status='In Carico', professional_id=? "
+           "WHERE id=? AND status='Aperta' AND ((city=? AND target_pro_id IS NULL) OR target_pro_id=?" + geo_clause + ") "
+           "RETURNING id, (SELECT username FROM users WHERE users.id=requests.patient_id), intervention_type, status")
+    return sql, (pro_id, req_id, city, pro_id) + geo_params
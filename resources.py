@@ -0,0 +1,113 @@
+# --- RISORSE CONDIVISE ---
+# Streamlit riesegue app.py ad ogni interazione, ma i moduli importati restano in
+# sys.modules: qui teniamo le risorse pesanti (schema DB, modello AI, cache embedding)
+# una volta per processo server, condivise tra sessioni e rerun.
+# Il modello viene caricato solo alla prima richiesta di triage AI, così la Home
+# si apre subito anche a freddo.
+import importlib.util
+import logging
+import threading
+import time
+
+from config import MODEL_NAME, CACHE_DIR, KNOWLEDGE_BASE
+import db
+
+log = logging.getLogger(__name__)
+_lock = threading.Lock()
+_model_lock = threading.Lock()
+_state = {
+    "db_ready": False,
+    "model": None,
+    "model_status": "non caricato",   # non caricato | caricamento | pronto | errore
+    "model_error": None,
+    "model_load_s": None,
+    "kb_cache": None,
+    "profile_index": None,
+}
+
+
+def ai_installed() -> bool:
+    return importlib.util.find_spec("sentence_transformers") is not None
+
+
+def bootstrap_db(force: bool = False):
+    if _state["db_ready"] and not force:
+        return
+    with _lock:
+        if _state["db_ready"] and not force:
+            return
+        if force:
+            # DB ricreato sullo stesso percorso: pro_embeddings.seq riparte da capo e gli
+            # id utente vengono riusati, l'indice in memoria non è più valido
+            with _model_lock:
+                _state["profile_index"] = None
+        db.init_db()
+        db.seed_data()
+        _state["db_ready"] = True
+
+
+def get_model():
+    if _state["model"] is not None or _state["model_status"] == "errore":
+        return _state["model"]
+    if not ai_installed():
+        _state["model_status"] = "errore"
+        _state["model_error"] = "sentence-transformers non installato"
+        return None
+    with _model_lock:
+        if _state["model"] is not None or _state["model_status"] == "errore":
+            return _state["model"]
+        _state["model_status"] = "caricamento"
+        t0 = time.perf_counter()
+        try:
+            from sentence_transformers import SentenceTransformer
+            _state["model"] = SentenceTransformer(MODEL_NAME)
+            _state["model_status"] = "pronto"
+            _state["model_load_s"] = time.perf_counter() - t0
+            log.info("AI caricata in %.1fs", _state["model_load_s"])
+        except Exception as ex:
+            _state["model_status"] = "errore"
+            _state["model_error"] = str(ex)
+            log.exception("errore caricamento AI")
+    return _state["model"]
+
+
+def get_kb_cache():
+    if _state["kb_cache"] is not None:
+        return _state["kb_cache"]
+    model = get_model()
+    if model is None:
+        return None
+    from embeddings import EmbeddingCache
+    with _model_lock:
+        if _state["kb_cache"] is None:
+            _state["kb_cache"] = EmbeddingCache(model, MODEL_NAME, KNOWLEDGE_BASE, cache_dir=CACHE_DIR)
+    return _state["kb_cache"]
+
+
+def model_loaded() -> bool:
+    return _state["model"] is not None
+
+
+def get_profile_index():
+    # Indice vettoriale dei profili, legato al file DB corrente
+    model = get_model()
+    if model is None:
+        return None
+    from vector_index import ProfileIndex
+    with _model_lock:
+        idx = _state["profile_index"]
+        if idx is None or idx.db_path != db.db_path():
+            idx = ProfileIndex(model, MODEL_NAME)
+            _state["profile_index"] = idx
+    return idx
+
+
+def status() -> dict:
+    return {
+        "db_ready": _state["db_ready"],
+        "ai_installed": ai_installed(),
+        "model_status": _state["model_status"],
+        "model_error": _state["model_error"],
+        "model_load_s": _state["model_load_s"],
+        "ready": _state["db_ready"],
+    }
@@ -0,0 +1,65 @@
+# --- RISULTATI LEGGERI ---
+# Le letture del backend restituiscono Rows: tuple sqlite3 così come arrivano dal
+# cursore più i nomi di colonna (cursor.description). Niente pandas sul percorso
+# caldo: il DataFrame si costruisce solo quando una tabella viene mostrata (to_df),
+# e pandas viene importato in quel momento.
+import sqlite3
+
+
+class Rows:
+    __slots__ = ("columns", "data")
+
+    def __init__(self, columns, data=()):
+        self.columns = tuple(columns)
+        self.data = data if isinstance(data, list) else list(data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __repr__(self):
+        return f"Rows({len(self.data)} x {self.columns})"
+
+    @property
+    def empty(self) -> bool:
+        return not self.data
+
+    def index(self, name) -> int:
+        return self.columns.index(name)
+
+    def column(self, name) -> list:
+        i = self.columns.index(name)
+        return [r[i] for r in self.data]
+
+    def last(self, name):
+        return self.data[-1][self.columns.index(name)]
+
+    def where(self, name, keep) -> "Rows":
+        # righe per cui keep(valore della colonna) è vero
+        i = self.columns.index(name)
+        return Rows(self.columns, [r for r in self.data if keep(r[i])])
+
+    def without(self, *names) -> "Rows":
+        keep = [i for i, c in enumerate(self.columns) if c not in names]
+        return Rows([self.columns[i] for i in keep], [tuple(r[i] for i in keep) for r in self.data])
+
+    def __add__(self, other) -> "Rows":
+        return Rows(self.columns, self.data + list(other))
+
+    def records(self) -> list:
+        return [dict(zip(self.columns, r)) for r in self.data]
+
+    def to_df(self):
+        import pandas as pd
+        return pd.DataFrame(self.data, columns=list(self.columns))
+
+
+def fetch(conn: sqlite3.Connection, sql, params=()) -> Rows:
+    cur = conn.execute(sql, params)
+    data = cur.fetchall()
+    return Rows([d[0] for d in cur.description], data)
@@ -0,0 +1,115 @@
+# --- STATISTICHE OPERATIVE ---
+# Letture dalle tabelle stats_* (migrazione 10), mantenute dai trigger su requests e
+# messages: la dimensione delle tabelle lette dipende da città x tipi x stati, non dal
+# numero di richieste o messaggi. reconcile() ricalcola gli aggregati con GROUP BY,
+# riporta le differenze e, con fix=True, ricostruisce le tabelle.
+#
+# Uso: python stats.py [--db home_care_v21.db] [--fix]
+import argparse
+import datetime
+import sys
+
+from config import DB_NAME
+import db
+from rows import fetch
+
+OPEN, IN_PROGRESS = "Aperta", "In Carico"
+
+
+def request_counts(city=None, intervention_type=None):
+    # una riga per (città, tipo) con Aperte / In Carico / Totale
+    sql = f"""SELECT city, intervention_type,
+                     sum(CASE WHEN status='{OPEN}' THEN n ELSE 0 END) AS Aperte,
+                     sum(CASE WHEN status='{IN_PROGRESS}' THEN n ELSE 0 END) AS "In Carico",
+                     sum(n) AS Totale
+              FROM stats_requests WHERE 1=1"""
+    params = []
+    if city:
+        sql += " AND city=?"
+        params.append(city)
+    if intervention_type:
+        sql += " AND intervention_type=?"
+        params.append(intervention_type)
+    with db.connection() as conn:
+        return fetch(conn, sql + " GROUP BY city, intervention_type HAVING Totale > 0 ORDER BY Totale DESC", params)
+
+
+def totals():
+    with db.connection() as conn:
+        rows = conn.execute("SELECT status, sum(n) FROM stats_requests GROUP BY status").fetchall()
+        msgs = conn.execute("SELECT coalesce(sum(n), 0) FROM stats_messages_daily").fetchone()[0]
+    by_status = dict(rows)
+    return {"open": by_status.get(OPEN, 0), "in_progress": by_status.get(IN_PROGRESS, 0),
+            "total": sum(by_status.values()), "messages": msgs}
+
+
+def workload(pro_id):
+    # {stato: numero richieste} per un professionista
+    with db.connection() as conn:
+        return dict(conn.execute("SELECT status, n FROM stats_workload WHERE professional_id=? AND n > 0", (pro_id,)).fetchall())
+
+
+def top_workload(limit=20, status=IN_PROGRESS):
+    with db.connection() as conn:
+        return fetch(conn, """SELECT w.professional_id AS ID, u.username, u.city, w.n AS carichi
+                              FROM stats_workload w LEFT JOIN users u ON u.id = w.professional_id
+                              WHERE w.status=? AND w.n > 0 ORDER BY w.n DESC LIMIT ?""", (status, limit))
+
+
+def messages_per_day(days=30):
+    since = str(datetime.date.today() - datetime.timedelta(days=days - 1))
+    with db.connection() as conn:
+        return fetch(conn, "SELECT day, n AS messaggi FROM stats_messages_daily WHERE day>=? ORDER BY day", (since,))
+
+
+# --- RICONCILIAZIONE ---
+_CHECKS = {
+    "stats_requests": ("""SELECT coalesce(city, ''), coalesce(intervention_type, ''), coalesce(status, ''), count(*)
+                          FROM requests GROUP BY 1, 2, 3""",
+                       "SELECT city, intervention_type, status, n FROM stats_requests WHERE n != 0"),
+    "stats_workload": ("""SELECT professional_id, coalesce(status, ''), count(*)
+                          FROM requests WHERE professional_id IS NOT NULL GROUP BY 1, 2""",
+                       "SELECT professional_id, status, n FROM stats_workload WHERE n != 0"),
+    "stats_messages_daily": ("SELECT coalesce(substr(timestamp, 1, 10), ''), count(*) FROM messages GROUP BY 1",
+                             "SELECT day, n FROM stats_messages_daily WHERE n != 0"),
+}
+
+
+def reconcile(fix=False):
+    # ritorna {tabella: [(chiave, atteso, salvato)]} con le sole differenze
+    drift = {}
+    with db.transaction(immediate=fix) as conn:
+        for table, (expected_sql, stored_sql) in _CHECKS.items():
+            expected = {tuple(r[:-1]): r[-1] for r in conn.execute(expected_sql)}
+            stored = {tuple(r[:-1]): r[-1] for r in conn.execute(stored_sql)}
+            diff = [(k, expected.get(k, 0), stored.get(k, 0)) for k in expected.keys() | stored.keys()
+                    if expected.get(k, 0) != stored.get(k, 0)]
+            if diff:
+                drift[table] = sorted(diff, key=lambda d: tuple(map(str, d[0])))
+        if fix and drift:
+            for step in db.STATS_REBUILD:
+                conn.execute(step)
+    return drift
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Verifica (e ricostruisce) le statistiche pre-aggregate")
+    ap.add_argument("--db", default=DB_NAME)
+    ap.add_argument("--fix", action="store_true", help="ricostruisce le tabelle stats_* se ci sono differenze")
+    args = ap.parse_args(argv)
+    db.configure(args.db)
+    db.migrate()
+    drift = reconcile(fix=args.fix)
+    if not drift:
+        print("statistiche allineate")
+        return 0
+    for table, rows in drift.items():
+        print(f"{table}: {len(rows)} chiavi diverse")
+        for key, expected, stored in rows[:20]:
+            print(f"  {key}: atteso {expected}, salvato {stored}")
+    print("ricostruite" if args.fix else "usa --fix per ricostruirle")
+    return 0 if args.fix else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
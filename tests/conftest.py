@@ -0,0 +1,89 @@
+# Fixture comuni: DB temporaneo migrato e con i dati demo, hash veloci.
+import os
+import sys
+
+os.environ.setdefault("CARECONNECT_PBKDF2_ROUNDS", "1000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import db
+import resources
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    db.configure(str(tmp_path / "test.db"))
+    resources.bootstrap_db(force=True)
+    yield db.db_path()
+    db.close_all()
+
+
+@pytest.fixture
+def group_writer(temp_db):
+    # writer dedicato al test (non il singleton di writer.py), fermato a fine test
+    from writer import GroupCommitWriter
+
+    w = GroupCommitWriter(max_batch=64, max_delay_ms=20, enabled=True)
+    yield w
+    w.shutdown()
+
+
+# schema di home_care_v21.db prima delle migrazioni (user_version=0), come lo creava app.py
+LEGACY_SCHEMA = [
+    '''CREATE TABLE users
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE, password TEXT, role TEXT, city TEXT,
+        lat REAL, lon REAL, bio TEXT, qualification TEXT,
+        experience INTEGER, hourly_rate REAL,
+        email TEXT, address TEXT, age INTEGER,
+        clinical_history TEXT, detailed_experience TEXT)''',
+    '''CREATE TABLE requests
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        professional_id INTEGER,
+        target_pro_id INTEGER,
+        intervention_type TEXT,
+        description TEXT,
+        city TEXT,
+        status TEXT,
+        created_at TEXT,
+        FOREIGN KEY(patient_id) REFERENCES users(id))''',
+    '''CREATE TABLE messages
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id INTEGER,
+        sender_id INTEGER,
+        content TEXT,
+        timestamp TEXT,
+        FOREIGN KEY(request_id) REFERENCES requests(id))''',
+]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    # DB esistente con dati e senza migrazioni: il test chiama db.migrate() sul posto
+    import sqlite3
+    from hashing import hash_password
+
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    for sql in LEGACY_SCHEMA:
+        conn.execute(sql)
+    pw = hash_password("pass")
+    conn.executemany("INSERT INTO users (id, username, password, role, city, lat, lon, bio, qualification, hourly_rate) VALUES (?,?,?,?,?,?,?,?,?,?)", [
+        (1, "mario_rossi", pw, "paziente", "Milano", 45.4642, 9.19, "Paziente", None, 0),
+        (2, "luigi_verdi", pw, "professionista", "Milano", 45.468, 9.2, "Infermiere", "Infermiere", 25.0),
+        (3, "paola_neri", pw, "paziente", "Roma", 41.9028, 12.4964, "Paziente", None, 0),
+    ])
+    conn.executemany("INSERT INTO requests (id, patient_id, professional_id, target_pro_id, intervention_type, description, city, status, created_at) VALUES (?,?,?,?,?,?,?,?,?)", [
+        (1, 1, None, None, "Visita Medica", "controllo glicemia", "Milano", "Aperta", "2024-01-10"),
+        (2, 1, None, 2, "Assistenza", "medicazione", "Milano", "Aperta", "2024-01-11"),
+        (3, 3, None, None, "Visita Medica", "controllo", "Roma", "Aperta", "2024-01-12"),
+        (4, 1, 2, None, "Assistenza", "terapia", "Milano", "In Carico", "2024-01-05"),
+    ])
+    conn.execute("INSERT INTO messages (request_id, sender_id, content, timestamp) VALUES (4, 2, 'arrivo alle 10', '2024-01-05 09:00:00')")
+    conn.commit()
+    conn.close()
+    db.configure(path)
+    yield path
+    db.close_all()
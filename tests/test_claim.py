@@ -0,0 +1,44 @@
+# Presa in carico atomica (UPDATE condizionato), anche in modalità raggio tra città
+import backend
+import db
+
+PRO_ORIGIN = (45.468, 9.2)   # luigi_verdi, Milano
+
+
+def _request(city, lat, lon, target=None):
+    with db.transaction() as conn:
+        uid = conn.execute("INSERT INTO users (username, password, role, city, lat, lon) VALUES (?, 'x', 'paziente', ?, ?, ?)",
+                           (f"pat_{city}_{lat}", city, lat, lon)).lastrowid
+        rid = conn.execute("INSERT INTO requests (patient_id, target_pro_id, intervention_type, description, city, status, created_at) VALUES (?, ?, 'Assistenza', 'x', ?, 'Aperta', '2024-01-01')",
+                           (uid, target, city)).lastrowid
+    return uid, rid
+
+
+def _pro_id():
+    return backend.conn_fetch_user_by_username("luigi_verdi")[0]
+
+
+def test_claim_cross_city_request_within_radius(temp_db):
+    _, rid = _request("Monza", 45.5845, 9.2744)   # ~14 km da Milano
+    pro_id = _pro_id()
+    ok, _, row = backend.accept_request(rid, pro_id, "Milano", PRO_ORIGIN, 20)
+    assert ok
+    assert tuple(row) == (rid, "pat_Monza_45.5845", "Assistenza", "In Carico")
+    with db.connection() as conn:
+        assert conn.execute("SELECT professional_id FROM requests WHERE id=?", (rid,)).fetchone()[0] == pro_id
+        assert conn.execute("SELECT count(*) FROM open_requests_rtree WHERE id=?", (rid,)).fetchone()[0] == 0
+
+
+def test_claim_outside_radius_or_city_is_refused(temp_db):
+    _, rid = _request("Monza", 45.5845, 9.2744)
+    pro_id = _pro_id()
+    assert backend.claim_request(rid, pro_id, "Milano") is None
+    assert backend.claim_request(rid, pro_id, "Milano", PRO_ORIGIN, 5) is None
+    assert backend.claim_request(rid, pro_id, "Milano", PRO_ORIGIN, 20) is not None
+    # già in carico: il secondo UPDATE non trova più status='Aperta'
+    assert backend.claim_request(rid, pro_id, "Milano", PRO_ORIGIN, 20) is None
+
+
+def test_exclusive_request_for_another_pro_is_not_claimable_by_radius(temp_db):
+    _, rid = _request("Milano", 45.47, 9.19, target=9999)
+    assert backend.claim_request(rid, _pro_id(), "Milano", PRO_ORIGIN, 20) is None
@@ -0,0 +1,57 @@
+# Dispatch automatico: prese in carico tra città a raggio e isolamento degli errori
+import sqlite3
+
+import backend
+import db
+import dispatch
+from config import INTERVENTION_MAPPING
+
+
+def _nurse_type():
+    return next(t for t, allowed in INTERVENTION_MAPPING.items() if "Infermiere" in allowed)
+
+
+def _request(username, city, lat, lon):
+    with db.transaction() as conn:
+        uid = conn.execute("INSERT INTO users (username, password, role, city, lat, lon) VALUES (?, 'x', 'paziente', ?, ?, ?)",
+                           (username, city, lat, lon)).lastrowid
+        return conn.execute("INSERT INTO requests (patient_id, intervention_type, description, city, status, created_at) VALUES (?, ?, 'x', ?, 'Aperta', '2024-01-01')",
+                            (uid, _nurse_type(), city)).lastrowid
+
+
+def _status(rid):
+    with db.connection() as conn:
+        return conn.execute("SELECT status, professional_id FROM requests WHERE id=?", (rid,)).fetchone()
+
+
+def test_cross_city_assignment_within_radius(temp_db):
+    # luigi_verdi (Infermiere, Milano) è l'unico professionista del DB demo
+    pro_id = backend.conn_fetch_user_by_username("luigi_verdi")[0]
+    monza = _request("pat_monza", "Monza", 45.5845, 9.2744)
+    milano = _request("pat_milano", "Milano", 45.47, 9.19)
+    rep = dispatch.run()
+    assert (rep["assigned"], rep["applied"], rep["failed"]) == (2, 2, 0)
+    assert _status(monza) == ("In Carico", pro_id)
+    assert _status(milano) == ("In Carico", pro_id)
+
+
+def test_failed_claim_does_not_undo_the_run(temp_db, monkeypatch):
+    monza = _request("pat_monza", "Monza", 45.5845, 9.2744)
+    milano = _request("pat_milano", "Milano", 45.47, 9.19)
+    claim = backend.claim_request
+
+    def flaky(req_id, *args, **kw):
+        if req_id == monza:
+            with db.transaction() as conn:
+                # scrittura parziale prima dell'errore: va annullata solo lei
+                conn.execute("UPDATE requests SET description='parziale' WHERE id=?", (req_id,))
+            raise sqlite3.OperationalError("database table is locked")
+        return claim(req_id, *args, **kw)
+
+    monkeypatch.setattr(backend, "claim_request", flaky)
+    rep = dispatch.run()
+    assert (rep["applied"], rep["failed"]) == (1, 1)
+    assert _status(milano)[0] == "In Carico"
+    assert _status(monza) == ("Aperta", None)
+    with db.connection() as conn:
+        assert conn.execute("SELECT description FROM requests WHERE id=?", (monza,)).fetchone()[0] == "x"
@@ -0,0 +1,56 @@
+# Triage interattivo (encode_query) e batch (batch_triage.classify) devono codificare
+# lo stesso testo: il modello reale distingue le maiuscole
+import hashlib
+
+import numpy as np
+
+import batch_triage
+from config import KNOWLEDGE_BASE
+from embeddings import EmbeddingCache, HashingEncoder
+
+TEXTS = ["Dolore  al GINOCCHIO dopo\nl'intervento", "diabete, controllo glicemia", "Mia madre ha la Demenza", "  PRELIEVO   a domicilio "]
+
+
+class CasedEncoder(HashingEncoder):
+    # come HashingEncoder ma sensibile alle maiuscole; registra i testi ricevuti
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+
+    def _vec(self, text):
+        self.seen.append(text)
+        v = np.zeros(self.dim, dtype=np.float32)
+        for w in text.split():
+            h = int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0
+        return v
+
+
+def _cache():
+    return EmbeddingCache(CasedEncoder(), "cased", KNOWLEDGE_BASE)
+
+
+def test_query_is_encoded_with_case_and_collapsed_spaces():
+    cache = _cache()
+    cache.encode_query(TEXTS[0])
+    assert cache.model.seen[-1] == "Dolore al GINOCCHIO dopo l'intervento"
+
+
+def test_interactive_and_batch_encodings_agree():
+    cache = _cache()
+    batch = cache.encode_texts(TEXTS)
+    best, conf = batch_triage.classify(cache, TEXTS, batch_size=2)
+    for i, text in enumerate(TEXTS):
+        assert np.allclose(cache.encode_query(text), batch[i])
+        label, score = cache.best_match(text)
+        assert label == KNOWLEDGE_BASE[best[i]]
+        assert np.isclose(score, conf[i])
+
+
+def test_case_variants_do_not_share_a_cache_entry():
+    cache = _cache()
+    upper = cache.encode_query("Demenza")
+    lower = cache.encode_query("demenza")
+    assert not np.allclose(upper, lower)
+    assert np.allclose(cache.encode_query("  Demenza "), upper)
+    assert (cache.hits, cache.misses) == (1, 2)
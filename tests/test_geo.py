@@ -0,0 +1,76 @@
+# Feed delle richieste aperte per distanza: paginazione keyset (km, id) e filtro tipo
+import random
+
+import db
+import geo
+from config import INTERVENTION_MAPPING
+
+CENTER = (45.4642, 9.1900)
+TYPES = list(INTERVENTION_MAPPING)[:2]
+
+
+def _seed(n=180, exclusive=7, seed=1):
+    rnd = random.Random(seed)
+    with db.transaction() as conn:
+        pro_id = conn.execute("SELECT id FROM users WHERE role='professionista'").fetchone()[0]
+        for i in range(n):
+            lat, lon = CENTER[0] + rnd.uniform(-0.3, 0.3), CENTER[1] + rnd.uniform(-0.3, 0.3)
+            uid = conn.execute("INSERT INTO users (username, password, role, city, lat, lon) VALUES (?, 'x', 'paziente', 'Milano', ?, ?)",
+                               (f"geo_pat_{i}", lat, lon)).lastrowid
+            conn.execute("INSERT INTO requests (patient_id, target_pro_id, intervention_type, description, city, status, created_at) VALUES (?, ?, ?, 'geo', 'Milano', 'Aperta', '2024-01-01')",
+                         (uid, pro_id if i < exclusive else None, TYPES[i % 2]))
+            if i % 10 == 0:
+                # due richieste alla stessa distanza: il cursore deve distinguerle per id
+                conn.execute("INSERT INTO requests (patient_id, intervention_type, description, city, status, created_at) VALUES (?, ?, 'geo', 'Milano', 'Aperta', '2024-01-01')",
+                             (uid, TYPES[0]))
+    return pro_id
+
+
+def _all_pages(pro_id, radius, limit, **kw):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = geo.open_requests_within(*CENTER, radius, pro_id, limit=limit, cursor=cursor, **kw)
+        assert len(rows) <= limit
+        seen.extend(rows)
+        if cursor is None:
+            return seen
+
+
+def test_pages_cover_the_unpaginated_feed(temp_db):
+    pro_id = _seed()
+    full, cursor = geo.open_requests_within(*CENTER, 25, pro_id)
+    assert cursor is None
+    for limit in (5, 7, 50):
+        paged = _all_pages(pro_id, 25, limit)
+        assert [r[0] for r in paged] == [r[0] for r in full]
+    public_km = [r[6] for r in full if r[1] == 'Pubblica']
+    assert public_km == sorted(public_km) and max(public_km) <= 25
+    assert sum(r[1] != 'Pubblica' for r in full) == 7
+
+
+def test_intervention_type_filter(temp_db):
+    pro_id = _seed()
+    paged = _all_pages(pro_id, 25, 10, intervention_type=TYPES[1])
+    assert paged and all(r[3] == TYPES[1] for r in paged)
+    full, _ = geo.open_requests_within(*CENTER, 25, pro_id)
+    assert len(paged) == sum(r[3] == TYPES[1] for r in full)
+
+
+def test_exclusive_rows_distance(temp_db):
+    pro_id = _seed(n=12, exclusive=5)
+    with db.transaction() as conn:
+        # esclusiva di un paziente senza coordinate: km None, resta nel feed
+        uid = conn.execute("INSERT INTO users (username, password, role, city) VALUES ('geo_nocoords', 'x', 'paziente', 'Milano')").lastrowid
+        rid = conn.execute("INSERT INTO requests (patient_id, target_pro_id, intervention_type, description, city, status, created_at) VALUES (?, ?, ?, 'geo', 'Milano', 'Aperta', '2024-01-01')",
+                           (uid, pro_id, TYPES[0])).lastrowid
+        coords = {r[0]: r[1:] for r in conn.execute("""SELECT r.id, u.lat, u.lon FROM requests r JOIN users u ON u.id = r.patient_id
+                                                        WHERE r.target_pro_id=?""", (pro_id,))}
+    rows, _ = geo.open_requests_within(*CENTER, 25, pro_id)
+    excl = [r for r in rows if r[1] != 'Pubblica']
+    assert [r[0] for r in excl] == sorted(coords, reverse=True)
+    for r in excl:
+        if r[0] == rid:
+            assert r[6] is None
+        else:
+            lat, lon = coords[r[0]]
+            assert r[6] == round(float(geo.haversine_km(*CENTER, [lat], [lon])[0]), 1)
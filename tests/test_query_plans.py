@@ -0,0 +1,45 @@
+import backend
+import db
+import queries
+
+
+def _failed(plans):
+    return {name: plan for name, (ok, plan) in plans.items() if not ok}
+
+
+def test_hot_queries_use_indexes(temp_db):
+    assert _failed(db.check_query_plans()) == {}
+
+
+def test_or_filter_on_open_jobs_is_rejected(temp_db):
+    # la vecchia get_pro_open_jobs: con l'OR l'indice restringe solo status=? e
+    # tutte le richieste aperte finiscono in un ordinamento temporaneo
+    legacy = """SELECT r.id FROM requests r JOIN users u ON r.patient_id = u.id
+                WHERE r.status='Aperta' AND ((r.city=? AND r.target_pro_id IS NULL) OR r.target_pro_id=?)
+                ORDER BY r.target_pro_id DESC, r.id DESC"""
+    assert _failed(db.check_query_plans({"or": (legacy, ("Milano", 1))}))
+
+
+def test_hot_queries_match_backend_sql(temp_db):
+    sql, params = db.HOT_QUERIES["list_open_jobs (pubbliche)"]
+    assert sql.startswith(queries.OPEN_JOBS_SELECT)
+    assert db.HOT_QUERIES["authenticate"][0] == queries.USER_BY_USERNAME
+
+
+def test_in_place_upgrade_from_baseline_schema(legacy_db):
+    applied = db.migrate()
+    assert [v for v, _ in applied] == [v for v, _, _ in db.MIGRATIONS]
+    with db.connection() as conn:
+        assert db.schema_version(conn) == db.SCHEMA_VERSION
+        assert conn.execute("SELECT count(*) FROM requests").fetchone()[0] == 4
+    assert db.migrate() == []
+    assert _failed(db.check_query_plans()) == {}
+
+    # i dati esistenti sono leggibili con le query nuove
+    assert backend.authenticate("Mario_Rossi", "pass")[0] == 1
+    jobs = backend.get_pro_open_jobs("Milano", 2)
+    assert jobs.column("ID") == [2, 1]
+    assert jobs.column("Tipo") == ["⭐ ESCLUSIVA", "Pubblica"]
+    page, cursor = backend.list_open_jobs("Milano", 2, limit=1)
+    assert page.column("ID") == [2] and cursor == ("x", 2)
+    assert backend.get_chat_history(4) == [(2, "arrivo alle 10")]
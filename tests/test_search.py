@@ -0,0 +1,92 @@
+# Ricerca full-text: indici FTS5 mantenuti dai trigger, ambito per ruolo, paginazione (bm25, id)
+import backend
+import db
+
+
+def _user(conn, username, role):
+    return conn.execute("INSERT INTO users (username, password, role, city) VALUES (?, 'x', ?, 'Milano')", (username, role)).lastrowid
+
+
+def _request(conn, patient, desc, pro=None, target=None, kind="Assistenza"):
+    status = "In Carico" if pro else "Aperta"
+    return conn.execute("""INSERT INTO requests (patient_id, professional_id, target_pro_id, intervention_type, description, city, status, created_at)
+                           VALUES (?, ?, ?, ?, ?, 'Milano', ?, '2024-01-01')""", (patient, pro, target, kind, desc, status)).lastrowid
+
+
+def _setup():
+    with db.transaction() as conn:
+        ids = {"pat_a": _user(conn, "pat_a", "paziente"), "pat_b": _user(conn, "pat_b", "paziente"),
+               "pro": _user(conn, "pro_x", "professionista"), "other": _user(conn, "pro_y", "professionista")}
+        ids["r_assigned"] = _request(conn, ids["pat_a"], "dolore al ginocchio dopo una caduta", pro=ids["pro"])
+        ids["r_open"] = _request(conn, ids["pat_a"], "controllo glicemia per diabete")
+        ids["r_exclusive"] = _request(conn, ids["pat_b"], "ginocchio gonfio da una settimana", target=ids["pro"])
+        ids["r_public"] = _request(conn, ids["pat_b"], "ginocchio operato, serve fisioterapia")
+        ids["m_first"] = conn.execute("INSERT INTO messages (request_id, sender_id, content, timestamp) VALUES (?, ?, 'porto la ginocchiera domani', '2024-01-02')",
+                                      (ids["r_assigned"], ids["pro"])).lastrowid
+    return ids
+
+
+def _req_ids(query, user_id, role):
+    return sorted(backend.search_requests(query, user_id, role)[0].column("ID"))
+
+
+def test_scope_by_role(temp_db):
+    ids = _setup()
+    assert _req_ids("ginocchio", ids["pat_a"], "paziente") == [ids["r_assigned"]]
+    assert _req_ids("ginocchio", ids["pat_b"], "paziente") == sorted([ids["r_exclusive"], ids["r_public"]])
+    # professionista: assegnate o esclusive, mai le pubbliche altrui
+    assert _req_ids("ginocchio", ids["pro"], "professionista") == sorted([ids["r_assigned"], ids["r_exclusive"]])
+    assert _req_ids("ginocchio", ids["other"], "professionista") == []
+    assert backend.search_messages("ginocchiera", ids["pat_a"], "paziente")[0].column("ID") == [ids["m_first"]]
+    assert backend.search_messages("ginocchiera", ids["pat_b"], "paziente")[0].empty
+    assert backend.search_messages("ginocchiera", ids["pro"], "professionista")[0].column("ID") == [ids["m_first"]]
+
+
+def test_prefix_and_type_match(temp_db):
+    ids = _setup()
+    assert _req_ids("GINOC", ids["pat_b"], "paziente") == sorted([ids["r_exclusive"], ids["r_public"]])
+    assert _req_ids("glicemia diab", ids["pat_a"], "paziente") == [ids["r_open"]]
+    assert _req_ids("assistenza", ids["pat_a"], "paziente") == sorted([ids["r_assigned"], ids["r_open"]])
+    assert backend.search_requests("  ...  ", ids["pat_a"], "paziente")[0].empty
+
+
+def test_triggers_follow_insert_update_delete(temp_db):
+    ids = _setup()
+    with db.transaction() as conn:
+        conn.execute("UPDATE requests SET description='caviglia slogata' WHERE id=?", (ids["r_public"],))
+        conn.execute("UPDATE requests SET intervention_type='Fisioterapia' WHERE id=?", (ids["r_open"],))
+        conn.execute("UPDATE messages SET content='cambio medicazione' WHERE id=?", (ids["m_first"],))
+        m_new = conn.execute("INSERT INTO messages (request_id, sender_id, content, timestamp) VALUES (?, ?, 'ginocchiera nuova', '2024-01-03')",
+                             (ids["r_assigned"], ids["pat_a"])).lastrowid
+        conn.execute("DELETE FROM requests WHERE id=?", (ids["r_exclusive"],))
+    assert _req_ids("ginocchio", ids["pat_b"], "paziente") == []
+    assert _req_ids("caviglia", ids["pat_b"], "paziente") == [ids["r_public"]]
+    assert _req_ids("fisioterapia", ids["pat_a"], "paziente") == [ids["r_open"]]
+    assert backend.search_messages("ginocchiera", ids["pat_a"], "paziente")[0].column("ID") == [m_new]
+    assert backend.search_messages("medicazione", ids["pat_a"], "paziente")[0].column("ID") == [ids["m_first"]]
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM messages WHERE id=?", (m_new,))
+    assert backend.search_messages("ginocchiera", ids["pat_a"], "paziente")[0].empty
+    with db.connection() as conn:
+        # l'indice resta coerente con le tabelle
+        conn.execute("INSERT INTO requests_fts (requests_fts) VALUES ('integrity-check')")
+        conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')")
+
+
+def test_keyset_pages_cover_all_results(temp_db):
+    with db.transaction() as conn:
+        pat = _user(conn, "pat_pages", "paziente")
+        for i in range(23):
+            # descrizioni ripetute: stesso punteggio bm25, il cursore distingue per id
+            _request(conn, pat, "terapia " * (1 + i % 4) + f"nota {i % 3}")
+    full, cursor = backend.search_requests("terapia", pat, "paziente", limit=100)
+    assert cursor is None and len(full) == 23
+    assert list(zip(full.column("score"), full.column("ID"))) == sorted(zip(full.column("score"), full.column("ID")))
+    seen, cursor = [], None
+    while True:
+        page, cursor = backend.search_requests("terapia", pat, "paziente", cursor=cursor, limit=5)
+        assert len(page) <= 5
+        seen += page.column("ID")
+        if cursor is None:
+            break
+    assert seen == full.column("ID")
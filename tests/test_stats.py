@@ -0,0 +1,63 @@
+# Statistiche pre-aggregate: trigger su requests/messages e riconciliazione delle derive
+import datetime
+
+import backend
+import db
+import stats
+
+
+def _ids():
+    pat = backend.conn_fetch_user_by_username("mario_rossi")[0]
+    pro = backend.conn_fetch_user_by_username("luigi_verdi")[0]
+    return pat, pro
+
+
+def _populate():
+    pat, pro = _ids()
+    for kind in ("Assistenza", "Assistenza", "Visita Medica", "Visita Medica"):
+        backend.submit_request(pat, kind, "stats", "Milano", None)
+    with db.connection() as conn:
+        rids = [r[0] for r in conn.execute("SELECT id FROM requests WHERE patient_id=? ORDER BY id", (pat,))]
+    for rid in rids[:3]:
+        assert backend.accept_request(rid, pro, "Milano")[0]
+    backend.send_chat_msg(rids[0], pat, "buongiorno")
+    backend.send_chat_msg(rids[0], pro, "arrivo alle 10")
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM requests WHERE id=?", (rids[1],))
+    return pat, pro, rids
+
+
+def test_triggers_keep_counters(temp_db):
+    _, pro, rids = _populate()
+    assert stats.totals() == {"open": 1, "in_progress": 2, "total": 3, "messages": 2}
+    assert stats.workload(pro) == {"In Carico": 2}
+    counts = {(r[0], r[1]): r[2:] for r in stats.request_counts()}
+    assert counts == {("Milano", "Visita Medica"): (1, 1, 2), ("Milano", "Assistenza"): (0, 1, 1)}
+    today = str(datetime.date.today())
+    assert stats.messages_per_day(1).records() == [{"day": today, "messaggi": 2}]
+    assert stats.top_workload().column("ID") == [pro]
+    assert stats.reconcile() == {}
+
+
+def test_reconcile_repairs_drift(temp_db):
+    _, pro, rids = _populate()
+    with db.transaction() as conn:
+        conn.execute("UPDATE stats_requests SET n=n+5 WHERE intervention_type='Assistenza' AND status='In Carico'")
+        conn.execute("DELETE FROM stats_workload")
+        conn.execute("INSERT INTO stats_messages_daily VALUES ('1999-01-01', 3)")
+    drift = stats.reconcile()
+    assert drift == {
+        "stats_requests": [(("Milano", "Assistenza", "In Carico"), 1, 6)],
+        "stats_workload": [((pro, "In Carico"), 2, 0)],
+        "stats_messages_daily": [(("1999-01-01",), 0, 3)],
+    }
+    # senza fix non si tocca nulla
+    assert stats.reconcile() == drift
+    assert stats.reconcile(fix=True) == drift
+    assert stats.reconcile() == {}
+    assert stats.totals() == {"open": 1, "in_progress": 2, "total": 3, "messages": 2}
+    assert stats.workload(pro) == {"In Carico": 2}
+    # dopo la ricostruzione i trigger continuano da valori corretti
+    backend.accept_request(rids[3], pro, "Milano")
+    assert stats.workload(pro) == {"In Carico": 3}
+    assert stats.reconcile() == {}
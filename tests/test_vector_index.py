@@ -0,0 +1,104 @@
+# Indice vettoriale dei profili con l'encoder deterministico HashingEncoder
+import pytest
+
+import backend
+import db
+import geo
+import resources
+from config import CITY_COORDS
+from embeddings import HashingEncoder, l2_normalize
+from vector_index import ProfileIndex
+
+PROS = [
+    # username, città, qualifica, bio
+    ("anna", "Milano", "Infermiere", "infermiera esperta in medicazioni e prelievi"),
+    ("bruno", "Milano", "Fisioterapista", "fisioterapia sportiva e riabilitazione del ginocchio"),
+    ("carla", "Roma", "Infermiere", "infermiera per terapie domiciliari e prelievi"),
+    ("dario", "Roma", "OSS", "assistenza anziani igiene e mobilizzazione"),
+]
+
+
+class CountingEncoder(HashingEncoder):
+    def __init__(self):
+        super().__init__()
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        if not isinstance(texts, str):
+            self.encoded.extend(texts)
+        return super().encode(texts, **kwargs)
+
+
+def _add_pro(conn, username, city, qual, bio):
+    lat, lon = CITY_COORDS[city]
+    return conn.execute("""INSERT INTO users (username, password, role, city, lat, lon, bio, qualification, experience, hourly_rate)
+                           VALUES (?, 'x', 'professionista', ?, ?, ?, ?, ?, 1, 20)""", (username, city, lat, lon, bio, qual)).lastrowid
+
+
+@pytest.fixture
+def index(temp_db):
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM users WHERE role='professionista'")   # professionista demo
+        ids = {p[0]: _add_pro(conn, *p) for p in PROS}
+    idx = ProfileIndex(CountingEncoder(), "test-hashing")
+    idx.update()
+    idx.pro_ids = ids
+    return idx
+
+
+def _query(text):
+    return l2_normalize(HashingEncoder().encode([text]))[0]
+
+
+def test_update_encodes_only_changed_profile(index):
+    index.encoder.encoded.clear()
+    uid = index.pro_ids["bruno"]
+    ok, _ = backend.update_full_profile(uid, "professionista", None, "logopedia per adulti", None, None, 40, None, None,
+                                        qual="Fisioterapista", num_exp=5, rate=30)
+    assert ok
+    index.update()
+    assert index.encoder.encoded == ["Fisioterapista. logopedia per adulti"]
+    assert index.search(_query("logopedia adulti"), 1)[0][0] == uid
+
+
+def test_deleted_profile_is_tombstoned(index):
+    before = len(index)
+    uid = index.pro_ids["anna"]
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM users WHERE id=?", (uid,))
+    index.update()
+    assert len(index) == before - 1
+    assert uid not in [h[0] for h in index.search(_query("infermiera medicazioni prelievi"), 10)]
+
+
+def test_masks_and_top_k_order(index):
+    q = _query("infermiera prelievi")
+    hits = index.search(q, 10)
+    scores = [s for _, s in hits]
+    assert scores == sorted(scores, reverse=True)
+    assert {hits[0][0], hits[1][0]} == {index.pro_ids["anna"], index.pro_ids["carla"]}
+    assert len(index.search(q, 2)) == 2
+
+    roma = index.search(q, 10, city="Roma")
+    with db.connection() as conn:
+        cities = {r[0]: r[1] for r in conn.execute("SELECT id, city FROM users")}
+    assert roma and all(cities[uid] == "Roma" for uid, _ in roma)
+
+    nurses = index.search(q, 10, qualifications=["Infermiere"])
+    assert {uid for uid, _ in nurses} == {index.pro_ids["anna"], index.pro_ids["carla"]}
+
+    lat, lon = CITY_COORDS["Milano"]
+    near = geo.pros_within(lat, lon, 30)
+    within = index.search(q, 10, ids=near.column("ID"))
+    assert within and {uid for uid, _ in within} <= set(near.column("ID"))
+    assert index.pro_ids["carla"] not in {uid for uid, _ in within}
+
+
+def test_reset_drops_cached_index(temp_db, monkeypatch):
+    monkeypatch.setitem(resources._state, "model", HashingEncoder())
+    monkeypatch.setitem(resources._state, "profile_index", None)
+    first = resources.get_profile_index()
+    first.update()
+    db.delete_db_files()
+    resources.bootstrap_db(force=True)
+    assert resources.get_profile_index() is not first
@@ -0,0 +1,90 @@
+# Writer con group commit: lotti in una transazione, errori isolati per SAVEPOINT,
+# shutdown che completa le scritture in coda
+import sqlite3
+import threading
+
+import pytest
+
+import db
+
+
+def _insert(conn, name):
+    return conn.execute("INSERT INTO users (username, password, role) VALUES (?, 'x', 'paziente')", (name,)).lastrowid
+
+
+def _fail_after_insert(conn, name):
+    _insert(conn, name)
+    raise ValueError("scrittura rifiutata")
+
+
+def _users(prefix):
+    with db.connection() as conn:
+        return [r[0] for r in conn.execute("SELECT username FROM users WHERE username LIKE ? ORDER BY id", (prefix + "%",))]
+
+
+def _block(w):
+    # occupa il thread di scrittura finché l'evento non viene impostato: le scritture
+    # inviate nel frattempo restano in coda e formano il lotto successivo
+    started, release = threading.Event(), threading.Event()
+
+    def hold(conn):
+        started.set()
+        release.wait(10)
+
+    fut = w.submit(hold)
+    assert started.wait(10)
+    return release, fut
+
+
+def test_queued_writes_commit_as_one_batch(group_writer):
+    release, blocker = _block(group_writer)
+    futs = [group_writer.submit(_insert, f"gc_{i}") for i in range(20)]
+    release.set()
+    ids = [f.result(10) for f in futs]
+    blocker.result(10)
+    assert ids == sorted(ids) and len(set(ids)) == 20
+    assert _users("gc_") == [f"gc_{i}" for i in range(20)]
+    st = group_writer.stats()
+    assert (st["batches"], st["writes"], st["max_batch"], st["errors"]) == (2, 21, 20, 0)
+
+
+def test_failed_write_is_isolated_in_its_batch(group_writer):
+    release, _ = _block(group_writer)
+    ok1 = group_writer.submit(_insert, "iso_a")
+    bad = group_writer.submit(_fail_after_insert, "iso_bad")
+    dup = group_writer.submit(_insert, "iso_a")          # UNIQUE violato
+    ok2 = group_writer.submit(_insert, "iso_b")
+    release.set()
+    assert ok1.result(10) and ok2.result(10)
+    with pytest.raises(ValueError):
+        bad.result(10)
+    with pytest.raises(sqlite3.IntegrityError):
+        dup.result(10)
+    # la scrittura parziale di iso_bad è annullata, le altre del lotto restano
+    assert _users("iso_") == ["iso_a", "iso_b"]
+    assert group_writer.stats()["errors"] == 2
+    assert group_writer.batches == 2
+
+
+def test_shutdown_flushes_queued_writes(group_writer):
+    release, _ = _block(group_writer)
+    futs = [group_writer.submit(_insert, f"sd_{i}") for i in range(10)]
+    stopper = threading.Thread(target=group_writer.shutdown)
+    stopper.start()
+    release.set()
+    stopper.join(10)
+    assert not stopper.is_alive()
+    assert all(f.done() for f in futs)
+    assert _users("sd_") == [f"sd_{i}" for i in range(10)]
+    # dopo lo shutdown le scritture vanno dirette, nel thread chiamante
+    late = group_writer.submit(_insert, "sd_late")
+    assert late.done() and late.result()
+    assert group_writer._thread is None
+
+
+def test_write_inside_caller_transaction_runs_inline(group_writer):
+    with db.transaction() as conn:
+        fut = group_writer.submit(_insert, "inline")
+        assert fut.done()
+        assert conn.execute("SELECT count(*) FROM users WHERE username='inline'").fetchone()[0] == 1
+    assert group_writer._thread is None
@@ -0,0 +1,148 @@
+# --- INDICE VETTORIALE PROFILI ---
+# Bio e CV dei professionisti sono codificati una volta e salvati in pro_embeddings
+# come BLOB float32 (migrazione 7). I trigger su users mettono in coda i profili
+# nuovi o modificati; sync() codifica solo la coda, in un'unica chiamata batch.
+# In memoria teniamo una matrice contigua (una riga per profilo, normalizzata) con
+# città e qualifica accanto: la ricerca applica prima la maschera città/qualifica e
+# poi fa un solo prodotto matrice-vettore, top-k con argpartition.
+import threading
+
+import numpy as np
+
+import db
+from embeddings import l2_normalize
+
+PROFILE_BATCH = 256
+
+
+def profile_text(qualification, bio, detailed_experience) -> str:
+    return ". ".join(str(p) for p in (qualification, bio, detailed_experience) if p)
+
+
+def to_blob(vec) -> bytes:
+    return np.asarray(vec, dtype="<f4").tobytes()
+
+
+def from_blob(blob) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f4")
+
+
+class ProfileIndex:
+    def __init__(self, encoder, model_name: str):
+        self.encoder = encoder
+        self.model_name = model_name
+        self.db_path = db.db_path()
+        self._lock = threading.Lock()
+        self._seq = -1
+        self._n = 0
+        self._pos = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.cities = np.empty(0, dtype=object)
+        self.quals = np.empty(0, dtype=object)
+        self.alive = np.empty(0, dtype=bool)
+        self.mat = None
+
+    # --- scrittura (DB) ---
+    def sync(self):
+        # Codifica i profili in coda e li salva; ritorna quanti profili sono stati scritti
+        written = 0
+        with db.connection() as conn:
+            if self._seq < 0:
+                # embedding di un altro modello: vanno ricalcolati
+                with db.transaction():
+                    conn.execute("INSERT OR IGNORE INTO pro_embedding_queue SELECT user_id FROM pro_embeddings WHERE model != ?", (self.model_name,))
+            while True:
+                queued = [r[0] for r in conn.execute("SELECT user_id FROM pro_embedding_queue LIMIT ?", (PROFILE_BATCH,))]
+                if not queued:
+                    break
+                ph = ",".join("?" * len(queued))
+                rows = conn.execute(f"SELECT id, qualification, bio, detailed_experience FROM users WHERE role='professionista' AND id IN ({ph})", queued).fetchall()
+                vecs = l2_normalize(self.encoder.encode([profile_text(*r[1:]) for r in rows], convert_to_numpy=True)) if rows else []
+                live = {r[0] for r in rows}
+                with db.transaction():
+                    seq = conn.execute("UPDATE data_versions SET version=version+? WHERE name='pro_embeddings' RETURNING version", (len(queued),)).fetchone()[0]
+                    payload = [(r[0], self.model_name, int(v.shape[0]), to_blob(v), seq) for r, v in zip(rows, vecs)]
+                    payload += [(uid, self.model_name, None, None, seq) for uid in queued if uid not in live]
+                    conn.executemany("INSERT OR REPLACE INTO pro_embeddings (user_id, model, dim, vec, seq) VALUES (?,?,?,?,?)", payload)
+                    conn.executemany("DELETE FROM pro_embedding_queue WHERE user_id=?", [(uid,) for uid in queued])
+                written += len(queued)
+        return written
+
+    # --- lettura (memoria) ---
+    def _ensure_capacity(self, extra, dim):
+        need = self._n + extra
+        if self.mat is None:
+            cap = max(64, need)
+            self.mat = np.zeros((cap, dim), dtype=np.float32)
+            self.ids = np.zeros(cap, dtype=np.int64)
+            self.cities = np.empty(cap, dtype=object)
+            self.quals = np.empty(cap, dtype=object)
+            self.alive = np.zeros(cap, dtype=bool)
+        elif need > self.mat.shape[0]:
+            cap = max(need, self.mat.shape[0] * 2)
+            for name in ("mat", "ids", "cities", "quals", "alive"):
+                old = getattr(self, name)
+                new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype) if old.dtype != object else np.empty(cap, dtype=object)
+                new[:self._n] = old[:self._n]
+                setattr(self, name, new)
+
+    def refresh(self):
+        # Porta in memoria solo le righe scritte dopo l'ultimo refresh (seq > ultimo visto)
+        with db.connection() as conn:
+            rows = conn.execute("""SELECT e.user_id, e.vec, e.seq, u.city, u.qualification
+                                   FROM pro_embeddings e LEFT JOIN users u ON u.id = e.user_id
+                                   WHERE e.seq > ? AND e.model = ? ORDER BY e.seq""", (self._seq, self.model_name)).fetchall()
+        if not rows:
+            self._seq = max(self._seq, 0)
+            return 0
+        with self._lock:
+            dim = next((len(from_blob(r[1])) for r in rows if r[1] is not None), self.mat.shape[1] if self.mat is not None else 0)
+            if dim:
+                self._ensure_capacity(len(rows), dim)
+            for uid, blob, seq, city, qual in rows:
+                i = self._pos.get(uid)
+                if blob is None:
+                    if i is not None:
+                        self.alive[i] = False
+                    continue
+                if i is None:
+                    i = self._n
+                    self._n += 1
+                    self._pos[uid] = i
+                    self.ids[i] = uid
+                self.mat[i] = from_blob(blob)
+                self.cities[i] = city
+                self.quals[i] = qual
+                self.alive[i] = True
+            self._seq = max(self._seq, rows[-1][2])
+        return len(rows)
+
+    def update(self):
+        self.sync()
+        self.refresh()
+
+    def __len__(self):
+        return int(self.alive[:self._n].sum())
+
+    def search(self, query_vec, k=10, city=None, qualifications=None, ids=None):
+        # [(user_id, score)] ordinati per similarità coseno decrescente
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return []
+            mask = self.alive[:n].copy()
+            if city is not None:
+                mask &= self.cities[:n] == city
+            if qualifications:
+                mask &= np.isin(self.quals[:n], list(qualifications))
+            if ids is not None:
+                mask &= np.isin(self.ids[:n], np.asarray(list(ids), dtype=np.int64))
+            sel = np.flatnonzero(mask)
+            if sel.size == 0:
+                return []
+            scores = self.mat[sel] @ np.asarray(query_vec, dtype=np.float32)
+            ids_sel = self.ids[sel]
+        k = min(k, sel.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids_sel[i]), float(scores[i])) for i in top]
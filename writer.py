@@ -0,0 +1,174 @@
+# --- SCRITTURE CON GROUP COMMIT ---
+# SQLite ha un solo writer: con un commit per messaggio le sessioni concorrenti si
+# mettono in fila sul lock (o ricevono "database is locked"). Qui un unico thread
+# raccoglie le scritture di tutte le sessioni da una coda e le esegue a piccoli
+# lotti in una sola transazione BEGIN IMMEDIATE, attendendo al massimo MAX_DELAY_MS
+# dal primo elemento del lotto (le scritture arrivate durante un commit formano il lotto successivo). Ogni scrittura gira in un SAVEPOINT: un errore
+# annulla solo quella, non il lotto. Il chiamante riceve un Future che si completa
+# dopo il commit. CARECONNECT_GROUP_COMMIT=0 esegue le scritture nel thread chiamante.
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import db
+
+log = logging.getLogger("careconnect.writer")
+
+GROUP_COMMIT = os.environ.get("CARECONNECT_GROUP_COMMIT", "1") != "0"
+MAX_BATCH = int(os.environ.get("CARECONNECT_WRITE_BATCH", "128"))
+MAX_DELAY_MS = float(os.environ.get("CARECONNECT_WRITE_DELAY_MS", "3"))
+WRITE_TIMEOUT_S = 30
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    def __init__(self, max_batch=MAX_BATCH, max_delay_ms=MAX_DELAY_MS, enabled=GROUP_COMMIT):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+        self.errors = 0
+        self.max_batch_seen = 0
+        self._last_batch = 1
+        self.latencies = deque(maxlen=1000)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None and not self._closed:
+                    self._thread = threading.Thread(target=self._loop, name="careconnect-writer", daemon=True)
+                    self._thread.start()
+
+    # --- API ---
+    def submit(self, fn, *args) -> Future:
+        # fn(conn, *args) viene eseguita dentro la transazione del lotto; il Future
+        # riceve il valore di ritorno (o l'eccezione) dopo il commit
+        fut = Future()
+        if not self.enabled or self._closed or db.in_transaction() or threading.current_thread() is self._thread:
+            # chiamante già in transazione: passare dalla coda andrebbe in stallo sul lock
+            try:
+                with db.transaction() as conn:
+                    fut.set_result(fn(conn, *args))
+            except Exception as ex:
+                fut.set_exception(ex)
+            return fut
+        self._ensure_started()
+        self._queue.put((fn, args, fut, time.perf_counter()))
+        return fut
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result(timeout=WRITE_TIMEOUT_S)
+
+    # --- THREAD DI SCRITTURA ---
+    def _collect(self, first):
+        # prende tutto ciò che è già in coda; attende altri elementi (fino a max_delay)
+        # solo finché il lotto è più piccolo del precedente: con poche sessioni attive
+        # la scrittura parte subito, sotto carico i lotti restano pieni
+        batch = [first]
+        target = min(self.max_batch, max(1, self._last_batch))
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                left = deadline - time.perf_counter()
+                if left <= 0 or len(batch) >= target:
+                    break
+                try:
+                    item = self._queue.get(timeout=left)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _apply(self, batch):
+        results = []
+        try:
+            with db.transaction() as conn:
+                for fn, args, fut, _ in batch:
+                    if not fut.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT w")
+                    try:
+                        results.append((fut, True, fn(conn, *args)))
+                        conn.execute("RELEASE w")
+                    except Exception as ex:
+                        conn.execute("ROLLBACK TO w")
+                        conn.execute("RELEASE w")
+                        results.append((fut, False, ex))
+        except Exception as ex:
+            # commit fallito: nessuna scrittura del lotto è persistita
+            log.error("lotto di %d scritture fallito: %s", len(batch), ex)
+            self.errors += len(batch)
+            for _, _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(ex)
+            return
+        now = time.perf_counter()
+        for fut, ok, value in results:
+            if ok:
+                fut.set_result(value)
+            else:
+                self.errors += 1
+                fut.set_exception(value)
+        for *_, queued_at in batch:
+            self.latencies.append(now - queued_at)
+        self.batches += 1
+        self.writes += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self._last_batch = len(batch)
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            self._apply(self._collect(first))
+
+    def shutdown(self):
+        # smette di accettare lavoro in coda (le nuove scritture vanno dirette),
+        # completa quanto già accodato e ferma il thread
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._apply(leftover)
+
+    def stats(self):
+        out = {"enabled": self.enabled, "queued": self._queue.qsize(), "batches": self.batches, "writes": self.writes,
+               "errors": self.errors, "max_batch": self.max_batch_seen,
+               "avg_batch": round(self.writes / self.batches, 1) if self.batches else 0}
+        vals = sorted(self.latencies)
+        if vals:
+            out["p50_ms"] = round(vals[len(vals) // 2] * 1000, 2)
+            out["p95_ms"] = round(vals[min(len(vals) - 1, int(len(vals) * 0.95))] * 1000, 2)
+        return out
+
+
+writer = GroupCommitWriter()
+atexit.register(writer.shutdown)